@@ -0,0 +1,127 @@
+import os
+import sys
+import time
+from collections import defaultdict
+
+import boto3
+from botocore.exceptions import ClientError
+
+os.environ.setdefault("ARCHIVE_RETENTION_DAYS", "90")  # as in template.yaml
+
+sys.path.insert(0, "lambda")
+from archive_store import FEIN_ATTRIBUTES, STATUS_KIND, TRANSFERS_KIND, open_archive, write_records  # noqa: E402
+from lifecycle import EXPIRES_AT, TERMINAL_STATUSES, TERMINAL_TRANSFER_STATES, expires_at  # noqa: E402
+from status_history import transfer_id  # noqa: E402
+from status_shards import from_storage  # noqa: E402
+
+# Lifecycle sweep over Transfers and Status (see lambda/lifecycle.py).
+#
+# 1. Stamps expiresAt on records that are finished but have no TTL: terminal
+#    records written before TTLs existed, transfers whose carrier statuses are
+#    all terminal, and the leftover statuses of canceled transfers.
+# 2. Archives, then deletes, records whose expiresAt has passed. DynamoDB TTL
+#    normally gets there first (archive_expired.py archives those deletes),
+#    but it can lag by days and local stand-ins never expire anything.
+#
+# Writes to ARCHIVE_BUCKET (S3_ENDPOINT_URL for a local S3) or ARCHIVE_DIR:
+#   ARCHIVE_DIR=./archive DYNAMODB_ENDPOINT_URL=http://localhost:8000 python3 archive_sweep.py
+
+dynamodb = boto3.resource(
+    "dynamodb", region_name="us-east-1", endpoint_url=os.environ.get("DYNAMODB_ENDPOINT_URL") or None
+)
+transfers_table = dynamodb.Table("Transfers")
+status_table = dynamodb.Table("Status")
+
+store = open_archive(os.environ.get("ARCHIVE_BUCKET"), os.environ.get("ARCHIVE_DIR"))
+if store is None:
+    sys.exit("Set ARCHIVE_BUCKET or ARCHIVE_DIR")
+
+KEYS = {TRANSFERS_KIND: ["id"], STATUS_KIND: ["receivingFein", "statusKey"]}
+
+
+def scan(table):
+    scan_kwargs = {}
+    while True:
+        result = table.scan(**scan_kwargs)
+        yield from result.get("Items", [])
+        if "LastEvaluatedKey" not in result:
+            return
+        scan_kwargs["ExclusiveStartKey"] = result["LastEvaluatedKey"]
+
+
+def stamp(table, kind, item, expiry):
+    table.update_item(
+        Key={k: item[k] for k in KEYS[kind]},
+        UpdateExpression="SET expiresAt = :e",
+        ConditionExpression="attribute_exists(#k) AND attribute_not_exists(expiresAt)",
+        ExpressionAttributeNames={"#k": KEYS[kind][0]},
+        ExpressionAttributeValues={":e": expiry},
+    )
+
+
+def retire(table, kind, items):
+    """Archive expired items (one object per FEIN), then delete them unless they changed since."""
+    by_fein = defaultdict(list)
+    for item in items:
+        record = from_storage(item) if kind == STATUS_KIND else item
+        by_fein[record.get(FEIN_ATTRIBUTES[kind], "unknown")].append(record)
+    for fein, fein_items in by_fein.items():
+        write_records(store, kind, fein, fein_items)
+
+    deleted = 0
+    for item in items:
+        try:
+            table.delete_item(
+                Key={k: item[k] for k in KEYS[kind]},
+                ConditionExpression="expiresAt = :e",
+                ExpressionAttributeValues={":e": item[EXPIRES_AT]},
+            )
+            deleted += 1
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                raise
+    return deleted
+
+
+now = int(time.time())
+expiry = expires_at()
+
+statuses = list(scan(status_table))
+transfers = list(scan(transfers_table))
+
+statuses_by_transfer = defaultdict(list)
+for item in statuses:
+    fein = from_storage(item)["receivingFein"]
+    statuses_by_transfer[transfer_id(fein, item["releasingFein"], item["npn"])].append(item)
+
+to_stamp = {TRANSFERS_KIND: [], STATUS_KIND: []}
+for item in transfers:
+    carrier_statuses = statuses_by_transfer.get(item["id"], [])
+    if item.get("state") in TERMINAL_TRANSFER_STATES:
+        to_stamp[STATUS_KIND].extend(s for s in carrier_statuses if EXPIRES_AT not in s)
+    if EXPIRES_AT in item:
+        continue
+    if item.get("state") in TERMINAL_TRANSFER_STATES or (
+        carrier_statuses and all(s.get("status") in TERMINAL_STATUSES for s in carrier_statuses)
+    ):
+        to_stamp[TRANSFERS_KIND].append(item)
+for item in statuses:
+    if EXPIRES_AT not in item and item.get("status") in TERMINAL_STATUSES:
+        to_stamp[STATUS_KIND].append(item)
+
+for kind, table in ((TRANSFERS_KIND, transfers_table), (STATUS_KIND, status_table)):
+    if expiry is None:
+        break  # ARCHIVE_RETENTION_DAYS=0: nothing expires
+    stamped = {tuple(item[k] for k in KEYS[kind]): item for item in to_stamp[kind]}
+    for item in stamped.values():
+        try:
+            stamp(table, kind, item, expiry)
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                raise
+    print(f"{table.name}: stamped expiresAt on {len(stamped)} items")
+
+for kind, table, items in ((TRANSFERS_KIND, transfers_table, transfers), (STATUS_KIND, status_table, statuses)):
+    expired = [item for item in items if EXPIRES_AT in item and int(item[EXPIRES_AT]) <= now]
+    deleted = retire(table, kind, expired) if expired else 0
+    print(f"{table.name}: archived {len(expired)} expired items, deleted {deleted}")
@@ -0,0 +1,32 @@
+import sys
+
+import boto3
+
+sys.path.insert(0, "lambda")
+from contract_search import search_attributes  # noqa: E402
+
+# Adds searchKey / contractValueAmount to contracts loaded before
+# GET /ats/v1/contracts existed, so they show up in the search indexes.
+
+dynamodb = boto3.resource("dynamodb", region_name="us-east-1")
+table = dynamodb.Table("Contracts")
+
+updated = 0
+scan_kwargs = {}
+while True:
+    result = table.scan(**scan_kwargs)
+    for item in result.get("Items", []):
+        attributes = search_attributes(item)
+        if all(item.get(k) == v for k, v in attributes.items()):
+            continue
+        table.update_item(
+            Key={"id": item["id"]},
+            UpdateExpression="SET searchKey = :k, contractValueAmount = :v",
+            ExpressionAttributeValues={":k": attributes["searchKey"], ":v": attributes["contractValueAmount"]},
+        )
+        updated += 1
+    if "LastEvaluatedKey" not in result:
+        break
+    scan_kwargs["ExclusiveStartKey"] = result["LastEvaluatedKey"]
+
+print(f"Contracts: backfilled {updated} items")
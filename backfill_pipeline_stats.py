@@ -0,0 +1,59 @@
+import os
+import sys
+
+import boto3
+from botocore.exceptions import ClientError
+
+os.environ.setdefault("PIPELINE_STATS_TABLE", "PipelineStats")
+sys.path.insert(0, "lambda")
+from pipeline_stats import COUNTED_ATTRIBUTE, backfill_update  # noqa: E402
+from status_shards import from_storage  # noqa: E402
+
+# Counts the Status items written before the pipeline counters existed (or
+# while PIPELINE_STATS_TABLE was unset) into PipelineStats, so
+# GET /ats/v1/status/{fein}/summary covers every status and a later change
+# never takes its -1 from a status that was never counted.
+#
+# Each item is marked statsCounted and counted in one transaction, conditional
+# on it still being uncounted and unchanged; an item a live write changes
+# first is counted by that write instead. Safe to run again.
+
+dynamodb = boto3.resource("dynamodb", region_name="us-east-1")
+table = dynamodb.Table("Status")
+client = dynamodb.meta.client
+
+counted = 0
+skipped = 0
+scan_kwargs = {"FilterExpression": f"attribute_not_exists({COUNTED_ATTRIBUTE})"}
+while True:
+    result = table.scan(**scan_kwargs)
+    for stored in result.get("Items", []):
+        condition = {
+            "ConditionExpression": f"attribute_not_exists({COUNTED_ATTRIBUTE}) AND #status = :status",
+            "ExpressionAttributeNames": {"#status": "status"},
+            "ExpressionAttributeValues": {":status": stored["status"], ":counted": True},
+        }
+        try:
+            client.transact_write_items(
+                TransactItems=[
+                    {
+                        "Update": {
+                            "TableName": table.name,
+                            "Key": {"receivingFein": stored["receivingFein"], "statusKey": stored["statusKey"]},
+                            "UpdateExpression": f"SET {COUNTED_ATTRIBUTE} = :counted",
+                            **condition,
+                        }
+                    },
+                    backfill_update(from_storage(stored)),
+                ]
+            )
+            counted += 1
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") != "TransactionCanceledException":
+                raise
+            skipped += 1
+    if "LastEvaluatedKey" not in result:
+        break
+    scan_kwargs["ExclusiveStartKey"] = result["LastEvaluatedKey"]
+
+print(f"Status: counted {counted} items, {skipped} changed meanwhile and were left to their writers")
@@ -6,6 +6,13 @@ TABLES = [
     {"name": "Transfers", "keys": ["id"]},
     {"name": "Contracts", "keys": ["id"]},
     {"name": "Status", "keys": ["receivingFein", "statusKey"]},
+    {"name": "StatusHistory", "keys": ["transferId", "changeKey"]},
+    {"name": "PipelineStats", "keys": ["fein", "statKey"]},
+    {"name": "ContractAggregates", "keys": ["fein", "aggKey"]},
+    {"name": "ChangeFeed", "keys": ["feedKey", "cursor"]},
+    {"name": "FeinVersions", "keys": ["versionKey"]},
+    {"name": "CarrierHealth", "keys": ["carrierId"]},
+    {"name": "RateLimits", "keys": ["bucketKey"]},
 ]
 
 
@@ -0,0 +1,84 @@
+import json
+import sys
+
+import yaml
+
+# Regenerates lambda/request_schemas.json, the request-body schemas the
+# handlers validate against (lambda/request_validation.py), from the API specs:
+#   python3 generate_request_schemas.py          # rewrite the file
+#   python3 generate_request_schemas.py --check  # exit 1 if it is stale
+#
+# /ats/v1/* request bodies come from Documentation/hub_api.yaml; the agent
+# routes (/ats/agents/*) from openapi_agent_api.yaml. Each schema is keyed by
+# its component name, with $refs inlined and OpenAPI-only keywords turned into
+# plain JSON Schema (nullable -> a "null" type; descriptions and examples
+# dropped), so fastjsonschema can compile it without the specs at runtime.
+
+SPECS = [
+    ("Documentation/hub_api.yaml", "/ats/v1/"),
+    ("openapi_agent_api.yaml", "/ats/agents/"),
+]
+OUTPUT = "lambda/request_schemas.json"
+
+DROPPED = {"description", "example", "examples", "readOnly", "writeOnly", "deprecated", "xml", "externalDocs"}
+# Formats fastjsonschema checks; the rest (double, int64, ...) are annotations
+FORMATS = {"date", "date-time", "email", "hostname", "ipv4", "ipv6", "uri", "regex"}
+
+
+def resolve(node, components, seen=()):
+    if isinstance(node, list):
+        return [resolve(value, components, seen) for value in node]
+    if not isinstance(node, dict):
+        return node
+    if "$ref" in node:
+        name = node["$ref"].rsplit("/", 1)[-1]
+        if name in seen:
+            sys.exit(f"Recursive schema {name} cannot be inlined")
+        return resolve(components[name], components, seen + (name,))
+
+    schema = {}
+    for key, value in node.items():
+        if key in DROPPED or key == "nullable":
+            continue
+        if key == "format" and value not in FORMATS:
+            continue
+        if key == "properties":
+            schema[key] = {name: resolve(prop, components, seen) for name, prop in value.items()}
+        else:
+            schema[key] = resolve(value, components, seen)
+    if node.get("nullable") and "type" in schema:
+        schema["type"] = [schema["type"], "null"]
+    return schema
+
+
+def request_schemas():
+    schemas = {}
+    for path, prefix in SPECS:
+        with open(path) as f:
+            spec = yaml.safe_load(f)
+        components = spec.get("components", {}).get("schemas", {})
+        for route, operations in spec["paths"].items():
+            if not route.startswith(prefix):
+                continue
+            for operation in operations.values():
+                if not isinstance(operation, dict) or "requestBody" not in operation:
+                    continue
+                ref = operation["requestBody"]["content"]["application/json"]["schema"]["$ref"]
+                name = ref.rsplit("/", 1)[-1]
+                schema = resolve(components[name], components, (name,))
+                if schemas.get(name, schema) != schema:
+                    sys.exit(f"{name} is defined differently in {path}")
+                schemas[name] = schema
+    return dict(sorted(schemas.items()))
+
+
+generated = json.dumps(request_schemas(), indent=2, sort_keys=True) + "\n"
+if "--check" in sys.argv[1:]:
+    with open(OUTPUT) as f:
+        if f.read() != generated:
+            sys.exit(f"{OUTPUT} is out of date; run python3 generate_request_schemas.py")
+    print(f"{OUTPUT} is up to date")
+else:
+    with open(OUTPUT, "w") as f:
+        f.write(generated)
+    print(f"Wrote {OUTPUT}")
@@ -0,0 +1,179 @@
+import json
+import logging
+import math
+import os
+import threading
+import time
+
+from botocore.exceptions import ClientError
+
+from api_responses import error_response
+from aws_clients import lazy_table, sqs_client
+from emf_metrics import put_metrics
+from transfer_state import conflict_item, is_condition_failure
+
+# Per-tenant admission control for the write paths that fan out to carriers.
+#
+# Every receiving IMO (FEIN) and every carrier has a token bucket: `rate`
+# requests per second on average, up to `burst` at once. One IMO running a bulk
+# move drains its own bucket and gets 429s with Retry-After, while every other
+# IMO keeps its full allowance; carrier buckets keep the sum of all tenants
+# under what each carrier API accepts.
+#
+# Limits are JSON maps from FEIN / carrier id to {"rate", "burst"}, with "*"
+# as the default for keys not listed; an empty map admits everything:
+#   FEIN_RATE_LIMITS={"*": {"rate": 10, "burst": 100}, "99-7654321": {"rate": 50, "burst": 500}}
+#   CARRIER_RATE_LIMITS={"allianz": {"rate": 20, "burst": 40}}
+#
+# With RATE_LIMIT_TABLE set the buckets are shared by every container. Each
+# bucket is one item holding its "theoretical arrival time" (GCRA, the
+# token-bucket algorithm in counter form):
+#   bucketKey=fein#99-7654321  tat=1767225600123  expiresAt=1767229200
+# Admitting n requests adds n x (1000 / rate) ms to tat in a single conditional
+# UpdateItem, allowed while tat stays within burst x (1000 / rate) ms of now;
+# the distance beyond that is the Retry-After. Without the table, or when
+# DynamoDB fails, each container keeps its own buckets in memory.
+#
+# Work that can happen later (a release's carrier forwards) is not refused:
+# with DEFERRED_QUEUE_URL set, defer() puts it on an SQS queue, delayed by its
+# Retry-After, for release_deferred.py to pick up.
+
+logger = logging.getLogger()
+
+FEIN_SCOPE = "fein"
+CARRIER_SCOPE = "carrier"
+
+LIMITS = {
+    FEIN_SCOPE: json.loads(os.environ.get("FEIN_RATE_LIMITS") or "{}"),
+    CARRIER_SCOPE: json.loads(os.environ.get("CARRIER_RATE_LIMITS") or "{}"),
+}
+
+MAX_UPDATE_ATTEMPTS = 3
+# Idle buckets are full again after burst / rate seconds; TTL removes them later
+BUCKET_TTL_SECONDS = 60 * 60
+
+rate_limit_table = lazy_table(os.environ.get("RATE_LIMIT_TABLE"))
+DEFERRED_QUEUE_URL = os.environ.get("DEFERRED_QUEUE_URL") or None
+MAX_DELAY_SECONDS = 900  # SQS DelaySeconds limit
+
+_local_tats = {}
+_local_lock = threading.Lock()
+
+
+def limit_for(scope, key):
+    """(rate per second, burst) for a FEIN or carrier, or None when it is not limited."""
+    limits = LIMITS[scope]
+    limit = limits.get(key, limits.get("*"))
+    if not limit:
+        return None
+    return float(limit["rate"]), max(1, int(limit["burst"]))
+
+
+def _admit_local(bucket_key, now_ms, increment_ms, capacity_ms):
+    with _local_lock:
+        tat = max(_local_tats.get(bucket_key, now_ms), now_ms)
+        if tat + increment_ms - now_ms > capacity_ms:
+            return tat + increment_ms - now_ms - capacity_ms
+        _local_tats[bucket_key] = tat + increment_ms
+        return 0
+
+
+def _admit_shared(bucket_key, now_ms, increment_ms, capacity_ms):
+    expires_at = now_ms // 1000 + BUCKET_TTL_SECONDS
+    for _ in range(MAX_UPDATE_ATTEMPTS):
+        try:
+            # Busy bucket: take the tokens if there is room
+            rate_limit_table.update_item(
+                Key={"bucketKey": bucket_key},
+                UpdateExpression="SET tat = tat + :increment, expiresAt = :expiresAt",
+                ConditionExpression="tat BETWEEN :now AND :latest",
+                ExpressionAttributeValues={
+                    ":increment": increment_ms,
+                    ":expiresAt": expires_at,
+                    ":now": now_ms,
+                    ":latest": now_ms + capacity_ms - increment_ms,
+                },
+                ReturnValuesOnConditionCheckFailure="ALL_OLD",
+            )
+            return 0
+        except ClientError as e:
+            if not is_condition_failure(e):
+                raise
+            current = conflict_item(e)
+        if current is None:
+            current = rate_limit_table.get_item(Key={"bucketKey": bucket_key}, ConsistentRead=True).get("Item")
+        if current is not None and int(current["tat"]) >= now_ms:
+            return int(current["tat"]) + increment_ms - now_ms - capacity_ms
+
+        try:
+            # New or idle bucket (tat in the past): it is full, start from now
+            rate_limit_table.update_item(
+                Key={"bucketKey": bucket_key},
+                UpdateExpression="SET tat = :tat, expiresAt = :expiresAt",
+                ConditionExpression="attribute_not_exists(tat) OR tat < :now",
+                ExpressionAttributeValues={":tat": now_ms + increment_ms, ":expiresAt": expires_at, ":now": now_ms},
+            )
+            return 0
+        except ClientError as e:
+            if not is_condition_failure(e):
+                raise
+            # Another request started the bucket first; take from it instead
+    return increment_ms
+
+
+def admit(scope, key, cost=1):
+    """
+    Take `cost` tokens from the bucket of a FEIN or carrier. Returns 0 when
+    admitted, otherwise the seconds until the request would be.
+
+    A cost above the burst is charged as the burst, so it fits a full bucket.
+    """
+    limit = limit_for(scope, key)
+    if limit is None:
+        return 0
+    rate, burst = limit
+    interval_ms = 1000.0 / rate
+    increment_ms = math.ceil(min(cost, burst) * interval_ms)
+    capacity_ms = math.ceil(burst * interval_ms)
+    bucket_key = f"{scope}#{key}"
+    now_ms = int(time.time() * 1000)
+
+    wait_ms = None
+    if rate_limit_table is not None:
+        try:
+            wait_ms = _admit_shared(bucket_key, now_ms, increment_ms, capacity_ms)
+        except Exception as e:
+            logger.warning("Rate limit table unavailable bucket=%s, using local bucket: %s", bucket_key, e)
+    if wait_ms is None:
+        wait_ms = _admit_local(bucket_key, now_ms, increment_ms, capacity_ms)
+
+    if wait_ms > 0:
+        logger.info("Throttled bucket=%s cost=%s retryAfterMs=%d", bucket_key, cost, wait_ms)
+        put_metrics({"AdmissionThrottled": (1, "Count")})
+        return wait_ms / 1000
+    return 0
+
+
+def retry_after_header(seconds):
+    return {"Retry-After": str(max(1, math.ceil(seconds)))}
+
+
+def throttled_response(scope, key, retry_after):
+    return error_response(
+        429,
+        "RATE_LIMITED",
+        f"too many requests for {scope} {key}; retry after {max(1, math.ceil(retry_after))}s",
+        headers=retry_after_header(retry_after),
+    )
+
+
+def defer(message, retry_after):
+    """Queue deferrable work to run after retry_after seconds. False when there is no queue."""
+    if DEFERRED_QUEUE_URL is None:
+        return False
+    sqs_client().send_message(
+        QueueUrl=DEFERRED_QUEUE_URL,
+        MessageBody=json.dumps(message),
+        DelaySeconds=min(MAX_DELAY_SECONDS, math.ceil(retry_after)),
+    )
+    return True
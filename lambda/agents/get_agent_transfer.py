@@ -1,49 +1,34 @@
-import json
-
 try:
     from .data import get_agent_by_npn
 except ImportError:
     from data import get_agent_by_npn
 
-
-CORS_HEADERS = {
-    "Content-Type": "application/json",
-    "Access-Control-Allow-Origin": "*",
-    "Access-Control-Allow-Headers": "Content-Type,Idempotency-Key",
-}
+from api_responses import error_response, json_response
+from coldstart import measure_cold_start
+from emf_metrics import emit_metrics
+from tracing import traced
 
 
+@measure_cold_start
+@traced
+@emit_metrics
 def lambda_handler(event, context):
     path_parameters = event.get("pathParameters") or {}
     agent_npn = path_parameters.get("npn") or path_parameters.get("id")
     if not agent_npn:
-        return {
-            "statusCode": 400,
-            "headers": CORS_HEADERS,
-            "body": json.dumps(
-                {
-                    "error": {
-                        "code": "MISSING_AGENT_NPN",
-                        "message": "Path parameter 'npn' (or legacy 'id') is required.",
-                    }
-                }
-            ),
-        }
+        return error_response(
+            400,
+            "MISSING_AGENT_NPN",
+            "Path parameter 'npn' (or legacy 'id') is required.",
+        )
 
     agent = get_agent_by_npn(agent_npn)
     if not agent:
-        return {
-            "statusCode": 404,
-            "headers": CORS_HEADERS,
-            "body": json.dumps(
-                {
-                    "error": {
-                        "code": "AGENT_NOT_FOUND",
-                        "message": f"Agent with NPN '{agent_npn}' was not found.",
-                    }
-                }
-            ),
-        }
+        return error_response(
+            404,
+            "AGENT_NOT_FOUND",
+            f"Agent with NPN '{agent_npn}' was not found.",
+        )
 
     payload = {
         "agent": {
@@ -79,8 +64,4 @@ def lambda_handler(event, context):
         },
     }
 
-    return {
-        "statusCode": 200,
-        "headers": CORS_HEADERS,
-        "body": json.dumps(payload),
-    }
+    return json_response(200, payload, event=event)
@@ -1,18 +1,17 @@
-import json
-
 try:
     from .data import list_agents
 except ImportError:
     from data import list_agents
 
-
-CORS_HEADERS = {
-    "Content-Type": "application/json",
-    "Access-Control-Allow-Origin": "*",
-    "Access-Control-Allow-Headers": "Content-Type,Idempotency-Key",
-}
+from api_responses import json_response
+from coldstart import measure_cold_start
+from emf_metrics import emit_metrics
+from tracing import traced
 
 
+@measure_cold_start
+@traced
+@emit_metrics
 def lambda_handler(event, context):
     query_params = event.get("queryStringParameters") or {}
     receiving_imo_fein = query_params.get("receivingImoFein")
@@ -38,8 +37,4 @@ def lambda_handler(event, context):
         for agent in agents
     ]
 
-    return {
-        "statusCode": 200,
-        "headers": CORS_HEADERS,
-        "body": json.dumps(response_payload),
-    }
+    return json_response(200, response_payload, event=event)
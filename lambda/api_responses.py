@@ -0,0 +1,141 @@
+import base64
+import gzip
+import json
+import os
+from decimal import Decimal
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional codec
+    brotli = None
+
+# Shared API Gateway proxy response helpers for every handler in lambda/.
+#
+# Bodies are serialized with orjson when it is installed (json otherwise) and
+# DynamoDB's Decimal / set values are converted on the way out.
+#
+# Deployed, API Gateway compresses responses itself (AtsApi's
+# MinimumCompressionSize). Where nothing in front does, COMPRESS_RESPONSES=1
+# makes the handlers br/gzip-encode responses larger than MIN_COMPRESS_BYTES
+# when the client's Accept-Encoding allows it, returned base64-encoded
+# (isBase64Encoded); lambda/local_api.py turns it on.
+
+CORS_HEADERS = {
+    "Access-Control-Allow-Origin": "*",
+    "Access-Control-Allow-Headers": "Content-Type,Idempotency-Key",
+}
+
+JSON_HEADERS = {
+    "Content-Type": "application/json",
+    **CORS_HEADERS,
+}
+
+COMPRESS_RESPONSES = os.environ.get("COMPRESS_RESPONSES") == "1"
+MIN_COMPRESS_BYTES = int(os.environ.get("MIN_COMPRESS_BYTES", 1024))
+GZIP_LEVEL = 5
+BROTLI_QUALITY = 5
+
+
+def _default(value):
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, (set, frozenset)):
+        return sorted(value) if all(isinstance(v, str) for v in value) else list(value)
+    if isinstance(value, (bytes, bytearray)):
+        return base64.b64encode(value).decode("ascii")
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+if orjson is not None:
+
+    def dumps_bytes(payload):
+        return orjson.dumps(payload, default=_default)
+
+else:
+
+    def dumps_bytes(payload):
+        return json.dumps(payload, default=_default, separators=(",", ":")).encode("utf-8")
+
+
+def dumps(payload):
+    return dumps_bytes(payload).decode("utf-8")
+
+
+def request_header(event, name):
+    # API Gateway keeps the client's header casing
+    name = name.lower()
+    for key, value in (event.get("headers") or {}).items():
+        if key.lower() == name:
+            return value
+    return None
+
+
+def parse_body(event):
+    raw = event.get("body")
+    if not raw:
+        return {}
+    if event.get("isBase64Encoded"):
+        raw = base64.b64decode(raw)
+    return json.loads(raw)
+
+
+def _accepted_encodings(event):
+    header = request_header(event, "Accept-Encoding") or ""
+    accepted = set()
+    for part in header.split(","):
+        coding, _, params = part.partition(";")
+        params = params.replace(" ", "")
+        try:
+            quality = float(params[2:]) if params.startswith("q=") else 1.0
+        except ValueError:
+            quality = 1.0
+        if coding.strip() and quality > 0:
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+def _encode(event, data):
+    if not COMPRESS_RESPONSES or event is None or len(data) < MIN_COMPRESS_BYTES:
+        return None, data
+    accepted = _accepted_encodings(event)
+    if brotli is not None and ("br" in accepted or "*" in accepted):
+        return "br", brotli.compress(data, quality=BROTLI_QUALITY)
+    if "gzip" in accepted or "*" in accepted:
+        return "gzip", gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+    return None, data
+
+
+def respond(status_code, body, event=None, headers=None):
+    """Build a proxy response from an already-serialized str/bytes body."""
+    response_headers = {**JSON_HEADERS, **(headers or {})}
+    data = body.encode("utf-8") if isinstance(body, str) else (body or b"")
+
+    encoding, data = _encode(event, data)
+    if encoding is None:
+        return {
+            "statusCode": status_code,
+            "headers": response_headers,
+            "body": data.decode("utf-8"),
+        }
+
+    response_headers["Content-Encoding"] = encoding
+    response_headers["Vary"] = "Accept-Encoding"
+    return {
+        "statusCode": status_code,
+        "headers": response_headers,
+        "body": base64.b64encode(data).decode("ascii"),
+        "isBase64Encoded": True,
+    }
+
+
+def json_response(status_code, payload, event=None, headers=None):
+    return respond(status_code, dumps_bytes(payload), event=event, headers=headers)
+
+
+def error_response(status_code, code, message, event=None, headers=None):
+    return json_response(status_code, {"error": {"code": code, "message": message}}, event=event, headers=headers)
@@ -0,0 +1,79 @@
+import logging
+import os
+from collections import defaultdict
+
+from boto3.dynamodb.types import TypeDeserializer
+
+from archive_store import FEIN_ATTRIBUTES, STATUS_KIND, TRANSFERS_KIND, open_archive, write_records
+from coldstart import measure_cold_start
+from emf_metrics import emit_metrics, put_metrics, timed_step
+from status_shards import from_storage
+
+# DynamoDB Streams consumer for the Transfers and Status tables: every item
+# that DynamoDB's TTL deletes (see lifecycle.py) is written to the archive
+# before it is gone for good. The event source mapping only delivers TTL
+# deletions (FilterCriteria on userIdentity); the check below keeps the
+# handler correct without it. Each stream batch becomes one archive object
+# per record kind and receiving FEIN.
+#
+# A failed archive write raises, so the batch is retried from the stream
+# rather than dropped.
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+store = open_archive(os.environ.get("ARCHIVE_BUCKET"), os.environ.get("ARCHIVE_DIR"))
+
+TABLE_KINDS = {
+    os.environ.get("TRANSFERS_TABLE", "Transfers"): TRANSFERS_KIND,
+    os.environ.get("STATUS_TABLE", "Status"): STATUS_KIND,
+}
+
+_deserializer = TypeDeserializer()
+
+
+def is_ttl_removal(record):
+    identity = record.get("userIdentity") or {}
+    return (
+        record.get("eventName") == "REMOVE"
+        and identity.get("type") == "Service"
+        and identity.get("principalId") == "dynamodb.amazonaws.com"
+    )
+
+
+def _table_name(record):
+    # arn:aws:dynamodb:us-east-1:123456789012:table/Status/stream/2026-01-01T00:00:00.000
+    return record.get("eventSourceARN", "").split(":table/", 1)[-1].split("/", 1)[0]
+
+
+@measure_cold_start
+@emit_metrics
+def lambda_handler(event, context):
+    batches = defaultdict(list)  # (kind, fein) -> records
+    for record in event.get("Records", []):
+        if not is_ttl_removal(record):
+            continue
+        kind = TABLE_KINDS.get(_table_name(record))
+        old_image = record.get("dynamodb", {}).get("OldImage")
+        if kind is None or not old_image:
+            logger.warning("Skipping stream record eventID=%s", record.get("eventID"))
+            continue
+        item = {k: _deserializer.deserialize(v) for k, v in old_image.items()}
+        if kind == STATUS_KIND:
+            item = from_storage(item)
+        batches[(kind, item.get(FEIN_ATTRIBUTES[kind], "unknown"))].append(item)
+
+    if not batches:
+        return {"archived": 0}
+    if store is None:
+        raise RuntimeError("ARCHIVE_BUCKET or ARCHIVE_DIR must be set to archive expired records")
+
+    archived = 0
+    with timed_step("archive_put"):
+        for (kind, fein), items in batches.items():
+            key = write_records(store, kind, fein, items)
+            logger.info("Archived %d %s records fein=%s key=%s", len(items), kind, fein, key)
+            archived += len(items)
+
+    put_metrics({"ArchivedRecords": (archived, "Count")})
+    return {"archived": archived}
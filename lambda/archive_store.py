@@ -0,0 +1,157 @@
+import base64
+import gzip
+import json
+import uuid
+from datetime import date, datetime, timezone
+from pathlib import Path
+
+from api_responses import dumps_bytes
+from aws_clients import s3_client
+
+# Compressed archive of the transfers and statuses that lifecycle.py retires
+# from the hot tables.
+#
+# Records are stored as gzip JSON Lines objects, one per archiving batch,
+# record kind and receiving FEIN, under the day they were archived:
+#   status/99-7654321/2026-10-19/120512Z-1a2b3c4d.jsonl.gz
+#   transfers/99-7654321/2026-10-19/120512Z-5e6f7a8b.jsonl.gz
+# Key order is time order, so one FEIN's archive for a date range is a single
+# prefix listing that starts at the first day, and a page token is just the
+# object key and the line to resume from.
+#
+# ARCHIVE_BUCKET keeps the archive in S3 (S3_ENDPOINT_URL points at a local
+# stand-in such as moto_server or MinIO); ARCHIVE_DIR keeps the same layout in
+# a local directory.
+
+STATUS_KIND = "status"
+TRANSFERS_KIND = "transfers"
+KINDS = (STATUS_KIND, TRANSFERS_KIND)
+
+# Attribute holding the receiving FEIN, per kind
+FEIN_ATTRIBUTES = {STATUS_KIND: "receivingFein", TRANSFERS_KIND: "receivingImoFein"}
+
+_SUFFIX = ".jsonl.gz"
+
+
+class LocalArchive:
+    def __init__(self, root):
+        self.root = Path(root)
+
+    def put(self, key, data):
+        path = self.root / key
+        path.parent.mkdir(parents=True, exist_ok=True)
+        partial = path.with_name(path.name + ".partial")
+        partial.write_bytes(data)
+        partial.replace(path)
+
+    def keys(self, prefix, start_after=""):
+        base = self.root / prefix
+        if not base.is_dir():
+            return
+        for path in sorted(base.rglob(f"*{_SUFFIX}")):
+            key = path.relative_to(self.root).as_posix()
+            if key > start_after:
+                yield key
+
+    def get(self, key):
+        return (self.root / key).read_bytes()
+
+
+class S3Archive:
+    def __init__(self, bucket):
+        self.bucket = bucket
+
+    def put(self, key, data):
+        s3_client().put_object(Bucket=self.bucket, Key=key, Body=data, ContentType="application/x-ndjson")
+
+    def keys(self, prefix, start_after=""):
+        paginator = s3_client().get_paginator("list_objects_v2")
+        kwargs = {"Bucket": self.bucket, "Prefix": prefix}
+        if start_after:
+            kwargs["StartAfter"] = start_after
+        for page in paginator.paginate(**kwargs):
+            for entry in page.get("Contents", []):
+                yield entry["Key"]
+
+    def get(self, key):
+        return s3_client().get_object(Bucket=self.bucket, Key=key)["Body"].read()
+
+
+def open_archive(bucket=None, directory=None):
+    if bucket:
+        return S3Archive(bucket)
+    if directory:
+        return LocalArchive(directory)
+    return None
+
+
+def encode_records(records):
+    return gzip.compress(b"".join(dumps_bytes(record) + b"\n" for record in records))
+
+
+def decode_records(data):
+    return [json.loads(line) for line in gzip.decompress(data).splitlines() if line]
+
+
+def write_records(store, kind, fein, records, archived_at=None):
+    """Writes one archive object; returns its key."""
+    archived_at = archived_at or datetime.now(timezone.utc)
+    stamp = archived_at.isoformat(timespec="milliseconds").replace("+00:00", "Z")
+    key = (
+        f"{kind}/{fein}/{archived_at.date().isoformat()}/"
+        f"{archived_at.strftime('%H%M%S')}Z-{uuid.uuid4().hex[:8]}{_SUFFIX}"
+    )
+    store.put(key, encode_records({**record, "archivedAt": stamp} for record in records))
+    return key
+
+
+class InvalidToken(ValueError):
+    """Raised for a page token this module did not issue for the archive being read."""
+
+
+def encode_token(key, line):
+    return base64.urlsafe_b64encode(f"{line}:{key}".encode("utf-8")).decode("ascii")
+
+
+def decode_token(token):
+    """Returns (key, line)."""
+    try:
+        line, key = base64.urlsafe_b64decode(token.encode("ascii")).decode("utf-8").split(":", 1)
+        return key, int(line)
+    except ValueError as e:
+        raise InvalidToken("nextToken is not valid") from e
+
+
+def read_records(store, kind, fein, date_from=None, date_to=None, match=None, limit=100, token=None):
+    """
+    Archived records for one FEIN, oldest first, archived between date_from
+    and date_to (inclusive date objects, either may be None). match filters
+    individual records. Returns (records, next_token).
+    """
+    prefix = f"{kind}/{fein}/"
+    start_after, skip = "", 0
+    if token:
+        resume_key, skip = decode_token(token)
+        if not resume_key.startswith(prefix):
+            raise InvalidToken("nextToken is for a different archive")
+        # List from just before the object the previous page stopped in
+        start_after = resume_key[:-1]
+    elif date_from:
+        start_after = f"{prefix}{date_from.isoformat()}"
+
+    records = []
+    for key in store.keys(prefix, start_after):
+        day = date.fromisoformat(key[len(prefix):].split("/", 1)[0])
+        if date_from and day < date_from:
+            continue
+        if date_to and day > date_to:
+            break
+        lines = decode_records(store.get(key))
+        for line in range(skip, len(lines)):
+            if match is not None and not match(lines[line]):
+                continue
+            if len(records) == limit:
+                return records, encode_token(key, line)
+            records.append(lines[line])
+        skip = 0
+    return records, None
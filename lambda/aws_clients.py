@@ -0,0 +1,85 @@
+import functools
+import os
+
+from emf_metrics import attach_dynamodb_hooks
+
+# Lazily created, process-wide AWS clients shared by every handler module.
+#
+# Nothing here touches boto3 at import time: the session, service model and
+# connection pool are built on first use and then memoized, so a handler that
+# returns early (validation errors, 304s) never pays for them, and handlers
+# that run in the same container reuse one pool.
+
+AWS_CONNECT_TIMEOUT_SECONDS = float(os.environ.get("AWS_CONNECT_TIMEOUT_SECONDS", 2))
+AWS_READ_TIMEOUT_SECONDS = float(os.environ.get("AWS_READ_TIMEOUT_SECONDS", 5))
+AWS_MAX_POOL_CONNECTIONS = int(os.environ.get("AWS_MAX_POOL_CONNECTIONS", 25))
+# Local DynamoDB stand-in (DynamoDB Local, moto_server) for lambda/local_api.py
+DYNAMODB_ENDPOINT_URL = os.environ.get("DYNAMODB_ENDPOINT_URL") or None
+# Local S3 stand-in (moto_server, MinIO) for the transfer archive
+S3_ENDPOINT_URL = os.environ.get("S3_ENDPOINT_URL") or None
+
+
+@functools.cache
+def _config():
+    from botocore.config import Config
+
+    return Config(
+        connect_timeout=AWS_CONNECT_TIMEOUT_SECONDS,
+        read_timeout=AWS_READ_TIMEOUT_SECONDS,
+        max_pool_connections=AWS_MAX_POOL_CONNECTIONS,
+        retries={"max_attempts": 3, "mode": "standard"},
+        tcp_keepalive=True,
+    )
+
+
+@functools.cache
+def dynamodb_resource():
+    import boto3
+
+    resource = boto3.resource("dynamodb", config=_config(), endpoint_url=DYNAMODB_ENDPOINT_URL)
+    # Per-request DynamoDB call counts and consumed capacity for emf_metrics
+    attach_dynamodb_hooks(resource.meta.client.meta.events)
+    return resource
+
+
+def dynamodb_client():
+    # The resource's own low-level client, so both share one connection pool
+    return dynamodb_resource().meta.client
+
+
+@functools.cache
+def s3_client():
+    import boto3
+
+    return boto3.client("s3", config=_config(), endpoint_url=S3_ENDPOINT_URL)
+
+
+@functools.cache
+def sqs_client():
+    import boto3
+
+    return boto3.client("sqs", config=_config())
+
+
+@functools.cache
+def dynamodb_table(name):
+    return dynamodb_resource().Table(name)
+
+
+class LazyTable:
+    """Stand-in for a boto3 Table that is only created on first use."""
+
+    __slots__ = ("name",)
+
+    def __init__(self, name):
+        self.name = name
+
+    def __getattr__(self, attr):
+        return getattr(dynamodb_table(self.name), attr)
+
+    def __repr__(self):
+        return f"LazyTable({self.name!r})"
+
+
+def lazy_table(name):
+    return LazyTable(name) if name else None
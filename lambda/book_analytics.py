@@ -0,0 +1,138 @@
+import numpy as np
+
+# Columnar view of an IMO's book used to answer "what leaves if these agents
+# move?" without looping over contract dicts. Each categorical column is
+# dictionary-encoded once (labels + int codes) so every grouped total is a
+# single np.bincount over a boolean selection mask.
+
+
+def _encode(values):
+    labels, codes = np.unique(np.asarray(values, dtype=object).astype(str), return_inverse=True)
+    return labels, codes
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _issue_year(issue_date):
+    # issueDate is stored as YYYY-MM-DD
+    text = str(issue_date or "")
+    return text[:4] if len(text) >= 4 and text[:4].isdigit() else "unknown"
+
+
+def _grouped(labels, codes, mask, weights, value_name):
+    counts = np.bincount(codes[mask], minlength=len(labels))
+    totals = np.bincount(codes[mask], weights=weights[mask], minlength=len(labels))
+    return {
+        str(label): {"contractCount": int(count), value_name: round(float(total), 2)}
+        for label, count, total in zip(labels, counts, totals)
+        if count
+    }
+
+
+class _AgentCarrierColumns:
+    size = 0
+
+    def select(self, npns=None, carrier_ids=None):
+        mask = np.ones(self.size, dtype=bool)
+        if npns:
+            mask &= np.isin(self.npn, np.flatnonzero(np.isin(self.npn_labels, list(npns))))
+        if carrier_ids:
+            mask &= np.isin(self.carrier, np.flatnonzero(np.isin(self.carrier_labels, list(carrier_ids))))
+        return mask
+
+
+class ContractBook(_AgentCarrierColumns):
+    def __init__(self, contracts):
+        self.size = len(contracts)
+        self.npn_labels, self.npn = _encode([c.get("npn") for c in contracts])
+        self.carrier_labels, self.carrier = _encode([c.get("carrierId") for c in contracts])
+        self.type_labels, self.contract_type = _encode([c.get("contractType") for c in contracts])
+        self.year_labels, self.issue_year = _encode([_issue_year(c.get("issueDate")) for c in contracts])
+        self.value = np.fromiter(
+            (_to_float(c.get("contractValue")) for c in contracts), dtype=np.float64, count=self.size
+        )
+
+    def summarize(self, mask):
+        return {
+            "contractCount": int(mask.sum()),
+            "totalContractValue": round(float(self.value[mask].sum()), 2),
+            "byCarrier": _grouped(self.carrier_labels, self.carrier, mask, self.value, "totalContractValue"),
+            "byContractType": _grouped(self.type_labels, self.contract_type, mask, self.value, "totalContractValue"),
+            "byIssueYear": _grouped(self.year_labels, self.issue_year, mask, self.value, "totalContractValue"),
+        }
+
+
+class BookOfBusiness(_AgentCarrierColumns):
+    def __init__(self, agents):
+        books = [
+            (agent["npn"], book)
+            for agent in agents
+            for book in agent.get("bookOfBusiness", [])
+        ]
+        self.size = len(books)
+        self.npn_labels, self.npn = _encode([npn for npn, _ in books])
+        self.carrier_labels, self.carrier = _encode([book.get("carrierId") for _, book in books])
+        self.policy_count = np.fromiter(
+            (_to_float(book.get("policyCount")) for _, book in books), dtype=np.float64, count=self.size
+        )
+        self.premium = np.fromiter(
+            (_to_float(book.get("annualizedPremium")) for _, book in books), dtype=np.float64, count=self.size
+        )
+
+    def summarize(self, mask):
+        counts = np.bincount(self.carrier[mask], weights=self.policy_count[mask], minlength=len(self.carrier_labels))
+        premiums = np.bincount(self.carrier[mask], weights=self.premium[mask], minlength=len(self.carrier_labels))
+        books = np.bincount(self.carrier[mask], minlength=len(self.carrier_labels))
+        return {
+            "policyCount": int(self.policy_count[mask].sum()),
+            "annualizedPremium": round(float(self.premium[mask].sum()), 2),
+            "byCarrier": {
+                str(label): {"policyCount": int(count), "annualizedPremium": round(float(premium), 2)}
+                for label, count, premium, n in zip(self.carrier_labels, counts, premiums, books)
+                if n
+            },
+        }
+
+
+def _share(part, whole):
+    return round(part / whole, 4) if whole else 0.0
+
+
+def transfer_impact(contracts, agents, npns=None, carrier_ids=None):
+    """What-if for moving `npns` (all agents when empty) on `carrier_ids` out of the book."""
+    contract_book = ContractBook(contracts)
+    leaving_contracts = contract_book.select(npns, carrier_ids)
+
+    book = BookOfBusiness(agents)
+    leaving_books = book.select(npns, carrier_ids)
+
+    leaving = {
+        **contract_book.summarize(leaving_contracts),
+        "bookOfBusiness": book.summarize(leaving_books),
+    }
+    remaining = {
+        **contract_book.summarize(~leaving_contracts),
+        "bookOfBusiness": book.summarize(~leaving_books),
+    }
+
+    return {
+        "leaving": leaving,
+        "remaining": remaining,
+        "leavingShare": {
+            "contractCount": _share(leaving["contractCount"], contract_book.size),
+            "totalContractValue": _share(
+                leaving["totalContractValue"],
+                leaving["totalContractValue"] + remaining["totalContractValue"],
+            ),
+            "annualizedPremium": _share(
+                leaving["bookOfBusiness"]["annualizedPremium"],
+                leaving["bookOfBusiness"]["annualizedPremium"]
+                + remaining["bookOfBusiness"]["annualizedPremium"],
+            ),
+        },
+    }
@@ -0,0 +1,345 @@
+import email.utils
+import http.client
+import json
+import logging
+import os
+import time
+import urllib.error
+import urllib.request
+from collections import deque
+
+from api_responses import dumps_bytes
+from aws_clients import lazy_table
+from carrier_registry import get_carrier
+from emf_metrics import put_metrics
+from tracing import client_span
+
+# Outbound calls to carrier transfer APIs, guarded per carrier.
+#
+# Each carrier gets a CarrierHealth record that lives for the life of the
+# container (so warm invocations remember a carrier is down) with:
+#   - a circuit breaker: FAILURE_THRESHOLD consecutive failures (timeouts,
+#     connection errors, 429/5xx) open the circuit for OPEN_SECONDS (or the
+#     carrier's Retry-After, if longer). While open, forwards fail fast with a
+#     503 CARRIER_UNAVAILABLE instead of waiting on the carrier; once the
+#     window passes a single half-open probe decides whether it closes again.
+#   - an adaptive timeout: TIMEOUT_P99_MULTIPLIER x the p99 of the last
+#     LATENCY_WINDOW successful calls, clamped to [MIN, MAX]_TIMEOUT_SECONDS
+#     (the carrier_registry timeoutSeconds until there are enough samples).
+#   - Retry-After aware retries: a 429/503 asking to retry within
+#     MAX_RETRY_AFTER_SECONDS is retried once after that delay.
+#
+# With CARRIER_HEALTH_TABLE set, open circuits are also written to DynamoDB
+# and read back (at most every HEALTH_SYNC_SECONDS) so every container stops
+# calling a carrier that one of them has found to be down.
+#
+# forward_many sends several transfers to one carrier; carriers whose registry
+# entry has supportsBatch get them in batch requests. Bulk paths (the queued
+# release forwards in release_deferred.py) call it with whatever they have.
+
+logger = logging.getLogger()
+
+FAILURE_THRESHOLD = int(os.environ.get("CARRIER_FAILURE_THRESHOLD", 3))
+OPEN_SECONDS = float(os.environ.get("CARRIER_OPEN_SECONDS", 30))
+
+DEFAULT_TIMEOUT_SECONDS = float(os.environ.get("CARRIER_TIMEOUT_SECONDS", 5))
+MIN_TIMEOUT_SECONDS = 1.0
+MAX_TIMEOUT_SECONDS = 10.0
+TIMEOUT_P99_MULTIPLIER = 1.5
+LATENCY_WINDOW = 100
+MIN_LATENCY_SAMPLES = 20
+
+MAX_ATTEMPTS = 2
+MAX_RETRY_AFTER_SECONDS = 2.0
+
+MAX_BATCH_SIZE = int(os.environ.get("CARRIER_MAX_BATCH_SIZE", 25))
+
+HEALTH_SYNC_SECONDS = 10.0
+HEALTH_TTL_SECONDS = 24 * 60 * 60
+
+CIRCUIT_CLOSED = "CLOSED"
+CIRCUIT_OPEN = "OPEN"
+CIRCUIT_HALF_OPEN = "HALF_OPEN"
+
+_RETRYABLE_STATUSES = {429, 503}
+
+
+class CarrierHealth:
+    __slots__ = (
+        "carrier_id", "default_timeout", "state", "failures", "open_until", "latencies", "synced_at",
+    )
+
+    def __init__(self, carrier_id, default_timeout=DEFAULT_TIMEOUT_SECONDS):
+        self.carrier_id = carrier_id
+        self.default_timeout = default_timeout
+        self.state = CIRCUIT_CLOSED
+        self.failures = 0
+        self.open_until = 0.0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.synced_at = 0.0
+
+    def allow_request(self, now):
+        if self.state == CIRCUIT_CLOSED:
+            return True
+        if now >= self.open_until:
+            # One probe; its outcome moves the circuit to CLOSED or back to OPEN
+            self.state = CIRCUIT_HALF_OPEN
+            return True
+        return False
+
+    def timeout(self):
+        if len(self.latencies) < MIN_LATENCY_SAMPLES:
+            return self.default_timeout
+        ordered = sorted(self.latencies)
+        p99 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]
+        return min(MAX_TIMEOUT_SECONDS, max(MIN_TIMEOUT_SECONDS, p99 * TIMEOUT_P99_MULTIPLIER))
+
+    def record_success(self, latency_seconds):
+        """Returns True when this closes the circuit."""
+        self.latencies.append(latency_seconds)
+        self.failures = 0
+        closed = self.state != CIRCUIT_CLOSED
+        self.state = CIRCUIT_CLOSED
+        return closed
+
+    def record_failure(self, now, retry_after=None):
+        """Returns True when this opens the circuit."""
+        self.failures += 1
+        if self.state == CIRCUIT_HALF_OPEN or self.failures >= FAILURE_THRESHOLD:
+            self.state = CIRCUIT_OPEN
+            self.open_until = now + max(OPEN_SECONDS, retry_after or 0)
+            return True
+        return False
+
+
+_health = {}
+
+
+def health_for(carrier_id):
+    health = _health.get(carrier_id)
+    if health is None:
+        carrier = get_carrier(carrier_id)
+        default_timeout = carrier["timeoutSeconds"] if carrier else DEFAULT_TIMEOUT_SECONDS
+        health = _health[carrier_id] = CarrierHealth(carrier_id, default_timeout)
+    return health
+
+
+# ---------------------------------------------------------------------------
+# Optional cross-container sharing through DynamoDB
+# ---------------------------------------------------------------------------
+
+health_table = lazy_table(os.environ.get("CARRIER_HEALTH_TABLE"))
+
+
+def _sync(health, now):
+    if health_table is None or health.state != CIRCUIT_CLOSED or now - health.synced_at < HEALTH_SYNC_SECONDS:
+        return
+    health.synced_at = now
+    try:
+        item = health_table.get_item(Key={"carrierId": health.carrier_id}).get("Item")
+    except Exception as e:
+        logger.warning("Carrier health read failed carrier=%s: %s", health.carrier_id, e)
+        return
+    if item and item.get("state") == CIRCUIT_OPEN and int(item["openUntilMs"]) / 1000 > now:
+        health.state = CIRCUIT_OPEN
+        health.open_until = int(item["openUntilMs"]) / 1000
+
+
+def _publish(health, now):
+    if health_table is None:
+        return
+    try:
+        health_table.put_item(
+            Item={
+                "carrierId": health.carrier_id,
+                "state": health.state,
+                "openUntilMs": int(health.open_until * 1000),
+                "updatedAtMs": int(now * 1000),
+                "expiresAt": int(now) + HEALTH_TTL_SECONDS,
+            }
+        )
+    except Exception as e:
+        logger.warning("Carrier health write failed carrier=%s: %s", health.carrier_id, e)
+
+
+# ---------------------------------------------------------------------------
+# Forwarding
+# ---------------------------------------------------------------------------
+
+
+def _retry_after_seconds(headers):
+    value = headers.get("Retry-After") if headers else None
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _forward_error(code, message, **extra):
+    return json.dumps({"error": {"code": code, "message": message, **extra}})
+
+
+def _failed(health, status, body, retry_after=None):
+    now = time.time()
+    if health.record_failure(now, retry_after):
+        logger.error("Circuit opened carrier=%s until=%.0f", health.carrier_id, health.open_until)
+        _publish(health, now)
+    return status, body
+
+
+def _circuit_open_error(health, now):
+    retry_after = max(0, round(health.open_until - now))
+    logger.warning("Circuit open carrier=%s, failing fast", health.carrier_id)
+    return 503, _forward_error(
+        "CARRIER_UNAVAILABLE",
+        f"carrier {health.carrier_id} is unavailable; retry after {retry_after}s",
+        retryAfterSeconds=retry_after,
+    )
+
+
+def _post(health, url, data, span_attributes):
+    """One carrier POST with Retry-After retries; updates the carrier's health."""
+    carrier_id = health.carrier_id
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        timeout = health.timeout()
+        attributes = {"ats.carrier_id": carrier_id, "ats.attempt": attempt, **span_attributes}
+        with client_span("POST forward", url, attributes) as span:
+            req = urllib.request.Request(
+                url,
+                data=data,
+                headers={"Content-Type": "application/json", **span.headers()},
+                method="POST",
+            )
+            started = time.perf_counter()
+            try:
+                with urllib.request.urlopen(req, timeout=timeout) as response:
+                    span.set_attribute("http.status_code", response.status)
+                    response_body = response.read().decode("utf-8")
+            except urllib.error.HTTPError as e:
+                span.set_attribute("http.status_code", e.code)
+                error_body = e.read().decode("utf-8")
+                if e.code not in _RETRYABLE_STATUSES and e.code < 500:
+                    # The carrier answered; a 4xx is about the request, not its health
+                    if health.record_success(time.perf_counter() - started):
+                        _publish(health, time.time())
+                    return e.code, error_body
+
+                span.error = True
+                retry_after = _retry_after_seconds(e.headers)
+                if (
+                    e.code in _RETRYABLE_STATUSES
+                    and retry_after is not None
+                    and retry_after <= MAX_RETRY_AFTER_SECONDS
+                    and attempt < MAX_ATTEMPTS
+                    and health.state == CIRCUIT_CLOSED
+                ):
+                    logger.info("carrier=%s returned %s, retrying in %.1fs", carrier_id, e.code, retry_after)
+                    time.sleep(retry_after)
+                    continue
+                return _failed(health, e.code, error_body, retry_after)
+            except (urllib.error.URLError, TimeoutError) as e:
+                span.error = True
+                reason = getattr(e, "reason", e)
+                return _failed(
+                    health,
+                    504 if isinstance(reason, TimeoutError) else 502,
+                    _forward_error("FORWARD_FAILED", str(reason), timeoutSeconds=round(timeout, 2)),
+                )
+            except (OSError, http.client.HTTPException) as e:
+                # Connection reset / closed mid-response (RemoteDisconnected, IncompleteRead, ...)
+                span.error = True
+                return _failed(health, 502, _forward_error("FORWARD_FAILED", f"{type(e).__name__}: {e}"))
+
+        if health.record_success(time.perf_counter() - started):
+            logger.info("Circuit closed carrier=%s", carrier_id)
+            _publish(health, time.time())
+        return None, response_body
+
+
+def _forward_one(body, url, carrier_id):
+    health = health_for(carrier_id)
+    now = time.time()
+    _sync(health, now)
+    if not health.allow_request(now):
+        return _circuit_open_error(health, now)
+    return _post(health, url, dumps_bytes(body), {})
+
+
+def forward_to_api(body, url, carrier_id):
+    """
+    POST a transfer to one carrier. Returns (None, response_body) on success
+    and (status_code, error_body) otherwise, without raising.
+    """
+    if not url:
+        return 503, _forward_error("CARRIER_NOT_CONFIGURED", f"no endpoint configured for carrier {carrier_id}")
+    return _forward_one(body, url, carrier_id)
+
+
+def forward_many(carrier, bodies):
+    """
+    POST several transfers to one carrier. Returns one (status, body) per
+    transfer, in order, shaped like forward_to_api's, without raising.
+
+    A carrier with supportsBatch gets them as POST {"transfers": [...]} to its
+    batchEndpoint, MAX_BATCH_SIZE at a time, and each transfer gets its own
+    entry of the per-transfer `results` back. Other carriers (and a single
+    transfer) are sent one request per transfer.
+    """
+    carrier_id = carrier["carrierId"]
+    if not carrier["supportsBatch"] or not carrier["endpoint"] or len(bodies) == 1:
+        return [forward_to_api(body, carrier["endpoint"], carrier_id) for body in bodies]
+
+    results = []
+    for start in range(0, len(bodies), MAX_BATCH_SIZE):
+        chunk = bodies[start:start + MAX_BATCH_SIZE]
+        started = time.perf_counter()
+        chunk_results = _forward_batch(carrier, chunk)
+        put_metrics(
+            {
+                "CarrierBatchSize": (len(chunk), "Count"),
+                "CarrierBatchLatency": (round((time.perf_counter() - started) * 1000, 2), "Milliseconds"),
+                "CarrierBatchFailures": (sum(1 for status, _ in chunk_results if status is not None), "Count"),
+            },
+            carrier=carrier_id,
+        )
+        results.extend(chunk_results)
+    return results
+
+
+def _forward_batch(carrier, bodies):
+    carrier_id = carrier["carrierId"]
+    health = health_for(carrier_id)
+    now = time.time()
+    _sync(health, now)
+    if not health.allow_request(now):
+        return [_circuit_open_error(health, now)] * len(bodies)
+
+    logger.info("Forwarding batch of %d transfers to carrier=%s", len(bodies), carrier_id)
+    status, response_body = _post(
+        health, carrier["batchEndpoint"], dumps_bytes({"transfers": bodies}), {"ats.batch_size": len(bodies)}
+    )
+    if status is not None:
+        return [(status, response_body)] * len(bodies)
+
+    try:
+        results = json.loads(response_body)["results"]
+    except (ValueError, KeyError, TypeError):
+        results = None
+    if not isinstance(results, list) or len(results) != len(bodies):
+        logger.error("Unexpected batch response carrier=%s body=%s", carrier_id, response_body)
+        return [(502, _forward_error("FORWARD_FAILED", "unexpected batch response from carrier"))] * len(bodies)
+
+    outcomes = []
+    for result in results:
+        result_status = result.get("status", 200) if isinstance(result, dict) else 502
+        if 200 <= result_status < 300:
+            outcomes.append((None, json.dumps(result)))
+        else:
+            error = result.get("error") if isinstance(result, dict) else None
+            outcomes.append((result_status, json.dumps({"error": error or {"message": "rejected by carrier"}})))
+    return outcomes
@@ -0,0 +1,93 @@
+import json
+import os
+
+# Registry of carriers the hub can forward transfers to.
+#
+# Each entry:
+#   carrierId       id used in agent data, status records and selectedCarrierIds
+#   carrierName     display name
+#   endpointEnv     environment variable holding the carrier's transfer API URL
+#   timeoutSeconds  starting forward timeout (carrier_client adapts it to p99)
+#   supportsBatch   whether the carrier accepts several transfers per request
+#   batchEndpoint   URL for those requests ({"transfers": [...]}); defaults to
+#                   the transfer URL + ":batch", like POST /ats/v1/transfers:batch
+#
+# CARRIER_REGISTRY (a JSON array of entries, inline) adds carriers or
+# overrides built-in ones by carrierId; an entry may give "endpoint" directly
+# instead of "endpointEnv".
+
+DEFAULT_CARRIERS = [
+    {
+        "carrierId": "allianz",
+        "carrierName": "Allianz",
+        "endpointEnv": "FORWARD_API_URL_ALLIANZ",
+        "timeoutSeconds": 5,
+        "supportsBatch": False,
+    },
+    {
+        "carrierId": "american-equity",
+        "carrierName": "American Equity",
+        "endpointEnv": "FORWARD_API_URL_AE",
+        "timeoutSeconds": 5,
+        "supportsBatch": False,
+    },
+]
+
+
+def _load():
+    entries = {c["carrierId"]: dict(c) for c in DEFAULT_CARRIERS}
+    for override in json.loads(os.environ.get("CARRIER_REGISTRY") or "[]"):
+        entries[override["carrierId"]] = {**entries.get(override["carrierId"], {}), **override}
+
+    registry = {}
+    for carrier_id, entry in entries.items():
+        endpoint = entry.get("endpoint") or os.environ.get(entry.get("endpointEnv") or "")
+        supports_batch = bool(entry.get("supportsBatch", False))
+        batch_endpoint = entry.get("batchEndpoint") or (f"{endpoint}:batch" if endpoint else None)
+        registry[carrier_id] = {
+            "carrierId": carrier_id,
+            "carrierName": entry.get("carrierName", carrier_id),
+            "endpoint": endpoint or None,
+            "timeoutSeconds": float(entry.get("timeoutSeconds", 5)),
+            "supportsBatch": supports_batch,
+            "batchEndpoint": batch_endpoint if supports_batch else None,
+        }
+    return registry
+
+
+CARRIERS = _load()
+
+
+def get_carrier(carrier_id):
+    return CARRIERS.get(carrier_id)
+
+
+def route_carriers(agent=None, selected_carrier_ids=None):
+    """
+    Carriers a transfer is forwarded to, in registry order.
+
+    selected_carrier_ids (when given) narrows the set; the agent's licensed
+    carriers (when the agent is known) narrow it further. With neither, every
+    registered carrier receives it. Returns (carriers, rejected) where rejected
+    maps each selected id that cannot be routed to the reason.
+    """
+    candidates = list(CARRIERS.values())
+    rejected = {}
+
+    if agent is not None:
+        licensed = {c["carrierId"] for c in agent.get("carriers", []) if c.get("licensed") is True}
+        candidates = [c for c in candidates if c["carrierId"] in licensed]
+
+    if selected_carrier_ids:
+        routable = {c["carrierId"] for c in candidates}
+        for carrier_id in selected_carrier_ids:
+            if carrier_id in routable:
+                continue
+            if carrier_id not in CARRIERS:
+                rejected[carrier_id] = "unknown carrier"
+            else:
+                rejected[carrier_id] = "agent is not licensed with this carrier"
+        selected = set(selected_carrier_ids)
+        candidates = [c for c in candidates if c["carrierId"] in selected]
+
+    return candidates, rejected
@@ -0,0 +1,89 @@
+import os
+import re
+import time
+import uuid
+
+from boto3.dynamodb.conditions import Key
+
+# Write-side append log behind the `?since=<cursor>` reads on
+# GET /ats/v1/status/{fein} and GET /ats/v1/contracts/{fein}.
+#
+# One item per change, partitioned by stream + FEIN and ordered by cursor:
+#   feedKey=status#98-7654321     cursor=0001739999999999-1a2b3c4d  op=UPSERT item={...}
+#   feedKey=contracts#12-3456789  cursor=0001739999999999-5e6f7a8b  op=REMOVE item={"id": ...}
+# Cursors are zero-padded epoch milliseconds plus a random suffix, so string
+# order is time order and two writers in the same millisecond never collide.
+#
+# A writer picks its cursor before its write commits, so for a moment a change
+# can land behind cursors already handed to readers. Readers therefore only
+# see changes older than CHANGE_FEED_MAX_WRITE_LAG_SECONDS, and every cursor
+# they are given (read_changes, snapshot_cursor) is at or before that horizon:
+# a change still in flight is never skipped, only seen a little later.
+STATUS_STREAM = "status"
+CONTRACTS_STREAM = "contracts"
+
+CHANGE_FEED_RETENTION_SECONDS = int(os.environ.get("CHANGE_FEED_RETENTION_SECONDS", 7 * 24 * 3600))
+# Longest time between a writer taking its cursor and its write committing
+CHANGE_FEED_MAX_WRITE_LAG_SECONDS = int(os.environ.get("CHANGE_FEED_MAX_WRITE_LAG_SECONDS", 30))
+DEFAULT_PAGE_SIZE = 500
+
+# "0" reads the whole retained feed
+CURSOR_PATTERN = re.compile(r"0|\d{16}-[0-9a-f]{8}")
+
+
+class InvalidCursor(ValueError):
+    """Raised for a since value that is not a cursor from this feed."""
+
+
+def new_cursor():
+    return f"{int(time.time() * 1000):016d}-{uuid.uuid4().hex[:8]}"
+
+
+def snapshot_cursor():
+    """
+    Cursor for a full read taken now: the horizon, so changes still in flight
+    while the data was read are replayed by the next ?since= (replaying a
+    change the read already saw is harmless; UPSERT and REMOVE are idempotent).
+    """
+    horizon_ms = int(time.time() * 1000) - CHANGE_FEED_MAX_WRITE_LAG_SECONDS * 1000
+    return f"{horizon_ms:016d}-ffffffff"
+
+
+def append_changes(feed_table, stream, fein, changes):
+    """changes: iterable of (op, item) where op is UPSERT or REMOVE."""
+    expires_at = int(time.time()) + CHANGE_FEED_RETENTION_SECONDS
+    with feed_table.batch_writer() as batch:
+        for op, item in changes:
+            batch.put_item(
+                Item={
+                    "feedKey": f"{stream}#{fein}",
+                    "cursor": new_cursor(),
+                    "op": op,
+                    "item": item,
+                    "expiresAt": expires_at,
+                }
+            )
+
+
+def read_changes(feed_table, stream, fein, since, limit=DEFAULT_PAGE_SIZE):
+    if not CURSOR_PATTERN.fullmatch(since):
+        raise InvalidCursor("since must be a cursor returned by this API")
+    horizon = snapshot_cursor()
+    if since >= horizon:
+        return {"cursor": since, "changes": [], "hasMore": False}
+
+    # BETWEEN is inclusive; the change at `since` itself was already returned
+    response = feed_table.query(
+        KeyConditionExpression=Key("feedKey").eq(f"{stream}#{fein}") & Key("cursor").between(since, horizon),
+        Limit=limit,
+    )
+    changes = [
+        {"cursor": change["cursor"], "op": change["op"], "item": change["item"]}
+        for change in response["Items"]
+        if change["cursor"] != since
+    ]
+    return {
+        "cursor": changes[-1]["cursor"] if changes else since,
+        "changes": changes,
+        "hasMore": "LastEvaluatedKey" in response,
+    }
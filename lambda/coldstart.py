@@ -0,0 +1,61 @@
+import functools
+import json
+import os
+import sys
+import time
+
+# Init-duration measurement mode. With ATS_INIT_METRICS=1 every handler logs
+# one JSON line on the first invocation of its container:
+#   {"metric": "cold_start", "handler": "get_statuses", "processAgeMs": 412.0,
+#    "firstInvocationMs": 95.1, "loadedModules": 312}
+# processAgeMs is the container process age from /proc when the first request
+# arrives (runtime bootstrap plus all module imports), firstInvocationMs is that
+# first request including any lazily created clients, and loadedModules is the
+# size of the import graph.
+
+ATS_INIT_METRICS = os.environ.get("ATS_INIT_METRICS") == "1"
+
+_cold = True
+
+
+def _process_age_ms():
+    try:
+        with open("/proc/self/stat") as f:
+            # comm (field 2) may contain spaces; starttime is field 22
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            uptime_seconds = float(f.read().split()[0])
+        return round((uptime_seconds - start_ticks / os.sysconf("SC_CLK_TCK")) * 1000, 1)
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def measure_cold_start(handler):
+    if not ATS_INIT_METRICS:
+        return handler
+
+    @functools.wraps(handler)
+    def wrapper(event, context):
+        global _cold
+        if not _cold:
+            return handler(event, context)
+
+        _cold = False
+        invoked_at = time.perf_counter()
+        process_age_ms = _process_age_ms()
+        try:
+            return handler(event, context)
+        finally:
+            print(
+                json.dumps(
+                    {
+                        "metric": "cold_start",
+                        "handler": handler.__module__,
+                        "processAgeMs": process_age_ms,
+                        "firstInvocationMs": round((time.perf_counter() - invoked_at) * 1000, 1),
+                        "loadedModules": len(sys.modules),
+                    }
+                )
+            )
+
+    return wrapper
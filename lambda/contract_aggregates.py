@@ -0,0 +1,129 @@
+from collections import defaultdict
+from decimal import Decimal, InvalidOperation
+
+from boto3.dynamodb.conditions import Key
+
+# Aggregate items live in their own table keyed by fein + aggKey, one item per
+# carrier and one per contract type:
+#   fein=12-3456789 aggKey=carrier#allianz              contractCount=42 totalContractValue=...
+#   fein=12-3456789 aggKey=contractType#Fixed Annuity   contractCount=17 totalContractValue=...
+CARRIER_PREFIX = "carrier#"
+CONTRACT_TYPE_PREFIX = "contractType#"
+
+
+def contract_value(contract):
+    # Contracts are loaded from CSV so contractValue is usually a string.
+    try:
+        return Decimal(str(contract.get("contractValue") or 0))
+    except InvalidOperation:
+        return Decimal(0)
+
+
+def aggregate_keys(contract):
+    keys = []
+    if contract.get("carrierId"):
+        keys.append(f"{CARRIER_PREFIX}{contract['carrierId']}")
+    if contract.get("contractType"):
+        keys.append(f"{CONTRACT_TYPE_PREFIX}{contract['contractType']}")
+    return keys
+
+
+def contract_deltas(contracts, fein, sign=1):
+    """Group contracts into {(fein, aggKey): [count, value]} deltas."""
+    deltas = defaultdict(lambda: [0, Decimal(0)])
+    for contract in contracts:
+        value = contract_value(contract)
+        for agg_key in aggregate_keys(contract):
+            delta = deltas[(fein, agg_key)]
+            delta[0] += sign
+            delta[1] += sign * value
+    return deltas
+
+
+def merge_deltas(*delta_maps):
+    merged = defaultdict(lambda: [0, Decimal(0)])
+    for deltas in delta_maps:
+        for key, (count, value) in deltas.items():
+            merged[key][0] += count
+            merged[key][1] += value
+    return merged
+
+
+def _add_update(fein, agg_key, count, value):
+    return {
+        "Key": {"fein": fein, "aggKey": agg_key},
+        "UpdateExpression": "ADD contractCount :c, totalContractValue :v",
+        "ExpressionAttributeValues": {":c": count, ":v": value},
+    }
+
+
+def apply_deltas(aggregates_table, deltas):
+    # One atomic ADD per aggregate item; concurrent writers never clobber each other.
+    for (fein, agg_key), (count, value) in deltas.items():
+        if count == 0 and value == 0:
+            continue
+        aggregates_table.update_item(**_add_update(fein, agg_key, count, value))
+
+
+def delta_updates(aggregates_table, deltas):
+    """TransactWriteItems Updates for deltas, to commit together with the contract write they count."""
+    return [
+        {"Update": {"TableName": aggregates_table.name, **_add_update(fein, agg_key, count, value)}}
+        for (fein, agg_key), (count, value) in deltas.items()
+        if count != 0 or value != 0
+    ]
+
+
+def record_contracts_added(aggregates_table, contracts_by_fein):
+    apply_deltas(
+        aggregates_table,
+        merge_deltas(
+            *(contract_deltas(contracts, fein) for fein, contracts in contracts_by_fein.items())
+        ),
+    )
+
+
+def move_deltas(contracts, from_fein, to_fein):
+    return merge_deltas(
+        contract_deltas(contracts, from_fein, sign=-1),
+        contract_deltas(contracts, to_fein),
+    )
+
+
+def get_summary(aggregates_table, fein):
+    response = aggregates_table.query(KeyConditionExpression=Key("fein").eq(fein))
+    items = response["Items"]
+
+    while "LastEvaluatedKey" in response:
+        response = aggregates_table.query(
+            KeyConditionExpression=Key("fein").eq(fein),
+            ExclusiveStartKey=response["LastEvaluatedKey"],
+        )
+        items.extend(response["Items"])
+
+    by_carrier = {}
+    by_contract_type = {}
+    for item in items:
+        agg_key = item["aggKey"]
+        if not item.get("contractCount"):
+            # Every contract moved out; the item stays behind at zero
+            continue
+        entry = {
+            "contractCount": int(item.get("contractCount", 0)),
+            "totalContractValue": str(item.get("totalContractValue", 0)),
+        }
+        if agg_key.startswith(CARRIER_PREFIX):
+            by_carrier[agg_key[len(CARRIER_PREFIX):]] = entry
+        elif agg_key.startswith(CONTRACT_TYPE_PREFIX):
+            by_contract_type[agg_key[len(CONTRACT_TYPE_PREFIX):]] = entry
+
+    total_count = sum(e["contractCount"] for e in by_carrier.values())
+    total_value = sum((Decimal(e["totalContractValue"]) for e in by_carrier.values()), Decimal(0))
+
+    return {
+        "fein": fein,
+        "contractCount": total_count,
+        "totalContractValue": str(total_value),
+        "byCarrier": by_carrier,
+        "byContractType": by_contract_type,
+    }
@@ -0,0 +1,176 @@
+import base64
+import json
+from decimal import Decimal
+
+from boto3.dynamodb.conditions import Attr, Key
+
+from contract_aggregates import contract_value
+
+# Contract search for GET /ats/v1/contracts, backed by two GSIs on Contracts
+# that share a composite sort key:
+#   fein-search-index  fein + searchKey
+#   npn-search-index   npn  + searchKey
+#   searchKey=allianz#Fixed Annuity#2021-06-30
+# so FEIN (or NPN), carrier, contract type and an issue-date range narrow the
+# read as key conditions: carrier alone is a begins_with, carrier + type + a
+# date range is a between. Whatever the key cannot express (a type or date
+# range without the fields before it, NPN under a FEIN, contract value) is a
+# filter on the same Query.
+#
+# contractValue is loaded from CSV as a string, so writers also store
+# contractValueAmount (a number) for value ranges and sorting. Both derived
+# attributes are set by search_attributes() and never returned to callers.
+
+FEIN_INDEX = "fein-search-index"
+NPN_INDEX = "npn-search-index"
+
+SEARCH_KEY_ATTRIBUTES = ("searchKey", "contractValueAmount")
+
+SORT_FIELDS = {
+    "issueDate": lambda c: c.get("issueDate") or "",
+    "contractValue": lambda c: c.get("contractValueAmount", Decimal(0)),
+}
+
+_KEY_END = "\uffff"
+
+
+class InvalidSearch(ValueError):
+    """Raised for search parameters (or page tokens) that cannot be used."""
+
+
+def search_key(contract):
+    return f"{contract.get('carrierId', '')}#{contract.get('contractType', '')}#{contract.get('issueDate', '')}"
+
+
+def search_attributes(contract):
+    return {"searchKey": search_key(contract), "contractValueAmount": contract_value(contract)}
+
+
+def public(contract):
+    return {k: v for k, v in contract.items() if k not in SEARCH_KEY_ATTRIBUTES}
+
+
+def _key_condition(partition_name, partition_value, carrier_id, contract_type, issued_from, issued_to):
+    condition = Key(partition_name).eq(partition_value)
+    if not carrier_id:
+        return condition
+    if not contract_type:
+        return condition & Key("searchKey").begins_with(f"{carrier_id}#")
+    prefix = f"{carrier_id}#{contract_type}#"
+    if issued_from or issued_to:
+        return condition & Key("searchKey").between(
+            f"{prefix}{issued_from or ''}", f"{prefix}{issued_to or _KEY_END}"
+        )
+    return condition & Key("searchKey").begins_with(prefix)
+
+
+def _filter(params, partition_name):
+    filters = []
+    if params.get("npn") and partition_name != "npn":
+        filters.append(Attr("npn").eq(params["npn"]))
+    if params.get("contractType") and not params.get("carrierId"):
+        filters.append(Attr("contractType").eq(params["contractType"]))
+    # Dates are part of the key only when carrier and type are fixed
+    if not (params.get("carrierId") and params.get("contractType")):
+        if params.get("issuedFrom"):
+            filters.append(Attr("issueDate").gte(params["issuedFrom"]))
+        if params.get("issuedTo"):
+            filters.append(Attr("issueDate").lte(params["issuedTo"]))
+    if params.get("minValue") is not None:
+        filters.append(Attr("contractValueAmount").gte(params["minValue"]))
+    if params.get("maxValue") is not None:
+        filters.append(Attr("contractValueAmount").lte(params["maxValue"]))
+
+    combined = None
+    for condition in filters:
+        combined = condition if combined is None else combined & condition
+    return combined
+
+
+def encode_token(state):
+    return base64.urlsafe_b64encode(json.dumps(state, default=str).encode("utf-8")).decode("ascii")
+
+
+def decode_token(token):
+    try:
+        state = json.loads(base64.urlsafe_b64decode(token.encode("ascii")))
+    except (ValueError, UnicodeError) as e:
+        raise InvalidSearch("nextToken is not valid") from e
+    if not isinstance(state, dict):
+        raise InvalidSearch("nextToken is not valid")
+    offset = state.get("offset", 0)
+    if not isinstance(offset, int) or isinstance(offset, bool) or offset < 0:
+        raise InvalidSearch("nextToken is not valid")
+    key = state.get("key", {})
+    if not isinstance(key, dict) or not all(isinstance(value, str) for value in key.values()):
+        raise InvalidSearch("nextToken is not valid")
+    return state
+
+
+def search(table, params, limit, sort=None, token=None):
+    """
+    Returns (contracts, next_token). Without sort, results come in searchKey
+    order and pages are DynamoDB pages; with sort ("issueDate",
+    "-contractValue", ...) every match is read, sorted, then paged.
+    """
+    if params.get("fein"):
+        index, partition_name = FEIN_INDEX, "fein"
+    elif params.get("npn"):
+        index, partition_name = NPN_INDEX, "npn"
+    else:
+        raise InvalidSearch("fein or npn is required")
+    # ISO dates compare as strings; a reversed range is a 400, not a DynamoDB error
+    if params.get("issuedFrom") and params.get("issuedTo") and params["issuedFrom"] > params["issuedTo"]:
+        raise InvalidSearch("issuedFrom must not be after issuedTo")
+
+    query = {
+        "IndexName": index,
+        "KeyConditionExpression": _key_condition(
+            partition_name,
+            params[partition_name],
+            params.get("carrierId"),
+            params.get("contractType"),
+            params.get("issuedFrom"),
+            params.get("issuedTo"),
+        ),
+    }
+    filter_expression = _filter(params, partition_name)
+    if filter_expression is not None:
+        query["FilterExpression"] = filter_expression
+
+    state = decode_token(token) if token else {}
+
+    if sort:
+        field = sort.lstrip("-")
+        if field not in SORT_FIELDS:
+            raise InvalidSearch(f"sort must be one of: {', '.join(sorted(SORT_FIELDS))} (prefix - for descending)")
+        matches = []
+        while True:
+            response = table.query(**query)
+            matches.extend(response["Items"])
+            if "LastEvaluatedKey" not in response:
+                break
+            query["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+        matches.sort(key=SORT_FIELDS[field], reverse=sort.startswith("-"))
+        offset = state.get("offset", 0)
+        page = matches[offset:offset + limit]
+        next_token = encode_token({"offset": offset + limit}) if offset + limit < len(matches) else None
+        return [public(c) for c in page], next_token
+
+    if "key" in state:
+        if set(state["key"]) != {"id", partition_name, "searchKey"}:
+            raise InvalidSearch("nextToken is not valid")
+        query["ExclusiveStartKey"] = state["key"]
+    page = []
+    while len(page) < limit:
+        query["Limit"] = limit - len(page)
+        response = table.query(**query)
+        page.extend(response["Items"])
+        if "LastEvaluatedKey" not in response:
+            return [public(c) for c in page], None
+        query["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+    # Resume after the last contract returned, in this index's key terms
+    last = page[-1]
+    next_key = {"id": last["id"], partition_name: last[partition_name], "searchKey": last["searchKey"]}
+    return [public(c) for c in page], encode_token({"key": next_key})
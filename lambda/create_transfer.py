@@ -1,59 +1,195 @@
-import json
+import binascii
 import logging
 import os
 import traceback
 import urllib.error
 import urllib.request
 
-import boto3
+from admission import FEIN_SCOPE, admit, retry_after_header
+from agents.data import get_agent_by_npn
+from agents.validation import validate_payload
+from api_responses import dumps_bytes, json_response, parse_body
+from aws_clients import lazy_table
+from carrier_registry import route_carriers
+from coldstart import measure_cold_start
+from emf_metrics import emit_metrics, timed_step
+from fein_versions import agent_names, bump_agent_names
+from request_validation import InvalidRequest, check, validator
+from tracing import client_span, traced
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-dynamodb = boto3.resource("dynamodb")
-table = dynamodb.Table(os.environ["TRANSFERS_TABLE"])
-agent_table = dynamodb.Table(os.environ["AGENT_TABLE"])
+table = lazy_table(os.environ["TRANSFERS_TABLE"])
+agent_table = lazy_table(os.environ["AGENT_TABLE"])
+
+versions_table = lazy_table(os.environ.get("VERSIONS_TABLE"))
 
-FORWARD_API_URL_ALLIANZ = os.environ.get("FORWARD_API_URL_ALLIANZ")
-FORWARD_API_URL_AE = os.environ.get("FORWARD_API_URL_AE")
 SET_STATUS_URL = os.environ.get("SET_STATUS_URL")
 
-forward_apis = [FORWARD_API_URL_ALLIANZ, FORWARD_API_URL_AE]
-carrier_ids = ["allianz", "american-equity"]
+validator("CreateTransferRequest")  # compile at import, not on the first request
 
 
-def forward_to_api(body, url):
-    data = json.dumps(body).encode("utf-8")
-    req = urllib.request.Request(
-        url,
-        data=data,
-        headers={"Content-Type": "application/json"},
-        method="POST",
-    )
-    try:
-        with urllib.request.urlopen(req) as response:
-            return None, response.read().decode("utf-8")
-    except urllib.error.HTTPError as e:
-        return e.status, e.read().decode("utf-8")
-    except urllib.error.URLError as e:
-        return 502, json.dumps(
-            {"error": {"code": "FORWARD_FAILED", "message": str(e.reason)}}
-        )
+def _error_response(status_code, step, message, errors=None, headers=None):
+    logger.error("step=%s error=%s", step, message)
+    error = {"step": step, "message": message}
+    if errors:
+        error["errors"] = errors
+    return json_response(status_code, {"error": error}, headers=headers)
 
 
-def _error_response(status_code, step, message):
-    logger.error("step=%s error=%s", step, message)
+class TransferRejected(Exception):
+    """A transfer request that cannot be accepted; step names the failed check."""
+
+    def __init__(self, step, message, status_code=400, errors=None):
+        super().__init__(message)
+        self.step = step
+        self.status_code = status_code
+        self.errors = errors
+
+
+def validate_requested(event):
+    """True for ?validate=true: check the transfer against the agent's carriers and books first."""
+    value = (event.get("queryStringParameters") or {}).get("validate")
+    return value is not None and value.lower() in ("true", "1")
+
+
+def _validation_payload(body, agent_profile, carrier_ids):
+    # The POST /ats/agents/{npn}/validate payload, read from a CreateTransferRequest
+    consent = body.get("consent") or {}
+    selected_book_ids = body.get("selectedBookIds")
+    if selected_book_ids is None:
+        # Default: the agent's books with the carriers the transfer goes to
+        selected_book_ids = [
+            book["bookId"]
+            for book in agent_profile.get("bookOfBusiness", [])
+            if book.get("carrierId") in carrier_ids
+        ]
     return {
-        "statusCode": status_code,
-        "headers": {
-            "Content-Type": "application/json",
-            "Access-Control-Allow-Origin": "*",
-            "Access-Control-Allow-Headers": "Content-Type,Idempotency-Key",
+        "agentNpn": (body.get("agent") or {}).get("npn"),
+        "targetImo": body.get("receivingImo") or {},
+        "selectedCarrierIds": carrier_ids,
+        "selectedBookIds": selected_book_ids,
+        "effectiveDate": body.get("effectiveDate"),
+        "attestation": {
+            "agentApproved": consent.get("agentAttestation"),
+            "acknowledgedAt": consent.get("acknowledgedAt"),
         },
-        "body": json.dumps({"error": {"step": step, "message": message}}),
+        "requirementAnswers": body.get("requirementAnswers") or {},
     }
 
 
+def build_transfer(body, idempotency_key=None, validate=False):
+    """
+    Turns a CreateTransferRequest body into (transfer item, agent record,
+    carriers). Shared with create_transfers_batch; raises TransferRejected.
+
+    With validate=True the agent must be known and the transfer must pass the
+    POST /ats/agents/{npn}/validate rules (validate_payload), all in memory
+    against the agent record, before anything is written or forwarded.
+    """
+    try:
+        check("CreateTransferRequest", body)
+    except InvalidRequest as e:
+        raise TransferRejected("validate_request", str(e)) from None
+
+    # Agent (required)
+    agent = body.get("agent", {})
+    agent_npn = agent.get("npn")  # Required: National Producer Number
+    agent_first_name = agent.get("firstName")  # Optional
+    agent_last_name = agent.get("lastName")  # Optional
+
+    # Releasing IMO (required)
+    releasing_imo = body.get("releasingImo", {})
+    releasing_imo_fein = releasing_imo.get("fein")  # Required: Business FEIN
+    releasing_imo_name = releasing_imo.get("name")  # Required
+
+    # Receiving IMO (required)
+    receiving_imo = body.get("receivingImo", {})
+    receiving_imo_fein = receiving_imo.get("fein")  # Required: Business FEIN
+    receiving_imo_name = receiving_imo.get("name")  # Required
+
+    # Transfer details
+    effective_date = body.get(
+        "effectiveDate"
+    )  # Required: target date for hierarchy/commission realignment (YYYY-MM-DD)
+
+    # Consent (required)
+    consent = body.get("consent", {})
+    agent_attestation = consent.get(
+        "agentAttestation"
+    )  # Required: True if agent has authorized this transfer
+    e_signature_ref = consent.get(
+        "eSignatureRef"
+    )  # Optional: reference to e-signature artifact
+
+    # Optional notes
+    notes = body.get(
+        "notes"
+    )  # Optional: free text for carrier processing (max 2000 chars)
+
+    # Carriers (optional)
+    selected_carrier_ids = body.get(
+        "selectedCarrierIds"
+    )  # Optional: default is every carrier the agent is licensed with
+
+    if selected_carrier_ids is not None and not isinstance(selected_carrier_ids, list):
+        raise TransferRejected("route_carriers", "selectedCarrierIds must be an array")
+
+    agent_profile = get_agent_by_npn(agent_npn)
+    if validate and agent_profile is None:
+        raise TransferRejected("validate", f"Agent with NPN '{agent_npn}' was not found.", 404)
+
+    carriers, rejected = route_carriers(agent_profile, selected_carrier_ids)
+    if rejected:
+        raise TransferRejected(
+            "route_carriers",
+            "; ".join(f"{cid}: {reason}" for cid, reason in rejected.items()),
+        )
+    if not carriers:
+        raise TransferRejected("route_carriers", "no eligible carriers for this transfer")
+    carrier_ids = [carrier["carrierId"] for carrier in carriers]
+
+    if validate:
+        errors = validate_payload(_validation_payload(body, agent_profile, carrier_ids), agent_profile)
+        if errors:
+            raise TransferRejected("validate", "; ".join(errors), errors=errors)
+
+    key = f"{receiving_imo_fein}-{releasing_imo_fein}-{agent_npn}"
+
+    item = {
+        "id": key,
+        "state": "SUBMITTED",
+        "agentNpn": agent_npn,
+        "agentFirstName": agent_first_name,
+        "agentLastName": agent_last_name,
+        "releasingImoFein": releasing_imo_fein,
+        "releasingImoName": releasing_imo_name,
+        "receivingImoFein": receiving_imo_fein,
+        "receivingImoName": receiving_imo_name,
+        "effectiveDate": effective_date,
+        "agentAttestation": agent_attestation,
+        "eSignatureRef": e_signature_ref,
+        "notes": notes,
+        "idempotencyKey": idempotency_key,
+        "carrierIds": carrier_ids,
+    }
+
+    # Remove None values so DynamoDB doesn't reject them
+    item = {k: v for k, v in item.items() if v is not None}
+
+    agent_record = {"npn": agent_npn}
+    if agent_first_name:
+        agent_record["firstName"] = agent_first_name
+    if agent_last_name:
+        agent_record["lastName"] = agent_last_name
+
+    return item, agent_record, carriers
+
+
+@measure_cold_start
+@traced
+@emit_metrics
 def lambda_handler(event, context):
     try:
         # Headers
@@ -63,85 +199,57 @@ def lambda_handler(event, context):
         )  # Optional: safely retry POST without creating duplicates
 
         # Request body
-        body = json.loads(event.get("body") or "{}")
-
-        # Agent (required)
-        agent = body.get("agent", {})
-        agent_npn = agent.get("npn")  # Required: National Producer Number
-        agent_first_name = agent.get("firstName")  # Optional
-        agent_last_name = agent.get("lastName")  # Optional
-
-        # Releasing IMO (required)
-        releasing_imo = body.get("releasingImo", {})
-        releasing_imo_fein = releasing_imo.get("fein")  # Required: Business FEIN
-        releasing_imo_name = releasing_imo.get("name")  # Required
-
-        # Receiving IMO (required)
-        receiving_imo = body.get("receivingImo", {})
-        receiving_imo_fein = receiving_imo.get("fein")  # Required: Business FEIN
-        receiving_imo_name = receiving_imo.get("name")  # Required
-
-        # Transfer details
-        effective_date = body.get(
-            "effectiveDate"
-        )  # Required: target date for hierarchy/commission realignment (YYYY-MM-DD)
-
-        # Consent (required)
-        consent = body.get("consent", {})
-        agent_attestation = consent.get(
-            "agentAttestation"
-        )  # Required: True if agent has authorized this transfer
-        e_signature_ref = consent.get(
-            "eSignatureRef"
-        )  # Optional: reference to e-signature artifact
-
-        # Optional notes
-        notes = body.get(
-            "notes"
-        )  # Optional: free text for carrier processing (max 2000 chars)
-
-        key = f"{receiving_imo_fein}-{releasing_imo_fein}-{agent_npn}"
-
-        item = {
-            "id": key,
-            "state": "SUBMITTED",
-            "agentNpn": agent_npn,
-            "agentFirstName": agent_first_name,
-            "agentLastName": agent_last_name,
-            "releasingImoFein": releasing_imo_fein,
-            "releasingImoName": releasing_imo_name,
-            "receivingImoFein": receiving_imo_fein,
-            "receivingImoName": receiving_imo_name,
-            "effectiveDate": effective_date,
-            "agentAttestation": agent_attestation,
-            "eSignatureRef": e_signature_ref,
-            "notes": notes,
-            "idempotencyKey": idempotency_key,
-        }
-
-        # Remove None values so DynamoDB doesn't reject them
-        item = {k: v for k, v in item.items() if v is not None}
+        try:
+            body = parse_body(event)
+        except (ValueError, binascii.Error):
+            return _error_response(400, "parse_body", "request body must be JSON")
+
+        try:
+            item, agent_record, carriers = build_transfer(body, idempotency_key, validate_requested(event))
+        except TransferRejected as e:
+            return _error_response(e.status_code, e.step, str(e), e.errors)
+
+        # Per receiving IMO, so one IMO's bulk move cannot crowd out the others
+        retry_after = admit(FEIN_SCOPE, item["receivingImoFein"])
+        if retry_after:
+            return _error_response(
+                429,
+                "admission",
+                f"too many transfers for receiving IMO {item['receivingImoFein']}; retry later",
+                headers=retry_after_header(retry_after),
+            )
+
+        key = item["id"]
+        carrier_ids = item["carrierIds"]
+        agent_npn = item["agentNpn"]
+        releasing_imo_fein = item.get("releasingImoFein")
+        receiving_imo_fein = item.get("receivingImoFein")
 
         try:
-            table.put_item(Item=item)
+            with timed_step("dynamo_put_transfer"):
+                table.put_item(Item=item)
         except Exception as e:
             return _error_response(500, "dynamo_put_transfer", str(e))
 
-        agent_record = {"npn": agent_npn}
-        if agent_first_name:
-            agent_record["firstName"] = agent_first_name
-        if agent_last_name:
-            agent_record["lastName"] = agent_last_name
         try:
-            agent_table.put_item(Item=agent_record)
+            with timed_step("dynamo_put_agent"):
+                previous = agent_table.put_item(Item=agent_record, ReturnValues="ALL_OLD").get("Attributes")
         except Exception as e:
             return _error_response(500, "dynamo_put_agent", str(e))
 
+        # Status and contract reads show agent names, so a rename changes their ETags
+        if versions_table is not None and agent_names(previous) != agent_names(agent_record):
+            try:
+                bump_agent_names(versions_table)
+            except Exception as e:
+                logger.error("Agent names version bump failed for npn=%s: %s", agent_npn, str(e))
+
         forward_errors = {}
         status_warnings = {}
-        for url, carrier_id in zip(forward_apis, carrier_ids):
+        for carrier in carriers:
+            carrier_id, url = carrier["carrierId"], carrier["endpoint"]
             logger.info("Forwarding transfer to carrier=%s url=%s", carrier_id, url)
-            # error_status, forward_body = forward_to_api(body, url)
+            # error_status, forward_body = carrier_client.forward_to_api(body, url, carrier_id)
             error_status = None
             forward_body = None
             if error_status is not None:
@@ -158,7 +266,7 @@ def lambda_handler(event, context):
                 continue
 
             if SET_STATUS_URL:
-                status_payload = json.dumps(
+                status_payload = dumps_bytes(
                     {
                         "receivingFein": receiving_imo_fein,
                         "releasingFein": releasing_imo_fein,
@@ -166,15 +274,19 @@ def lambda_handler(event, context):
                         "status": "INITIATED",
                         "npn": agent_npn,
                     }
-                ).encode("utf-8")
-                status_req = urllib.request.Request(
-                    SET_STATUS_URL,
-                    data=status_payload,
-                    headers={"Content-Type": "application/json"},
-                    method="POST",
                 )
                 try:
-                    urllib.request.urlopen(status_req)
+                    with (
+                        timed_step("set_status", carrier=carrier_id),
+                        client_span("POST set_status", SET_STATUS_URL, {"ats.carrier_id": carrier_id}) as span,
+                    ):
+                        status_req = urllib.request.Request(
+                            SET_STATUS_URL,
+                            data=status_payload,
+                            headers={"Content-Type": "application/json", **span.headers()},
+                            method="POST",
+                        )
+                        urllib.request.urlopen(status_req)
                 except urllib.error.HTTPError as e:
                     error_body = e.read().decode("utf-8")
                     logger.error(
@@ -193,39 +305,24 @@ def lambda_handler(event, context):
                     )
                     status_warnings[carrier_id] = {"status": 502, "message": str(e)}
 
-        if len(forward_errors) == len(forward_apis):
+        if len(forward_errors) == len(carriers):
             first_carrier, first_error = next(iter(forward_errors.items()))
             return _error_response(
                 first_error["status"], f"forward_{first_carrier}", first_error["body"]
             )
 
-        response_body = {"id": key, "state": "SUBMITTED"}
+        response_body = {"id": key, "state": "SUBMITTED", "carrierIds": carrier_ids}
         if status_warnings:
             response_body["warnings"] = {
                 carrier_id: f"set_status failed — {w['status']}: {w['message']}"
                 for carrier_id, w in status_warnings.items()
             }
 
-        return {
-            "statusCode": 201,
-            "headers": {
-                "Content-Type": "application/json",
-                "Location": f"/ats/v1/transfers/{key}",
-                "Access-Control-Allow-Origin": "*",
-                "Access-Control-Allow-Headers": "Content-Type,Idempotency-Key",
-            },
-            "body": json.dumps(response_body),
-        }
+        return json_response(
+            201, response_body, headers={"Location": f"/ats/v1/transfers/{key}"}
+        )
 
     except Exception:
         tb = traceback.format_exc()
         logger.error("Unhandled exception: %s", tb)
-        return {
-            "statusCode": 500,
-            "headers": {
-                "Content-Type": "application/json",
-                "Access-Control-Allow-Origin": "*",
-                "Access-Control-Allow-Headers": "Content-Type,Idempotency-Key",
-            },
-            "body": json.dumps({"error": {"step": "unhandled", "message": tb}}),
-        }
+        return json_response(500, {"error": {"step": "unhandled", "message": tb}})
@@ -0,0 +1,261 @@
+import binascii
+import logging
+import math
+import os
+import traceback
+from collections import defaultdict
+
+from admission import FEIN_SCOPE, admit
+from api_responses import json_response, parse_body
+from aws_clients import dynamodb_resource, lazy_table
+from change_feed import STATUS_STREAM, append_changes
+from coldstart import measure_cold_start
+from create_transfer import TransferRejected, build_transfer, validate_requested
+from emf_metrics import emit_metrics, timed_step
+from fein_versions import agent_names, bump_agent_names, bump_version
+from status_history import put_statuses
+from tracing import traced
+
+# POST /ats/v1/transfers:batch — submit a whole team's transfers at once.
+#
+# Each entry of `transfers` is a CreateTransferRequest, validated and routed
+# exactly as POST /ats/v1/transfers does. Accepted transfers and their agents
+# (one upsert per NPN however many transfers name it) are written with
+# BatchWriteItem (25 items per call). The per-carrier INITIATED statuses go
+# through status_history.put_statuses, like POST /ats/v1/status:batch: each
+# with its history entry and pipeline counter change, up to 100 writes per
+# transaction. So 500 transfers cost a few dozen DynamoDB round trips instead
+# of one put plus one set_status HTTP call per transfer per carrier. The
+# change feed and FEIN version are touched once per receiving FEIN, and the
+# agent names version once if any agent's name changes. Nothing is sent to
+# the carriers here; that happens on release.
+#
+# Every entry gets a result in request order: 201 with the transfer id and
+# carriers, or 400 / 409 with the step that rejected it. A batch with some
+# rejected entries still returns 200; only an unreadable batch is a 400.
+# Entries for a receiving IMO over its admission limit (admission.py) are
+# 429s with retryAfterSeconds; the IMO's entries are charged as one take.
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+table = lazy_table(os.environ["TRANSFERS_TABLE"])
+agent_table = lazy_table(os.environ["AGENT_TABLE"])
+status_table = lazy_table(os.environ["STATUS_TABLE"])
+
+feed_table = lazy_table(os.environ.get("CHANGE_FEED_TABLE"))
+versions_table = lazy_table(os.environ.get("VERSIONS_TABLE"))
+
+MAX_BATCH_TRANSFERS = int(os.environ.get("MAX_BATCH_TRANSFERS", 500))
+BATCH_GET_SIZE = 100  # BatchGetItem limit
+
+
+def _error_response(status_code, step, message):
+    logger.error("step=%s error=%s", step, message)
+    return json_response(status_code, {"error": {"step": step, "message": message}})
+
+
+def _rejected(index, status_code, step, message, errors=None, retry_after_seconds=None):
+    error = {"step": step, "message": message}
+    if errors:
+        error["errors"] = errors
+    if retry_after_seconds is not None:
+        error["retryAfterSeconds"] = retry_after_seconds
+    return {"index": index, "status": status_code, "error": error}
+
+
+def _merge_agent(agents, agent_record):
+    # Later entries fill in names earlier ones left out
+    existing = agents.get(agent_record["npn"])
+    agents[agent_record["npn"]] = {**existing, **agent_record} if existing else agent_record
+
+
+def _agent_names_changed(agents):
+    """Whether upserting these agent records renames (or un-names) any stored agent."""
+    records = list(agents.values())
+    for start in range(0, len(records), BATCH_GET_SIZE):
+        chunk = records[start:start + BATCH_GET_SIZE]
+        request = {
+            agent_table.name: {
+                "Keys": [{"npn": record["npn"]} for record in chunk],
+                "ProjectionExpression": "npn, firstName, lastName",
+            }
+        }
+        response = dynamodb_resource().batch_get_item(RequestItems=request)
+        if response.get("UnprocessedKeys"):
+            return True  # unknown, so assume a rename rather than serve a stale 304
+        stored = {agent["npn"]: agent for agent in response["Responses"].get(agent_table.name, [])}
+        if any(agent_names(stored.get(record["npn"])) != agent_names(record) for record in chunk):
+            return True
+    return False
+
+
+def _status_item(transfer, carrier_id):
+    npn = transfer["agentNpn"]
+    releasing_fein = transfer["releasingImoFein"]
+    return {
+        "receivingFein": transfer["receivingImoFein"],
+        "statusKey": f"{carrier_id}#{npn}#{releasing_fein}",
+        "releasingFein": releasing_fein,
+        "carrierId": carrier_id,
+        "status": "INITIATED",
+        "npn": npn,
+    }
+
+
+@measure_cold_start
+@traced
+@emit_metrics
+def lambda_handler(event, context):
+    try:
+        headers = event.get("headers") or {}
+        idempotency_key = headers.get(
+            "Idempotency-Key"
+        )  # Optional: applied to every transfer in the batch
+
+        validate = validate_requested(event)  # Optional: ?validate=true checks every entry first
+        try:
+            body = parse_body(event)
+        except (ValueError, binascii.Error):
+            return _error_response(400, "parse_body", "request body must be JSON")
+        if not isinstance(body, dict):
+            return _error_response(400, "parse_batch", "body must be an object with a transfers array")
+        entries = body.get("transfers")  # Required: array of CreateTransferRequest
+
+        if not isinstance(entries, list) or not entries:
+            return _error_response(400, "parse_batch", "transfers must be a non-empty array")
+        if len(entries) > MAX_BATCH_TRANSFERS:
+            return _error_response(
+                400, "parse_batch", f"at most {MAX_BATCH_TRANSFERS} transfers per batch"
+            )
+
+        results = [None] * len(entries)
+        accepted = {}  # transfer id -> (index, item)
+        built = []  # (index, item, agent record, carriers) for each accepted entry
+        agents = {}  # npn -> agent record
+        status_entries = []  # (transfer item, carrier id) for each INITIATED status
+
+        for index, entry in enumerate(entries):
+            if not isinstance(entry, dict):
+                results[index] = _rejected(index, 400, "parse_batch", "transfer must be an object")
+                continue
+            try:
+                item, agent_record, carriers = build_transfer(entry, idempotency_key, validate)
+            except TransferRejected as e:
+                results[index] = _rejected(index, e.status_code, e.step, str(e), e.errors)
+                continue
+            if item["id"] in accepted:
+                first_index, _ = accepted[item["id"]]
+                results[index] = _rejected(
+                    index, 409, "deduplicate", f"same transfer as transfers[{first_index}]"
+                )
+                continue
+
+            accepted[item["id"]] = (index, item)
+            built.append((index, item, agent_record, carriers))
+
+        # Admission per receiving IMO, one bucket take for all of its entries
+        by_fein = defaultdict(list)
+        for entry_built in built:
+            by_fein[entry_built[1]["receivingImoFein"]].append(entry_built)
+        for fein, fein_entries in by_fein.items():
+            retry_after = admit(FEIN_SCOPE, fein, cost=len(fein_entries))
+            for index, item, agent_record, carriers in fein_entries:
+                if retry_after:
+                    del accepted[item["id"]]
+                    results[index] = _rejected(
+                        index,
+                        429,
+                        "admission",
+                        f"too many transfers for receiving IMO {fein}; retry later",
+                        retry_after_seconds=math.ceil(retry_after),
+                    )
+                    continue
+                _merge_agent(agents, agent_record)
+                for carrier in carriers:
+                    status_entries.append((item, carrier["carrierId"]))
+
+        try:
+            with timed_step("dynamo_batch_put_transfers"):
+                with table.batch_writer() as batch:
+                    for _, item in accepted.values():
+                        batch.put_item(Item=item)
+        except Exception as e:
+            return _error_response(500, "dynamo_batch_put_transfers", str(e))
+
+        try:
+            with timed_step("dynamo_batch_put_agents"):
+                renamed = versions_table is not None and _agent_names_changed(agents)
+                with agent_table.batch_writer() as batch:
+                    for agent_record in agents.values():
+                        batch.put_item(Item=agent_record)
+        except Exception as e:
+            return _error_response(500, "dynamo_batch_put_agents", str(e))
+
+        # Status and contract reads show agent names, so a rename changes their ETags
+        if renamed:
+            try:
+                bump_agent_names(versions_table)
+            except Exception as e:
+                logger.error("Agent names version bump failed: %s", str(e))
+
+        # INITIATED statuses, with their history and counters
+        status_warnings = {}  # (transfer id, carrier id) -> reason
+        changes = defaultdict(list)  # receiving FEIN -> change feed entries
+        status_items = [_status_item(item, carrier_id) for item, carrier_id in status_entries]
+        try:
+            with timed_step("dynamo_batch_put_status"):
+                written = put_statuses(status_table, status_items)
+        except Exception as e:
+            logger.error("Status writes failed for %d statuses: %s", len(status_items), str(e))
+            written = [None] * len(status_items)
+            failure = str(e)
+        else:
+            failure = "the status could not be written; set it again"
+        for (item, carrier_id), new in zip(status_entries, written):
+            if new is None:
+                status_warnings[(item["id"], carrier_id)] = failure
+            else:
+                changes[new["receivingFein"]].append(("UPSERT", new))
+
+        with timed_step("publish_status_changes"):
+            for receiving_fein, fein_changes in changes.items():
+                if feed_table is not None:
+                    append_changes(feed_table, STATUS_STREAM, receiving_fein, fein_changes)
+                if versions_table is not None:
+                    bump_version(versions_table, STATUS_STREAM, receiving_fein)
+
+        for index, item in accepted.values():
+            result = {
+                "index": index,
+                "status": 201,
+                "id": item["id"],
+                "state": item["state"],
+                "carrierIds": item["carrierIds"],
+            }
+            warnings = {
+                cid: f"set_status failed — {status_warnings[(item['id'], cid)]}"
+                for cid in item["carrierIds"]
+                if (item["id"], cid) in status_warnings
+            }
+            if warnings:
+                result["warnings"] = warnings
+            results[index] = result
+
+        logger.info(
+            "Batch submitted=%d rejected=%d agents=%d statuses=%d",
+            len(accepted), len(entries) - len(accepted), len(agents), len(status_entries),
+        )
+        return json_response(
+            200,
+            {
+                "submitted": len(accepted),
+                "rejected": len(entries) - len(accepted),
+                "results": results,
+            },
+        )
+
+    except Exception:
+        tb = traceback.format_exc()
+        logger.error("Unhandled exception: %s", tb)
+        return json_response(500, {"error": {"step": "unhandled", "message": tb}})
@@ -0,0 +1,211 @@
+import contextlib
+import contextvars
+import functools
+import json
+import os
+import time
+
+from tracing import current_correlation_id
+
+# Per-request latency metrics in CloudWatch Embedded Metric Format (EMF).
+#
+# Every handler is wrapped in @emit_metrics, which prints one EMF line per
+# invocation to stdout (CloudWatch Logs turns it into metrics; offline it is
+# just a JSON log line):
+#   {"_aws": {...}, "Route": "create_transfer", "Latency": 84.2, "Fault": 0,
+#    "DynamoDBCalls": 2, "DynamoDBReadCapacity": 0, "DynamoDBWriteCapacity": 2.0,
+#    "statusCode": 201, "requestId": "...", "correlationId": "..."}
+# plus one line per `with timed_step(...)` block, dimensioned by Route, Step
+# and (when given) Carrier, with the step's latency and DynamoDB calls, and
+# one line per put_metrics(...) call (e.g. carrier batch sizes).
+#
+# DynamoDB calls and consumed capacity are counted by botocore hooks that
+# aws_clients attaches to the shared client. ATS_METRICS=0 turns it all off.
+
+ATS_METRICS = os.environ.get("ATS_METRICS", "1") == "1"
+METRICS_NAMESPACE = os.environ.get("ATS_METRICS_NAMESPACE", "ATS")
+
+_READ_OPERATIONS = {"GetItem", "BatchGetItem", "Query", "Scan", "TransactGetItems"}
+_CAPACITY_OPERATIONS = _READ_OPERATIONS | {
+    "PutItem",
+    "UpdateItem",
+    "DeleteItem",
+    "BatchWriteItem",
+    "TransactWriteItems",
+}
+
+_current = contextvars.ContextVar("ats_metrics_invocation", default=None)
+
+
+class _Invocation:
+    __slots__ = ("route", "steps", "metrics", "dynamodb_calls", "read_capacity", "write_capacity")
+
+    def __init__(self, route):
+        self.route = route
+        self.steps = []
+        self.metrics = []
+        self.dynamodb_calls = 0
+        self.read_capacity = 0.0
+        self.write_capacity = 0.0
+
+
+def _metric_document(dimensions, metrics, values):
+    return {
+        "_aws": {
+            "Timestamp": int(time.time() * 1000),
+            "CloudWatchMetrics": [
+                {
+                    "Namespace": METRICS_NAMESPACE,
+                    "Dimensions": [list(dimensions)],
+                    "Metrics": [{"Name": name, "Unit": unit} for name, unit in metrics],
+                }
+            ],
+        },
+        **dimensions,
+        **values,
+    }
+
+
+def _flush(invocation, latency_ms, status_code, request_id):
+    lines = [
+        _metric_document(
+            {"Route": invocation.route},
+            [
+                ("Latency", "Milliseconds"),
+                ("Fault", "Count"),
+                ("DynamoDBCalls", "Count"),
+                ("DynamoDBReadCapacity", "Count"),
+                ("DynamoDBWriteCapacity", "Count"),
+            ],
+            {
+                "Latency": latency_ms,
+                "Fault": int(status_code is None or status_code >= 500),
+                "DynamoDBCalls": invocation.dynamodb_calls,
+                "DynamoDBReadCapacity": invocation.read_capacity,
+                "DynamoDBWriteCapacity": invocation.write_capacity,
+                "statusCode": status_code,
+                "requestId": request_id,
+                "correlationId": current_correlation_id(),
+            },
+        )
+    ]
+    for step, carrier, step_ms, dynamodb_calls in invocation.steps:
+        dimensions = {"Route": invocation.route, "Step": step}
+        if carrier:
+            dimensions["Carrier"] = carrier
+        lines.append(
+            _metric_document(
+                dimensions,
+                [("StepLatency", "Milliseconds"), ("StepDynamoDBCalls", "Count")],
+                {"StepLatency": step_ms, "StepDynamoDBCalls": dynamodb_calls},
+            )
+        )
+    for carrier, values in invocation.metrics:
+        dimensions = {"Route": invocation.route}
+        if carrier:
+            dimensions["Carrier"] = carrier
+        lines.append(
+            _metric_document(
+                dimensions,
+                [(name, unit) for name, (_, unit) in values.items()],
+                {name: value for name, (value, _) in values.items()},
+            )
+        )
+    print("\n".join(json.dumps(line, separators=(",", ":")) for line in lines), flush=True)
+
+
+def emit_metrics(handler):
+    if not ATS_METRICS:
+        return handler
+
+    route = handler.__module__.rsplit(".", 1)[-1]
+
+    @functools.wraps(handler)
+    def wrapper(event, context):
+        invocation = _Invocation(route)
+        token = _current.set(invocation)
+        started = time.perf_counter()
+        status_code = None
+        try:
+            response = handler(event, context)
+            if isinstance(response, dict):
+                status_code = response.get("statusCode")
+            return response
+        finally:
+            _current.reset(token)
+            _flush(
+                invocation,
+                round((time.perf_counter() - started) * 1000, 2),
+                status_code,
+                getattr(context, "aws_request_id", None),
+            )
+
+    return wrapper
+
+
+@contextlib.contextmanager
+def timed_step(step, carrier=None):
+    """Time the enclosed block as one named step of the current request."""
+    invocation = _current.get()
+    if invocation is None:
+        yield
+        return
+
+    calls_before = invocation.dynamodb_calls
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        invocation.steps.append(
+            (
+                step,
+                carrier,
+                round((time.perf_counter() - started) * 1000, 2),
+                invocation.dynamodb_calls - calls_before,
+            )
+        )
+
+
+def put_metrics(values, carrier=None):
+    """
+    Record extra metrics for the current request, as {name: (value, unit)};
+    flushed with the Route (and Carrier) dimensions.
+    """
+    invocation = _current.get()
+    if invocation is not None:
+        invocation.metrics.append((carrier, values))
+
+
+# ---------------------------------------------------------------------------
+# botocore hooks (attached by aws_clients.dynamodb_resource)
+# ---------------------------------------------------------------------------
+
+
+def _request_consumed_capacity(params, model, **kwargs):
+    if ATS_METRICS and model.name in _CAPACITY_OPERATIONS:
+        params.setdefault("ReturnConsumedCapacity", "TOTAL")
+
+
+def _record_dynamodb_call(parsed, model, **kwargs):
+    invocation = _current.get()
+    if invocation is None:
+        return
+
+    invocation.dynamodb_calls += 1
+    consumed = parsed.get("ConsumedCapacity") if isinstance(parsed, dict) else None
+    if not consumed:
+        return
+
+    units = sum(
+        float(entry.get("CapacityUnits", 0))
+        for entry in (consumed if isinstance(consumed, list) else [consumed])
+    )
+    if model.name in _READ_OPERATIONS:
+        invocation.read_capacity += units
+    else:
+        invocation.write_capacity += units
+
+
+def attach_dynamodb_hooks(events):
+    events.register("before-parameter-build.dynamodb", _request_consumed_capacity)
+    events.register("after-call.dynamodb", _record_dynamodb_call)
@@ -0,0 +1,67 @@
+# Per-FEIN version counters behind the ETag / If-None-Match handling on
+# GET /ats/v1/status/{fein} and GET /ats/v1/contracts/{fein}.
+#   versionKey=status#98-7654321     version=17
+#   versionKey=contracts#12-3456789  version=4
+# Write paths bump the counter with an atomic ADD after their own write; reads
+# fetch it with one GetItem and answer 304 when the client already has it.
+#
+# Both responses also carry agent names from Agents, which is not per FEIN, so
+# their ETag includes one more counter that agent writes bump when a name
+# changes:
+#   versionKey=agents#names          version=9
+#   ETag: "contracts-12-3456789-4.9"
+
+from api_responses import request_header
+
+AGENT_NAMES_KEY = "agents#names"
+
+
+def bump_version(versions_table, stream, fein):
+    versions_table.update_item(
+        Key={"versionKey": f"{stream}#{fein}"},
+        UpdateExpression="ADD version :one",
+        ExpressionAttributeValues={":one": 1},
+    )
+
+
+def get_version(versions_table, stream, fein):
+    response = versions_table.get_item(
+        Key={"versionKey": f"{stream}#{fein}"},
+        ProjectionExpression="version",
+    )
+    return int((response.get("Item") or {}).get("version", 0))
+
+
+def agent_names(agent):
+    return ((agent or {}).get("firstName"), (agent or {}).get("lastName"))
+
+
+def bump_agent_names(versions_table):
+    versions_table.update_item(
+        Key={"versionKey": AGENT_NAMES_KEY},
+        UpdateExpression="ADD version :one",
+        ExpressionAttributeValues={":one": 1},
+    )
+
+
+def make_etag(stream, fein, version, agent_names_version=0):
+    return f'"{stream}-{fein}-{version}.{agent_names_version}"'
+
+
+def current_etag(versions_table, stream, fein):
+    """ETag for a FEIN's (agent-enriched) list: its version and the agent names version."""
+    agent_names = versions_table.get_item(Key={"versionKey": AGENT_NAMES_KEY}, ProjectionExpression="version")
+    return make_etag(
+        stream,
+        fein,
+        get_version(versions_table, stream, fein),
+        int((agent_names.get("Item") or {}).get("version", 0)),
+    )
+
+
+def etag_matches(event, etag):
+    if_none_match = request_header(event, "If-None-Match")
+    if not if_none_match:
+        return False
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return "*" in candidates or etag in candidates
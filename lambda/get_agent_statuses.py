@@ -0,0 +1,26 @@
+import os
+
+from api_responses import error_response, json_response
+from aws_clients import lazy_table
+from coldstart import measure_cold_start
+from emf_metrics import emit_metrics, timed_step
+from status_history import query_by_npn
+from tracing import traced
+
+table = lazy_table(os.environ["STATUS_TABLE"])
+
+
+@measure_cold_start
+@traced
+@emit_metrics
+def lambda_handler(event, context):
+    npn = (event.get("queryStringParameters") or {}).get("npn")
+
+    if not npn:
+        return error_response(400, "MISSING_NPN", "npn query parameter is required")
+
+    # Every carrier status for the agent, across receiving FEINs, from the npn GSI
+    with timed_step("dynamo_query_status_by_npn"):
+        items = query_by_npn(table, npn)
+
+    return json_response(200, items, event=event)
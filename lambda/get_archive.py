@@ -0,0 +1,76 @@
+import os
+from datetime import date
+
+from api_responses import error_response, json_response
+from archive_store import KINDS, STATUS_KIND, InvalidToken, open_archive, read_records
+from coldstart import measure_cold_start
+from emf_metrics import emit_metrics, timed_step
+from tracing import traced
+
+store = open_archive(os.environ.get("ARCHIVE_BUCKET"), os.environ.get("ARCHIVE_DIR"))
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+
+# Query parameter -> attribute, per kind
+FILTERS = {
+    "status": {"npn": "npn", "carrierId": "carrierId", "status": "status"},
+    "transfers": {"npn": "agentNpn", "releasingFein": "releasingImoFein", "state": "state"},
+}
+
+
+def _date(value, name):
+    if value is None:
+        return None
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"{name} must be a date (YYYY-MM-DD)") from None
+
+
+@measure_cold_start
+@traced
+@emit_metrics
+def lambda_handler(event, context):
+    fein = (event.get("pathParameters") or {}).get("fein")  # Required: receiving FEIN
+    query = event.get("queryStringParameters") or {}
+
+    kind = query.get("kind", STATUS_KIND)  # Optional: status | transfers
+    token = query.get("nextToken")  # Optional: from the previous page
+
+    if not fein:
+        return error_response(400, "MISSING_FEIN", "fein path parameter is required")
+    if store is None:
+        return error_response(400, "ARCHIVE_DISABLED", "the archive is not configured", event=event)
+    if kind not in KINDS:
+        return error_response(400, "INVALID_KIND", f"kind must be one of: {', '.join(KINDS)}")
+
+    try:
+        # from / to: the days records were archived on, inclusive
+        date_from = _date(query.get("from"), "from")
+        date_to = _date(query.get("to"), "to")
+    except ValueError as e:
+        return error_response(400, "INVALID_DATE", str(e))
+    try:
+        limit = int(query.get("limit", DEFAULT_LIMIT))
+    except ValueError:
+        return error_response(400, "INVALID_LIMIT", "limit must be an integer")
+    if not 1 <= limit <= MAX_LIMIT:
+        return error_response(400, "INVALID_LIMIT", f"limit must be between 1 and {MAX_LIMIT}")
+
+    wanted = {attribute: query[name] for name, attribute in FILTERS[kind].items() if query.get(name)}
+
+    def match(record):
+        return all(record.get(attribute) == value for attribute, value in wanted.items())
+
+    try:
+        with timed_step("archive_read"):
+            records, next_token = read_records(
+                store, kind, fein, date_from, date_to, match=match if wanted else None, limit=limit, token=token
+            )
+    except InvalidToken as e:
+        return error_response(400, "INVALID_TOKEN", str(e))
+
+    return json_response(
+        200, {"fein": fein, "kind": kind, "records": records, "nextToken": next_token}, event=event
+    )
@@ -0,0 +1,24 @@
+import os
+
+from api_responses import error_response, json_response
+from aws_clients import lazy_table
+from coldstart import measure_cold_start
+from contract_aggregates import get_summary
+from emf_metrics import emit_metrics
+from tracing import traced
+
+aggregates_table = lazy_table(os.environ["CONTRACT_AGGREGATES_TABLE"])
+
+
+@measure_cold_start
+@traced
+@emit_metrics
+def lambda_handler(event, context):
+    fein = (event.get("pathParameters") or {}).get("fein")
+
+    if not fein:
+        return error_response(400, "MISSING_FEIN", "fein path parameter is required")
+
+    summary = get_summary(aggregates_table, fein)
+
+    return json_response(200, summary)
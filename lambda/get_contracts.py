@@ -1,12 +1,21 @@
-import json
 import os
 
-import boto3
-from boto3.dynamodb.conditions import Attr
+from boto3.dynamodb.conditions import Key
 
-dynamodb = boto3.resource("dynamodb")
-table = dynamodb.Table(os.environ["CONTRACTS_TABLE"])
-agent_table = dynamodb.Table(os.environ["AGENT_TABLE"])
+from api_responses import error_response, json_response, respond
+from aws_clients import lazy_table
+from change_feed import CONTRACTS_STREAM, InvalidCursor, read_changes, snapshot_cursor
+from coldstart import measure_cold_start
+from contract_search import FEIN_INDEX, public
+from emf_metrics import emit_metrics
+from fein_versions import current_etag, etag_matches
+from tracing import traced
+
+table = lazy_table(os.environ["CONTRACTS_TABLE"])
+agent_table = lazy_table(os.environ["AGENT_TABLE"])
+
+feed_table = lazy_table(os.environ.get("CHANGE_FEED_TABLE"))
+versions_table = lazy_table(os.environ.get("VERSIONS_TABLE"))
 
 
 def get_agent(npn):
@@ -14,48 +23,74 @@ def get_agent(npn):
     return response.get("Item")
 
 
+def enrich(record):
+    npn = record.get("npn")
+    agent = get_agent(npn) if npn else None
+    return {
+        **record,
+        "agentFirstName": agent.get("firstName") if agent else None,
+        "agentLastName": agent.get("lastName") if agent else None,
+    }
+
+
+@measure_cold_start
+@traced
+@emit_metrics
 def lambda_handler(event, context):
     fein = (event.get("pathParameters") or {}).get("fein")
 
     if not fein:
-        return {
-            "statusCode": 400,
-            "headers": {
-                "Content-Type": "application/json",
-                "Access-Control-Allow-Origin": "*",
-                "Access-Control-Allow-Headers": "Content-Type,Idempotency-Key",
-            },
-            "body": json.dumps(
-                {"error": {"code": "MISSING_FEIN", "message": "fein path parameter is required"}}
-            ),
-        }
-
-    response = table.scan(FilterExpression=Attr("fein").eq(fein))
+        return error_response(400, "MISSING_FEIN", "fein path parameter is required")
+
+    since = (event.get("queryStringParameters") or {}).get("since")
+    if since is not None:
+        if feed_table is None:
+            return error_response(
+                400,
+                "CHANGE_FEED_DISABLED",
+                "since is not supported: change feed is not configured",
+                event=event,
+            )
+
+        try:
+            page = read_changes(feed_table, CONTRACTS_STREAM, fein, since)
+        except InvalidCursor as e:
+            return error_response(400, "INVALID_CURSOR", str(e), event=event)
+        for change in page["changes"]:
+            if change["op"] == "UPSERT":
+                change["item"] = enrich(change["item"])
+
+        return json_response(200, page, event=event)
+
+    # Read before the data so a write racing this request can only make the
+    # ETag stale (forcing a refetch next poll), never newer than the body
+    etag = None
+    if versions_table is not None:
+        etag = current_etag(versions_table, CONTRACTS_STREAM, fein)
+        if etag_matches(event, etag):
+            return respond(304, "", headers={"ETag": etag, "Access-Control-Expose-Headers": "ETag"})
+
+    # Taken before the read, and behind the writes still in flight, so a
+    # change landing mid-read is replayed, not lost
+    cursor = snapshot_cursor() if feed_table is not None else None
+
+    response = table.query(IndexName=FEIN_INDEX, KeyConditionExpression=Key("fein").eq(fein))
     raw_items = response["Items"]
 
     while "LastEvaluatedKey" in response:
-        response = table.scan(
-            FilterExpression=Attr("fein").eq(fein),
+        response = table.query(
+            IndexName=FEIN_INDEX,
+            KeyConditionExpression=Key("fein").eq(fein),
             ExclusiveStartKey=response["LastEvaluatedKey"],
         )
         raw_items.extend(response["Items"])
 
-    items = []
-    for contract in raw_items:
-        npn = contract.get("npn")
-        agent = get_agent(npn) if npn else None
-        items.append({
-            **contract,
-            "agentFirstName": agent.get("firstName") if agent else None,
-            "agentLastName": agent.get("lastName") if agent else None,
-        })
+    items = [enrich(public(contract)) for contract in raw_items]
 
-    return {
-        "statusCode": 200,
-        "headers": {
-            "Content-Type": "application/json",
-            "Access-Control-Allow-Origin": "*",
-            "Access-Control-Allow-Headers": "Content-Type,Idempotency-Key",
-        },
-        "body": json.dumps(items),
-    }
+    headers = {"Access-Control-Expose-Headers": "ETag,X-Change-Cursor"}
+    if etag:
+        headers["ETag"] = etag
+    if cursor:
+        headers["X-Change-Cursor"] = cursor
+
+    return json_response(200, items, event=event, headers=headers)
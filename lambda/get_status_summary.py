@@ -0,0 +1,25 @@
+import os
+
+from api_responses import error_response, json_response
+from aws_clients import lazy_table
+from coldstart import measure_cold_start
+from emf_metrics import emit_metrics, timed_step
+from pipeline_stats import get_pipeline_summary
+from tracing import traced
+
+stats_table = lazy_table(os.environ["PIPELINE_STATS_TABLE"])
+
+
+@measure_cold_start
+@traced
+@emit_metrics
+def lambda_handler(event, context):
+    fein = (event.get("pathParameters") or {}).get("fein")
+
+    if not fein:
+        return error_response(400, "MISSING_FEIN", "fein path parameter is required")
+
+    with timed_step("dynamo_query_pipeline_stats"):
+        summary = get_pipeline_summary(stats_table, fein)
+
+    return json_response(200, summary, event=event)
@@ -1,12 +1,19 @@
-import json
 import os
 
-import boto3
-from boto3.dynamodb.conditions import Key
+from api_responses import error_response, json_response, respond
+from aws_clients import lazy_table
+from change_feed import STATUS_STREAM, InvalidCursor, read_changes, snapshot_cursor
+from coldstart import measure_cold_start
+from emf_metrics import emit_metrics, timed_step
+from fein_versions import current_etag, etag_matches
+from status_shards import query_fein
+from tracing import traced
 
-dynamodb = boto3.resource("dynamodb")
-table = dynamodb.Table(os.environ["STATUS_TABLE"])
-agent_table = dynamodb.Table(os.environ["AGENT_TABLE"])
+table = lazy_table(os.environ["STATUS_TABLE"])
+agent_table = lazy_table(os.environ["AGENT_TABLE"])
+
+feed_table = lazy_table(os.environ.get("CHANGE_FEED_TABLE"))
+versions_table = lazy_table(os.environ.get("VERSIONS_TABLE"))
 
 
 def get_agent(npn):
@@ -14,47 +21,68 @@ def get_agent(npn):
     return response.get("Item")
 
 
+def enrich(record):
+    npn = record.get("npn")
+    agent = get_agent(npn) if npn else None
+    return {
+        **record,
+        "agentFirstName": agent.get("firstName") if agent else None,
+        "agentLastName": agent.get("lastName") if agent else None,
+    }
+
+
+@measure_cold_start
+@traced
+@emit_metrics
 def lambda_handler(event, context):
     fein = (event.get("pathParameters") or {}).get("fein")
 
     if not fein:
-        return {
-            "statusCode": 400,
-            "headers": {
-                "Content-Type": "application/json",
-                "Access-Control-Allow-Origin": "*",
-                "Access-Control-Allow-Headers": "Content-Type,Idempotency-Key",
-            },
-            "body": json.dumps(
-                {
-                    "error": {
-                        "code": "MISSING_FEIN",
-                        "message": "fein path parameter is required",
-                    }
-                }
-            ),
-        }
-
-    response = table.query(KeyConditionExpression=Key("receivingFein").eq(fein))
-
-    items = []
-    for status in response["Items"]:
-        npn = status.get("npn")
-        agent = get_agent(npn) if npn else None
-        items.append(
-            {
-                **status,
-                "agentFirstName": agent.get("firstName") if agent else None,
-                "agentLastName": agent.get("lastName") if agent else None,
-            }
-        )
+        return error_response(400, "MISSING_FEIN", "fein path parameter is required")
 
-    return {
-        "statusCode": 200,
-        "headers": {
-            "Content-Type": "application/json",
-            "Access-Control-Allow-Origin": "*",
-            "Access-Control-Allow-Headers": "Content-Type,Idempotency-Key",
-        },
-        "body": json.dumps(items),
-    }
+    since = (event.get("queryStringParameters") or {}).get("since")
+    if since is not None:
+        if feed_table is None:
+            return error_response(
+                400,
+                "CHANGE_FEED_DISABLED",
+                "since is not supported: change feed is not configured",
+                event=event,
+            )
+
+        try:
+            page = read_changes(feed_table, STATUS_STREAM, fein, since)
+        except InvalidCursor as e:
+            return error_response(400, "INVALID_CURSOR", str(e), event=event)
+        for change in page["changes"]:
+            if change["op"] == "UPSERT":
+                change["item"] = enrich(change["item"])
+
+        return json_response(200, page, event=event)
+
+    # Read before the data so a write racing this request can only make the
+    # ETag stale (forcing a refetch next poll), never newer than the body
+    etag = None
+    if versions_table is not None:
+        etag = current_etag(versions_table, STATUS_STREAM, fein)
+        if etag_matches(event, etag):
+            return respond(304, "", headers={"ETag": etag, "Access-Control-Expose-Headers": "ETag"})
+
+    # Taken before the read, and behind the writes still in flight, so a
+    # change landing mid-read is replayed, not lost
+    cursor = snapshot_cursor() if feed_table is not None else None
+
+    # One query per shard (in parallel) when the FEIN's writes are sharded
+    with timed_step("dynamo_query_status"):
+        statuses = query_fein(table, fein)
+
+    with timed_step("enrich_agents"):
+        items = [enrich(status) for status in statuses]
+
+    headers = {"Access-Control-Expose-Headers": "ETag,X-Change-Cursor"}
+    if etag:
+        headers["ETag"] = etag
+    if cursor:
+        headers["X-Change-Cursor"] = cursor
+
+    return json_response(200, items, event=event, headers=headers)
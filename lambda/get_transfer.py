@@ -1,33 +1,24 @@
-import json
 import os
 
-import boto3
 from boto3.dynamodb.conditions import Attr
 
-dynamodb = boto3.resource("dynamodb")
-table = dynamodb.Table(os.environ["TRANSFERS_TABLE"])
+from api_responses import error_response, json_response
+from aws_clients import lazy_table
+from coldstart import measure_cold_start
+from emf_metrics import emit_metrics
+from tracing import traced
 
+table = lazy_table(os.environ["TRANSFERS_TABLE"])
 
+
+@measure_cold_start
+@traced
+@emit_metrics
 def lambda_handler(event, context):
     releasing_fein = (event.get("pathParameters") or {}).get("id")
 
     if not releasing_fein:
-        return {
-            "statusCode": 400,
-            "headers": {
-                "Content-Type": "application/json",
-                "Access-Control-Allow-Origin": "*",
-                "Access-Control-Allow-Headers": "Content-Type,Idempotency-Key",
-            },
-            "body": json.dumps(
-                {
-                    "error": {
-                        "code": "MISSING_FEIN",
-                        "message": "releasing FEIN is required",
-                    }
-                }
-            ),
-        }
+        return error_response(400, "MISSING_FEIN", "releasing FEIN is required")
 
     result = table.scan(FilterExpression=Attr("releasingImoFein").eq(releasing_fein))
     items = result.get("Items", [])
@@ -42,15 +33,7 @@ def lambda_handler(event, context):
 
     transfers = [dynamo_record_to_carrier_body(item) for item in items]
 
-    return {
-        "statusCode": 200,
-        "headers": {
-            "Content-Type": "application/json",
-            "Access-Control-Allow-Origin": "*",
-            "Access-Control-Allow-Headers": "Content-Type,Idempotency-Key",
-        },
-        "body": json.dumps(transfers),
-    }
+    return json_response(200, transfers, event=event)
 
 
 def dynamo_record_to_carrier_body(record):
@@ -0,0 +1,53 @@
+import os
+from datetime import datetime
+
+from api_responses import error_response, json_response
+from aws_clients import lazy_table
+from coldstart import measure_cold_start
+from emf_metrics import emit_metrics, timed_step
+from status_history import query_history
+from tracing import traced
+
+history_table = lazy_table(os.environ.get("STATUS_HISTORY_TABLE"))
+
+
+def _parse(timestamp):
+    return datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
+
+
+def with_durations(changes):
+    """Adds secondsInStatus: time until the same carrier's next change (None for the latest)."""
+    next_change = {}
+    for change in reversed(changes):
+        carrier_id = change.get("carrierId")
+        following = next_change.get(carrier_id)
+        change["secondsInStatus"] = (
+            round((_parse(following["changedAt"]) - _parse(change["changedAt"])).total_seconds(), 3)
+            if following
+            else None
+        )
+        next_change[carrier_id] = change
+    return changes
+
+
+@measure_cold_start
+@traced
+@emit_metrics
+def lambda_handler(event, context):
+    transfer_id = (event.get("pathParameters") or {}).get("id")
+
+    if not transfer_id:
+        return error_response(400, "MISSING_ID", "transfer id is required")
+    if history_table is None:
+        return error_response(
+            400,
+            "HISTORY_DISABLED",
+            "status history is not configured",
+            event=event,
+        )
+
+    # One query: history items are partitioned by transfer and sorted by time
+    with timed_step("dynamo_query_history"):
+        changes = query_history(transfer_id)
+
+    return json_response(200, {"id": transfer_id, "changes": with_durations(changes)}, event=event)
@@ -0,0 +1,67 @@
+import os
+
+from boto3.dynamodb.conditions import Key
+
+from agents.data import list_agents
+from api_responses import error_response, json_response
+from aws_clients import lazy_table
+from book_analytics import transfer_impact
+from coldstart import measure_cold_start
+from contract_search import FEIN_INDEX
+from emf_metrics import emit_metrics
+from tracing import traced
+
+table = lazy_table(os.environ["CONTRACTS_TABLE"])
+
+
+def _csv_param(query_params, name):
+    value = query_params.get(name)
+    return [v.strip() for v in value.split(",") if v.strip()] if value else []
+
+
+def load_contracts(fein):
+    projection = "npn, carrierId, contractType, contractValue, issueDate"
+    response = table.query(
+        IndexName=FEIN_INDEX, KeyConditionExpression=Key("fein").eq(fein), ProjectionExpression=projection
+    )
+    items = response["Items"]
+
+    while "LastEvaluatedKey" in response:
+        response = table.query(
+            IndexName=FEIN_INDEX,
+            KeyConditionExpression=Key("fein").eq(fein),
+            ProjectionExpression=projection,
+            ExclusiveStartKey=response["LastEvaluatedKey"],
+        )
+        items.extend(response["Items"])
+
+    return items
+
+
+@measure_cold_start
+@traced
+@emit_metrics
+def lambda_handler(event, context):
+    fein = (event.get("pathParameters") or {}).get("fein")
+    query_params = event.get("queryStringParameters") or {}
+
+    if not fein:
+        return error_response(400, "MISSING_FEIN", "fein path parameter is required")
+
+    npns = _csv_param(query_params, "npn")  # Optional: agents moving (default: whole IMO)
+    carrier_ids = _csv_param(query_params, "carrierId")  # Optional: carriers moving
+
+    contracts = load_contracts(fein)
+    agents = [agent for agent in list_agents() if agent["currentImo"]["fein"] == fein]
+
+    impact = transfer_impact(contracts, agents, npns=npns, carrier_ids=carrier_ids)
+
+    return json_response(
+        200,
+        {
+            "fein": fein,
+            "selection": {"npns": npns, "carrierIds": carrier_ids},
+            **impact,
+        },
+        event=event,
+    )
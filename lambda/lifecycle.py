@@ -0,0 +1,51 @@
+import os
+import time
+
+# Retention for transfers and carrier statuses that reached a terminal state.
+#
+# Terminal records get a DynamoDB TTL (expiresAt, epoch seconds) of
+# ARCHIVE_RETENTION_DAYS from the moment they became terminal, so Transfers
+# and Status only keep in-flight work plus a recent tail. DynamoDB deletes
+# expired items in the background; the tables' streams hand those deletions
+# to archive_expired.py, which writes them to the archive (archive_store.py)
+# that GET /ats/v1/archive reads.
+#
+# A record that leaves a terminal state again (a carrier re-opens a COMPLETED
+# status) loses its expiresAt. With ARCHIVE_RETENTION_DAYS unset nothing is
+# stamped and records never expire.
+
+EXPIRES_AT = "expiresAt"
+
+TERMINAL_STATUSES = frozenset({"COMPLETED", "CANCELED", "REJECTED"})
+# Transfers are SUBMITTED, RELEASED or CANCELED; only a cancel ends one. A
+# transfer that is not canceled expires once all its carrier statuses are
+# terminal (status_history.retire_transfers).
+TERMINAL_TRANSFER_STATES = frozenset({"CANCELED"})
+
+ARCHIVE_RETENTION_DAYS = float(os.environ.get("ARCHIVE_RETENTION_DAYS", 0))
+
+
+def expires_at():
+    """TTL for a record that becomes terminal now, or None when retention is off."""
+    if not ARCHIVE_RETENTION_DAYS:
+        return None
+    return int(time.time() + ARCHIVE_RETENTION_DAYS * 86400)
+
+
+def stamp_status(item, old=None):
+    """
+    Sets or clears expiresAt on a status item about to be written over old.
+    A status that stays terminal keeps the expiry it was first given.
+    """
+    if item.get("status") not in TERMINAL_STATUSES:
+        item.pop(EXPIRES_AT, None)
+        return item
+    if old and old.get("status") == item["status"] and EXPIRES_AT in old:
+        item[EXPIRES_AT] = old[EXPIRES_AT]
+        return item
+    expiry = expires_at()
+    if expiry is None:
+        item.pop(EXPIRES_AT, None)
+    else:
+        item[EXPIRES_AT] = expiry
+    return item
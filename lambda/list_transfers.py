@@ -1,6 +1,12 @@
-import json
+from api_responses import json_response
+from coldstart import measure_cold_start
+from emf_metrics import emit_metrics
+from tracing import traced
 
 
+@measure_cold_start
+@traced
+@emit_metrics
 def lambda_handler(event, context):
     # Query string parameters
     query_params = event.get("queryStringParameters") or {}
@@ -13,12 +19,4 @@ def lambda_handler(event, context):
 
     # TODO: implement list transfers logic
 
-    return {
-        "statusCode": 200,
-        "headers": {
-            "Content-Type": "application/json",
-            "Access-Control-Allow-Origin": "*",
-            "Access-Control-Allow-Headers": "Content-Type,Idempotency-Key",
-        },
-        "body": json.dumps([]),
-    }
+    return json_response(200, [])
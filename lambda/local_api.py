@@ -0,0 +1,123 @@
+"""
+lambda/local_api.py
+
+Local HTTP server for every ATS route, for development and load tests.
+
+Requests are turned into API Gateway proxy events and dispatched through
+router.py, so every handler in lambda/ and lambda/agents/ is mounted with the
+same route table as the deployed RouterFunction. Handlers are synchronous;
+they run on a bounded worker thread pool (LOCAL_API_THREADS) so the event
+loop keeps accepting requests while they wait on DynamoDB or carriers. The
+request body is passed through as received and the handler's response body
+is returned as-is: nothing is parsed or re-serialized on the way.
+
+Point it at a local DynamoDB stand-in (DynamoDB Local, moto_server, ...) with
+DYNAMODB_ENDPOINT_URL; table names default to the ones in template.yaml.
+The archive is read from ./archive unless ARCHIVE_BUCKET (and S3_ENDPOINT_URL
+for a local S3) is set.
+
+    DYNAMODB_ENDPOINT_URL=http://localhost:8000 python3 lambda/local_api.py
+"""
+
+import base64
+import os
+import sys
+import uuid
+from pathlib import Path
+
+import anyio
+from fastapi import FastAPI, Request
+from fastapi.responses import Response
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+LOCAL_API_HOST = os.environ.get("LOCAL_API_HOST", "0.0.0.0")
+LOCAL_API_PORT = int(os.environ.get("LOCAL_API_PORT", 8010))
+LOCAL_API_THREADS = int(os.environ.get("LOCAL_API_THREADS", 16))
+
+# Table names as deployed by template.yaml; set any of these to override
+DEFAULT_TABLES = {
+    "TRANSFERS_TABLE": "Transfers",
+    "AGENT_TABLE": "Agents",
+    "STATUS_TABLE": "Status",
+    "STATUS_HISTORY_TABLE": "StatusHistory",
+    "PIPELINE_STATS_TABLE": "PipelineStats",
+    "CONTRACTS_TABLE": "Contracts",
+    "CONTRACT_AGGREGATES_TABLE": "ContractAggregates",
+    "CHANGE_FEED_TABLE": "ChangeFeed",
+    "VERSIONS_TABLE": "FeinVersions",
+    "CARRIER_HEALTH_TABLE": "CarrierHealth",
+    "RATE_LIMIT_TABLE": "RateLimits",
+}
+for _name, _table in DEFAULT_TABLES.items():
+    os.environ.setdefault(_name, _table)
+
+# GET /ats/v1/archive reads what archive_sweep.py writes with ARCHIVE_DIR=./archive
+os.environ.setdefault("ARCHIVE_DIR", str(Path(__file__).resolve().parent.parent / "archive"))
+
+# No API Gateway in front to compress responses; the handlers do it
+os.environ.setdefault("COMPRESS_RESPONSES", "1")
+
+# Handlers print one EMF line per request; off by default so load tests
+# measure the handlers rather than stdout
+os.environ.setdefault("ATS_METRICS", "0")
+
+import router  # noqa: E402 - reads the environment set above on first dispatch
+
+app = FastAPI(title="ATS Local API")
+
+_limiter = anyio.CapacityLimiter(LOCAL_API_THREADS)
+
+
+class _Context:
+    __slots__ = ("aws_request_id", "function_name")
+
+    def __init__(self):
+        self.aws_request_id = str(uuid.uuid4())
+        self.function_name = "ats-local-api"
+
+
+def _event(request, raw_body):
+    event = {
+        "httpMethod": request.method,
+        "path": request.url.path,
+        "resource": None,
+        "pathParameters": None,
+        "queryStringParameters": dict(request.query_params) or None,
+        "headers": dict(request.headers),
+        "body": None,
+        "isBase64Encoded": False,
+    }
+    if raw_body:
+        try:
+            event["body"] = raw_body.decode("utf-8")
+        except UnicodeDecodeError:
+            event["body"] = base64.b64encode(raw_body).decode("ascii")
+            event["isBase64Encoded"] = True
+    return event
+
+
+def _response(result):
+    body = result.get("body") or ""
+    if result.get("isBase64Encoded"):
+        content = base64.b64decode(body)
+    else:
+        content = body.encode("utf-8") if isinstance(body, str) else body
+    return Response(
+        content=content,
+        status_code=int(result.get("statusCode", 200)),
+        headers=result.get("headers") or {},
+    )
+
+
+@app.api_route("/{path:path}", methods=["GET", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"])
+async def dispatch(request: Request):
+    event = _event(request, await request.body())
+    result = await anyio.to_thread.run_sync(router.lambda_handler, event, _Context(), limiter=_limiter)
+    return _response(result)
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(app, host=LOCAL_API_HOST, port=LOCAL_API_PORT)
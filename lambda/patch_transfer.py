@@ -1,25 +1,112 @@
-import json
+import logging
+import os
 
+from botocore.exceptions import ClientError
 
+from api_responses import error_response, json_response, parse_body
+from aws_clients import lazy_table
+from change_feed import STATUS_STREAM, append_changes
+from coldstart import measure_cold_start
+from emf_metrics import emit_metrics, timed_step
+from fein_versions import bump_version
+from request_validation import validates_body
+from status_history import cancel_transfer_statuses
+from tracing import traced
+from transfer_state import add_note, cancel, conflict_item, is_condition_failure
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+table = lazy_table(os.environ["TRANSFERS_TABLE"])
+status_table = lazy_table(os.environ["STATUS_TABLE"])
+
+feed_table = lazy_table(os.environ.get("CHANGE_FEED_TABLE"))
+versions_table = lazy_table(os.environ.get("VERSIONS_TABLE"))
+
+ACTIONS = {"CANCEL", "ADD_NOTE"}
+MAX_NOTE_LENGTH = 2000
+
+
+def _conflict_response(transfer_id, action, current, expected_version):
+    if current is None:
+        return error_response(404, "NOT_FOUND", f"transfer {transfer_id} not found")
+    current_version = int(current.get("version", 0))
+    if expected_version is not None and current_version != expected_version:
+        return error_response(
+            409,
+            "VERSION_CONFLICT",
+            f"transfer {transfer_id} is at version {current_version}, not {expected_version}",
+        )
+    return error_response(
+        409,
+        "INVALID_STATE",
+        f"transfer {transfer_id} is {current.get('state')}; {action} is not allowed",
+    )
+
+
+def _close_statuses(transfer):
+    # The carriers' open statuses end with the transfer; the cancel itself has
+    # already succeeded, and archive_sweep.py retires what this leaves behind
+    try:
+        with timed_step("dynamo_cancel_statuses"):
+            closed = cancel_transfer_statuses(status_table, transfer)
+    except Exception as e:
+        logger.error("Closing statuses of canceled transfer=%s failed: %s", transfer["id"], str(e))
+        return
+    if closed:
+        receiving_fein = transfer["receivingImoFein"]
+        if feed_table is not None:
+            append_changes(feed_table, STATUS_STREAM, receiving_fein, [("UPSERT", new) for new in closed])
+        if versions_table is not None:
+            bump_version(versions_table, STATUS_STREAM, receiving_fein)
+
+
+@measure_cold_start
+@traced
+@emit_metrics
+@validates_body("PatchTransferRequest")
 def lambda_handler(event, context):
     # Path parameter
     transfer_id = (event.get("pathParameters") or {}).get("id")  # Required: transfer id
 
     # Request body
-    body = json.loads(event.get("body") or "{}")
+    body = parse_body(event)
 
     action = body.get("action")  # Required: CANCEL | ADD_NOTE
     note = body.get("note")  # Used when action=ADD_NOTE
     reason = body.get("reason")  # Optional: human-readable reason (e.g., for CANCEL)
+    expected_version = body.get("version")  # Optional: fail with 409 unless the transfer is at this version
+
+    if not transfer_id:
+        return error_response(400, "MISSING_ID", "transfer id is required")
+    if action not in ACTIONS:
+        return error_response(
+            400, "INVALID_ACTION", f"action must be one of: {', '.join(sorted(ACTIONS))}"
+        )
+    if action == "ADD_NOTE" and (not isinstance(note, str) or not note.strip()):
+        return error_response(400, "MISSING_NOTE", "note is required when action is ADD_NOTE")
+    if isinstance(note, str) and len(note) > MAX_NOTE_LENGTH:
+        return error_response(
+            400, "NOTE_TOO_LONG", f"note must be at most {MAX_NOTE_LENGTH} characters"
+        )
+    if expected_version is not None and (
+        isinstance(expected_version, bool) or not isinstance(expected_version, int)
+    ):
+        return error_response(400, "INVALID_VERSION", "version must be an integer")
+
+    # One conditional UpdateItem either way; the new item comes back with it
+    try:
+        with timed_step("dynamo_update_transfer"):
+            if action == "ADD_NOTE":
+                transfer = add_note(table, transfer_id, note, expected_version)
+            else:
+                transfer = cancel(table, transfer_id, reason, expected_version)
+    except ClientError as e:
+        if not is_condition_failure(e):
+            raise
+        return _conflict_response(transfer_id, action, conflict_item(e), expected_version)
+
+    if action == "CANCEL":
+        _close_statuses(transfer)
 
-    # TODO: implement patch transfer logic
-
-    return {
-        "statusCode": 200,
-        "headers": {
-            "Content-Type": "application/json",
-            "Access-Control-Allow-Origin": "*",
-            "Access-Control-Allow-Headers": "Content-Type,Idempotency-Key",
-        },
-        "body": json.dumps({}),
-    }
+    return json_response(200, transfer, event=event)
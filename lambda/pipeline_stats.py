@@ -0,0 +1,209 @@
+import math
+import os
+from collections import defaultdict
+from datetime import datetime
+
+from boto3.dynamodb.conditions import Key
+
+from aws_clients import lazy_table
+from status import Status
+
+# Transfer pipeline counters and time-to-complete sketches per receiving FEIN,
+# kept in step with Status by the status write path (status_history.put_status
+# and put_statuses add the update to the same transaction as the status
+# change).
+#
+# One item per receiving FEIN and carrier:
+#   fein=99-7654321 statKey=carrier#allianz
+#     count_INITIATED=12 count_PENDING=30 count_COMPLETED=140 ...
+#     ttc_87=3 ttc_88=9 ...
+# A status change ADDs +1 to the new status and -1 to the old one. When a
+# carrier status reaches COMPLETED, the seconds since it was INITIATED go into
+# a log-bucketed histogram (a DDSketch): bucket i counts durations in
+# (GAMMA^(i-1), GAMMA^i], so any percentile read back from it is within
+# SKETCH_RELATIVE_ACCURACY of the true value, in a fixed, small number of
+# attributes, with nothing but atomic ADDs on the write side.
+#
+# Status items that are counted carry statsCounted=true; a change only takes
+# its -1 from the old status when the old item was counted. Items written
+# before the counters existed (or while PIPELINE_STATS_TABLE was unset) are
+# counted, and marked, by backfill_pipeline_stats.py.
+#
+# GET /ats/v1/status/{fein}/summary reads the whole partition in one Query.
+# With PIPELINE_STATS_TABLE unset nothing is recorded.
+
+CARRIER_PREFIX = "carrier#"
+COUNTED_ATTRIBUTE = "statsCounted"
+COUNT_PREFIX = "count_"
+SKETCH_PREFIX = "ttc_"
+
+SKETCH_RELATIVE_ACCURACY = 0.05
+GAMMA = (1 + SKETCH_RELATIVE_ACCURACY) / (1 - SKETCH_RELATIVE_ACCURACY)
+_LOG_GAMMA = math.log(GAMMA)
+
+PERCENTILES = (50, 90, 95, 99)
+
+VALID_STATUSES = [s.name for s in Status]
+
+stats_table = lazy_table(os.environ.get("PIPELINE_STATS_TABLE"))
+
+
+def _parse(timestamp):
+    return datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
+
+
+def bucket_index(seconds):
+    return max(0, math.ceil(math.log(max(seconds, 1.0)) / _LOG_GAMMA))
+
+
+def bucket_value(index):
+    # Midpoint (in relative terms) of (GAMMA^(i-1), GAMMA^i]
+    return 2 * GAMMA ** index / (GAMMA + 1)
+
+
+def is_counted(item):
+    return bool(item and item.get(COUNTED_ATTRIBUTE))
+
+
+def _deltas(old, new):
+    old_status = old.get("status") if old else None
+    new_status = new["status"]
+    deltas = {}
+    if not is_counted(old):
+        # Never counted: count the new status, take nothing from the old one
+        deltas[f"{COUNT_PREFIX}{new_status}"] = 1
+    elif old_status != new_status:
+        deltas[f"{COUNT_PREFIX}{new_status}"] = 1
+        deltas[f"{COUNT_PREFIX}{old_status}"] = -1
+    if old_status != new_status:
+        initiated_at = new.get("initiatedAt")
+        if new_status == "COMPLETED" and initiated_at:
+            seconds = (_parse(new["updatedAt"]) - _parse(initiated_at)).total_seconds()
+            deltas[f"{SKETCH_PREFIX}{bucket_index(seconds)}"] = 1
+    return deltas
+
+
+def _add_update(fein, carrier_id, deltas):
+    names = {}
+    values = {}
+    adds = []
+    for i, (attribute, delta) in enumerate(deltas.items()):
+        names[f"#a{i}"] = attribute
+        values[f":d{i}"] = delta
+        adds.append(f"#a{i} :d{i}")
+    return {
+        "Key": {"fein": fein, "statKey": f"{CARRIER_PREFIX}{carrier_id}"},
+        "UpdateExpression": "ADD " + ", ".join(adds),
+        "ExpressionAttributeNames": names,
+        "ExpressionAttributeValues": values,
+    }
+
+
+def mark_counted(item):
+    """Flag a status item about to be written with its counter change."""
+    if stats_table is not None:
+        item[COUNTED_ATTRIBUTE] = True
+    return item
+
+
+def backfill_update(item):
+    """
+    TransactWriteItems Update counting a status item that was written without
+    its counter change (see backfill_pipeline_stats.py).
+    """
+    return {
+        "Update": {
+            "TableName": stats_table.name,
+            **_add_update(item["receivingFein"], item["carrierId"], {f"{COUNT_PREFIX}{item['status']}": 1}),
+        }
+    }
+
+
+def transition_update(old, new):
+    """
+    TransactWriteItems Update for a status change from old (None if the
+    status item is new) to new, or None when no counter changes.
+    """
+    if stats_table is None:
+        return None
+    deltas = _deltas(old, new)
+    if not deltas:
+        return None
+    return {"Update": {"TableName": stats_table.name, **_add_update(new["receivingFein"], new["carrierId"], deltas)}}
+
+
+def transition_updates(transitions):
+    """
+    TransactWriteItems Updates for several status changes, as (old, new)
+    pairs, written in one transaction (status_history.put_statuses): one
+    Update per receiving FEIN and carrier, as an item can only appear once.
+    """
+    if stats_table is None:
+        return []
+    totals = defaultdict(lambda: defaultdict(int))
+    for old, new in transitions:
+        for attribute, delta in _deltas(old, new).items():
+            totals[(new["receivingFein"], new["carrierId"])][attribute] += delta
+    updates = []
+    for (fein, carrier_id), deltas in totals.items():
+        deltas = {attribute: delta for attribute, delta in deltas.items() if delta}
+        if deltas:
+            updates.append({"Update": {"TableName": stats_table.name, **_add_update(fein, carrier_id, deltas)}})
+    return updates
+
+
+def _percentiles(buckets):
+    total = sum(buckets.values())
+    if not total:
+        return {"count": 0, **{f"p{p}": None for p in PERCENTILES}}
+    ordered = sorted(buckets.items())
+    result = {"count": total}
+    for p in PERCENTILES:
+        rank = max(1, math.ceil(total * p / 100))
+        seen = 0
+        for index, count in ordered:
+            seen += count
+            if seen >= rank:
+                result[f"p{p}"] = round(bucket_value(index), 1)
+                break
+    return result
+
+
+def get_pipeline_summary(table, fein):
+    response = table.query(KeyConditionExpression=Key("fein").eq(fein))
+    items = response["Items"]
+
+    while "LastEvaluatedKey" in response:
+        response = table.query(
+            KeyConditionExpression=Key("fein").eq(fein),
+            ExclusiveStartKey=response["LastEvaluatedKey"],
+        )
+        items.extend(response["Items"])
+
+    by_carrier = {}
+    total_counts = dict.fromkeys(VALID_STATUSES, 0)
+    total_buckets = defaultdict(int)
+    for item in items:
+        if not item["statKey"].startswith(CARRIER_PREFIX):
+            continue
+        counts = {status: int(item.get(f"{COUNT_PREFIX}{status}", 0)) for status in VALID_STATUSES}
+        buckets = {
+            int(attribute[len(SKETCH_PREFIX):]): int(value)
+            for attribute, value in item.items()
+            if attribute.startswith(SKETCH_PREFIX)
+        }
+        for status, count in counts.items():
+            total_counts[status] += count
+        for index, count in buckets.items():
+            total_buckets[index] += count
+        by_carrier[item["statKey"][len(CARRIER_PREFIX):]] = {
+            "counts": counts,
+            "timeToCompleteSeconds": _percentiles(buckets),
+        }
+
+    return {
+        "fein": fein,
+        "counts": total_counts,
+        "timeToCompleteSeconds": _percentiles(total_buckets),
+        "byCarrier": by_carrier,
+    }
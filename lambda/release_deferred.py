@@ -0,0 +1,83 @@
+import json
+import logging
+import os
+from collections import defaultdict
+
+from admission import CARRIER_SCOPE, admit
+from aws_clients import lazy_table
+from carrier_client import forward_many
+from carrier_registry import get_carrier
+from coldstart import measure_cold_start
+from emf_metrics import emit_metrics, put_metrics, timed_step
+from release_transfer_to_carriers import dynamo_record_to_carrier_body, record_released
+
+# SQS consumer for carrier forwards that release_transfer_to_carriers queued:
+# forwards to carriers over their admission limit (admission.py), delivered
+# after the Retry-After the release saw, and every forward to a carrier with
+# supportsBatch. Each message is {"transferId", "carrierId"}.
+#
+# A delivery's messages are grouped by carrier and each group is sent with
+# carrier_client.forward_many, so a batch-capable carrier gets one
+# {"transfers": [...]} request for all of them instead of one POST each. The
+# event source collects up to BatchSize messages for up to
+# MaximumBatchingWindowInSeconds before invoking.
+#
+# A forward that is still throttled, or that fails with 429/5xx, is reported
+# as a batch item failure so SQS delivers it again after the visibility
+# timeout (and to the dead-letter queue after maxReceiveCount). Transfers
+# canceled since the release are dropped.
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+table = lazy_table(os.environ["TRANSFERS_TABLE"])
+
+
+def _retryable(status):
+    return status == 429 or status >= 500
+
+
+@measure_cold_start
+@emit_metrics
+def lambda_handler(event, context):
+    failures = []
+    work = defaultdict(dict)  # carrier id -> {transfer id: (message id, record)}
+    for message in event.get("Records", []):
+        body = json.loads(message["body"])
+        transfer_id, carrier_id = body["transferId"], body["carrierId"]
+
+        record = table.get_item(Key={"id": transfer_id}, ConsistentRead=True).get("Item")
+        if record is None or record.get("state") != "RELEASED" or get_carrier(carrier_id) is None:
+            logger.warning("Dropping deferred forward transfer=%s carrier=%s", transfer_id, carrier_id)
+            continue
+        if transfer_id in work[carrier_id]:
+            # SQS delivers at least once; forward each transfer once per delivery
+            continue
+        work[carrier_id][transfer_id] = (message["messageId"], record)
+
+    forwarded = 0
+    for carrier_id, transfers in work.items():
+        pending = list(transfers.values())
+        if admit(CARRIER_SCOPE, carrier_id, cost=len(pending)):
+            failures.extend({"itemIdentifier": message_id} for message_id, _ in pending)
+            continue
+
+        logger.info("Forwarding %d queued transfers to carrier=%s", len(pending), carrier_id)
+        with timed_step("forward", carrier=carrier_id):
+            results = forward_many(
+                get_carrier(carrier_id), [dynamo_record_to_carrier_body(record) for _, record in pending]
+            )
+        for (message_id, record), (error_status, forward_body) in zip(pending, results):
+            if error_status is None:
+                record_released(record, carrier_id)
+                forwarded += 1
+                continue
+            logger.error(
+                "Forward failed transfer=%s carrier=%s status=%s body=%s",
+                record["id"], carrier_id, error_status, forward_body,
+            )
+            if _retryable(error_status):
+                failures.append({"itemIdentifier": message_id})
+
+    put_metrics({"DeferredForwards": (forwarded, "Count")})
+    return {"batchItemFailures": failures}
@@ -1,42 +1,40 @@
 import json
 import logging
 import os
-import urllib.error
-import urllib.request
 
-import boto3
+from botocore.exceptions import ClientError
+
+from admission import CARRIER_SCOPE, FEIN_SCOPE, admit, defer, retry_after_header, throttled_response
+from agents.data import get_agent_by_npn
+from api_responses import error_response, json_response, respond
+from aws_clients import lazy_table
+from carrier_client import forward_to_api
+from carrier_registry import get_carrier, route_carriers
+from change_feed import STATUS_STREAM, append_changes
+from coldstart import measure_cold_start
+from emf_metrics import emit_metrics, timed_step
+from fein_versions import bump_version
+from status_history import put_status
+from tracing import traced
+from transfer_state import conflict_item, is_condition_failure, mark_released
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-dynamodb = boto3.resource("dynamodb")
-table = dynamodb.Table(os.environ["TRANSFERS_TABLE"])
-status_table = dynamodb.Table(os.environ["STATUS_TABLE"])
+table = lazy_table(os.environ["TRANSFERS_TABLE"])
+status_table = lazy_table(os.environ["STATUS_TABLE"])
 
-FORWARD_API_URL_ALLIANZ = os.environ.get("FORWARD_API_URL_ALLIANZ")
-FORWARD_API_URL_AE = os.environ.get("FORWARD_API_URL_AE")
+feed_table = lazy_table(os.environ.get("CHANGE_FEED_TABLE"))
+versions_table = lazy_table(os.environ.get("VERSIONS_TABLE"))
 
-forward_apis = [FORWARD_API_URL_ALLIANZ, FORWARD_API_URL_AE]
-carrier_ids = ["allianz", "american-equity"]
 
-
-def forward_to_api(body, url):
-    data = json.dumps(body).encode("utf-8")
-    req = urllib.request.Request(
-        url,
-        data=data,
-        headers={"Content-Type": "application/json"},
-        method="POST",
-    )
-    try:
-        with urllib.request.urlopen(req) as response:
-            return None, response.read().decode("utf-8")
-    except urllib.error.HTTPError as e:
-        return e.status, e.read().decode("utf-8")
-    except urllib.error.URLError as e:
-        return 502, json.dumps(
-            {"error": {"code": "FORWARD_FAILED", "message": str(e.reason)}}
-        )
+def transfer_carriers(record):
+    # Transfers created before routing have no carrierIds: route them now
+    if "carrierIds" in record:
+        carriers = [get_carrier(cid) for cid in record["carrierIds"]]
+        return [carrier for carrier in carriers if carrier is not None]
+    carriers, _ = route_carriers(get_agent_by_npn(record["agentNpn"]))
+    return carriers
 
 
 def dynamo_record_to_carrier_body(record):
@@ -69,87 +67,136 @@ def dynamo_record_to_carrier_body(record):
     return body
 
 
+def record_released(record, carrier_id):
+    """Mark a transfer's status RELEASED for a carrier that accepted it. Shared with release_deferred."""
+    receiving_fein = record["receivingImoFein"]
+    releasing_fein = record["releasingImoFein"]
+    npn = record["agentNpn"]
+
+    status_key = f"{carrier_id}#{npn}#{releasing_fein}"
+    logger.info("Updating status to RELEASED for carrier=%s statusKey=%s", carrier_id, status_key)
+    try:
+        with timed_step("dynamo_update_status", carrier=carrier_id):
+            updated = put_status(
+                status_table,
+                {
+                    "receivingFein": receiving_fein,
+                    "statusKey": status_key,
+                    "releasingFein": releasing_fein,
+                    "carrierId": carrier_id,
+                    "npn": npn,
+                    "status": "RELEASED",
+                },
+                merge=True,
+            )
+            logger.info("Status updated to RELEASED for carrier=%s", carrier_id)
+            if feed_table is not None:
+                append_changes(feed_table, STATUS_STREAM, receiving_fein, [("UPSERT", updated)])
+            if versions_table is not None:
+                bump_version(versions_table, STATUS_STREAM, receiving_fein)
+    except Exception as e:
+        logger.error("Failed to update status to RELEASED for carrier=%s: %s", carrier_id, str(e))
+
+
+def release_to_carrier(record, carrier, carrier_body):
+    """
+    Forward a released transfer to one carrier and mark its status RELEASED.
+    Returns None, or {"status", "body"} when the carrier did not accept it.
+    """
+    carrier_id, url = carrier["carrierId"], carrier["endpoint"]
+    logger.info("Releasing transfer=%s to carrier=%s url=%s", record["id"], carrier_id, url)
+    with timed_step("forward", carrier=carrier_id):
+        error_status, forward_body = forward_to_api(carrier_body, url, carrier_id)
+    if error_status is not None:
+        logger.error("Forward failed carrier=%s status=%s body=%s", carrier_id, error_status, forward_body)
+        return {"status": error_status, "body": forward_body}
+
+    record_released(record, carrier_id)
+    return None
+
+
+@measure_cold_start
+@traced
+@emit_metrics
 def lambda_handler(event, context):
     transfer_id = (event.get("pathParameters") or {}).get("id")
 
     if not transfer_id:
-        return {
-            "statusCode": 400,
-            "headers": {
-                "Content-Type": "application/json",
-                "Access-Control-Allow-Origin": "*",
-                "Access-Control-Allow-Headers": "Content-Type,Idempotency-Key",
-            },
-            "body": json.dumps({"error": {"code": "MISSING_ID", "message": "transfer id is required"}}),
-        }
-
-    result = table.get_item(Key={"id": transfer_id})
-    record = result.get("Item")
-
-    if not record:
-        return {
-            "statusCode": 404,
-            "headers": {
-                "Content-Type": "application/json",
-                "Access-Control-Allow-Origin": "*",
-                "Access-Control-Allow-Headers": "Content-Type,Idempotency-Key",
-            },
-            "body": json.dumps({"error": {"code": "NOT_FOUND", "message": f"transfer {transfer_id} not found"}}),
-        }
+        return error_response(400, "MISSING_ID", "transfer id is required")
+
+    # Admission per receiving IMO, before the transfer changes state. The IMO
+    # charged is the stored transfer's, so unknown ids cost nobody a token
+    with timed_step("dynamo_get_transfer"):
+        stored = table.get_item(Key={"id": transfer_id}, ProjectionExpression="receivingImoFein").get("Item")
+    if stored is None:
+        return error_response(404, "NOT_FOUND", f"transfer {transfer_id} not found")
+    receiving_fein = stored["receivingImoFein"]
+    retry_after = admit(FEIN_SCOPE, receiving_fein)
+    if retry_after:
+        return throttled_response(FEIN_SCOPE, receiving_fein, retry_after)
+
+    # Moves the transfer to RELEASED and reads it in one conditional write, so
+    # a transfer canceled concurrently is never forwarded
+    try:
+        with timed_step("dynamo_release_transfer"):
+            record = mark_released(table, transfer_id)
+    except ClientError as e:
+        if not is_condition_failure(e):
+            raise
+        current = conflict_item(e)
+        if current is None:
+            return error_response(404, "NOT_FOUND", f"transfer {transfer_id} not found")
+        return error_response(
+            409,
+            "INVALID_STATE",
+            f"transfer {transfer_id} is {current.get('state')} and cannot be released",
+        )
 
     carrier_body = dynamo_record_to_carrier_body(record)
-
-    receiving_fein = record["receivingImoFein"]
-    releasing_fein = record["releasingImoFein"]
-    npn = record["agentNpn"]
+    carriers = transfer_carriers(record)
 
     forward_errors = {}
-    for url, carrier_id in zip(forward_apis, carrier_ids):
-        logger.info("Releasing transfer=%s to carrier=%s url=%s", transfer_id, carrier_id, url)
-        error_status, forward_body = forward_to_api(carrier_body, url)
-        if error_status is not None:
-            logger.error("Forward failed carrier=%s status=%s body=%s", carrier_id, error_status, forward_body)
-            forward_errors[carrier_id] = {"status": error_status, "body": forward_body}
+    deferred = []
+    for carrier in carriers:
+        carrier_id = carrier["carrierId"]
+        # Batch-capable carriers get their forwards from the queue, batched
+        # with other releases' (release_deferred.py)
+        if carrier["supportsBatch"] and defer({"transferId": transfer_id, "carrierId": carrier_id}, 0):
+            logger.info("Queued forward transfer=%s carrier=%s for batching", transfer_id, carrier_id)
+            deferred.append(carrier_id)
             continue
+        # A carrier over its limit gets the forward later (queued) or not at all
+        retry_after = admit(CARRIER_SCOPE, carrier_id)
+        if retry_after and defer({"transferId": transfer_id, "carrierId": carrier_id}, retry_after):
+            logger.info("Deferred forward transfer=%s carrier=%s by %.1fs", transfer_id, carrier_id, retry_after)
+            deferred.append(carrier_id)
+            continue
+        if retry_after:
+            forward_errors[carrier_id] = {
+                "status": 429,
+                "body": json.dumps(
+                    {"error": {"code": "RATE_LIMITED", "message": f"too many forwards to carrier {carrier_id}"}}
+                ),
+                "headers": retry_after_header(retry_after),
+            }
+            continue
+        error = release_to_carrier(record, carrier, carrier_body)
+        if error is not None:
+            forward_errors[carrier_id] = error
 
-        status_key = f"{carrier_id}#{npn}#{releasing_fein}"
-        logger.info("Updating status to RELEASED for carrier=%s statusKey=%s", carrier_id, status_key)
-        try:
-            status_table.update_item(
-                Key={"receivingFein": receiving_fein, "statusKey": status_key},
-                UpdateExpression="SET #s = :s",
-                ExpressionAttributeNames={"#s": "status"},
-                ExpressionAttributeValues={":s": "RELEASED"},
-            )
-            logger.info("Status updated to RELEASED for carrier=%s", carrier_id)
-        except Exception as e:
-            logger.error("Failed to update status to RELEASED for carrier=%s: %s", carrier_id, str(e))
-
-    if len(forward_errors) == len(forward_apis):
+    if carriers and len(forward_errors) == len(carriers):
         _, first_error = next(iter(forward_errors.items()))
-        return {
-            "statusCode": first_error["status"],
-            "headers": {
-                "Content-Type": "application/json",
-                "Access-Control-Allow-Origin": "*",
-                "Access-Control-Allow-Headers": "Content-Type,Idempotency-Key",
-            },
-            "body": first_error["body"],
-        }
+        return respond(first_error["status"], first_error["body"], headers=first_error.get("headers"))
 
     response_body = {"id": transfer_id}
+    if deferred:
+        response_body["deferred"] = deferred
     if forward_errors:
         response_body["warnings"] = {
             cid: f"forward failed — {e['status']}: {e['body']}"
             for cid, e in forward_errors.items()
         }
 
-    return {
-        "statusCode": 200,
-        "headers": {
-            "Content-Type": "application/json",
-            "Access-Control-Allow-Origin": "*",
-            "Access-Control-Allow-Headers": "Content-Type,Idempotency-Key",
-        },
-        "body": json.dumps(response_body),
-    }
+    # 202 when no carrier has the transfer yet but queued forwards will deliver it
+    forwarded = len(carriers) - len(deferred) - len(forward_errors)
+    return json_response(202 if deferred and not forwarded else 200, response_body)
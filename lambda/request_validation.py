@@ -0,0 +1,61 @@
+import binascii
+import functools
+import json
+from pathlib import Path
+
+import fastjsonschema
+
+from api_responses import error_response, parse_body
+
+# Request-body validation against the API specs.
+#
+# request_schemas.json holds every request-body schema from
+# Documentation/hub_api.yaml and openapi_agent_api.yaml, already reduced to
+# plain JSON Schema (regenerate it with generate_request_schemas.py after
+# changing a spec). fastjsonschema turns each one into a Python function once
+# per container, so checking a body costs microseconds:
+#   check("SetStatusRequest", body)  # raises InvalidRequest
+# Handlers that answer with CodeError use @validates_body, which rejects the
+# request with 400 before the handler (and DynamoDB) sees it.
+
+with open(Path(__file__).with_name("request_schemas.json")) as f:
+    SCHEMAS = json.load(f)
+
+
+class InvalidRequest(ValueError):
+    """The request body does not match its schema."""
+
+
+@functools.cache
+def validator(name):
+    return fastjsonschema.compile(SCHEMAS[name])
+
+
+def check(name, body):
+    try:
+        validator(name)(body)
+    except fastjsonschema.JsonSchemaValueException as e:
+        # "data.notes must be ..." -> "body.notes must be ..."
+        raise InvalidRequest("body" + e.message[4:] if e.message.startswith("data") else e.message) from None
+
+
+def validates_body(name):
+    """Decorator: 400 INVALID_JSON / INVALID_REQUEST unless the body matches schema `name`."""
+    validator(name)  # compile at import, not on the first request
+
+    def decorator(handler):
+        @functools.wraps(handler)
+        def wrapper(event, context):
+            try:
+                body = parse_body(event)
+            except (ValueError, binascii.Error):
+                return error_response(400, "INVALID_JSON", "request body must be JSON")
+            try:
+                check(name, body)
+            except InvalidRequest as e:
+                return error_response(400, "INVALID_REQUEST", str(e))
+            return handler(event, context)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,114 @@
+"""
+lambda/router.py
+
+Single-function deployment mode: one Lambda serves every /ats/v1/* and
+/ats/agents/* route by dispatching to the existing per-route lambda_handler
+functions. Handler modules are imported on first use and then stay loaded, so
+a warm router container shares its DynamoDB pool and module-level caches
+across all routes.
+
+Selected in template.yaml with DeploymentMode=router.
+"""
+
+import importlib
+import logging
+import re
+import urllib.parse
+
+from api_responses import CORS_HEADERS, error_response, respond
+from coldstart import measure_cold_start
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+
+# ---------------------------------------------------------------------------
+# Route table: (method, API Gateway resource) -> handler module
+# ---------------------------------------------------------------------------
+
+ROUTES = {
+    ("GET",   "/ats/v1/transfers"):                   "list_transfers",
+    ("POST",  "/ats/v1/transfers"):                   "create_transfer",
+    ("POST",  "/ats/v1/transfers:batch"):             "create_transfers_batch",
+    ("GET",   "/ats/v1/transfers/{id}"):              "get_transfer",
+    ("PATCH", "/ats/v1/transfers/{id}"):              "patch_transfer",
+    ("POST",  "/ats/v1/transfers/{id}/release"):      "release_transfer_to_carriers",
+    ("GET",   "/ats/v1/transfers/{id}/history"):      "get_transfer_history",
+    ("POST",  "/ats/v1/status"):                      "set_status",
+    ("POST",  "/ats/v1/status:batch"):                "set_status_batch",
+    ("GET",   "/ats/v1/status"):                      "get_agent_statuses",
+    ("GET",   "/ats/v1/status/{fein}"):               "get_statuses",
+    ("GET",   "/ats/v1/status/{fein}/summary"):       "get_status_summary",
+    ("GET",   "/ats/v1/archive/{fein}"):              "get_archive",
+    ("GET",   "/ats/v1/contracts"):                   "search_contracts",
+    ("GET",   "/ats/v1/contracts/{fein}"):            "get_contracts",
+    ("GET",   "/ats/v1/contracts/{fein}/summary"):    "get_contract_summary",
+    ("GET",   "/ats/v1/contracts/{fein}/impact"):     "get_transfer_impact",
+    ("POST",  "/ats/v1/contracts/update-fein"):       "update_contracts_fein",
+    ("GET",   "/ats/agents"):                         "agents.list_agents",
+    ("GET",   "/ats/agents/{npn}/validate"):          "agents.get_agent_transfer",
+    ("POST",  "/ats/agents/{npn}/validate"):          "agents.post_agent_transfer",
+}
+
+
+def _compile(resource):
+    pattern = re.sub(r"\\\{(\w+)\\\}", r"(?P<\1>[^/]+)", re.escape(resource))
+    return re.compile(f"^{pattern}/?$")
+
+
+# Literal routes first so /contracts/update-fein never matches /contracts/{fein}
+_PATTERNS = sorted(
+    {resource: _compile(resource) for _, resource in ROUTES}.items(),
+    key=lambda entry: entry[0].count("{"),
+)
+
+_handlers = {}
+
+
+def _handler_for(module_name):
+    handler = _handlers.get(module_name)
+    if handler is None:
+        handler = importlib.import_module(module_name).lambda_handler
+        _handlers[module_name] = handler
+    return handler
+
+
+def resolve(method, path):
+    """Match a raw request path; returns (resource, path_parameters) or (None, None)."""
+    for resource, pattern in _PATTERNS:
+        match = pattern.match(path)
+        if match and (method, resource) in ROUTES:
+            return resource, {k: urllib.parse.unquote(v) for k, v in match.groupdict().items()}
+    for resource, pattern in _PATTERNS:
+        if pattern.match(path):
+            return resource, None
+    return None, None
+
+
+# ---------------------------------------------------------------------------
+# Entry point
+# ---------------------------------------------------------------------------
+
+@measure_cold_start
+def lambda_handler(event, context):
+    method = (event.get("httpMethod") or "").upper()
+    resource = event.get("resource")
+
+    if (method, resource) not in ROUTES:
+        # Behind /{proxy+} (or invoked directly) the resource is not one of
+        # ours, so match the concrete path and rebuild pathParameters.
+        path = event.get("path") or ""
+        resource, path_parameters = resolve(method, path)
+        if resource is None:
+            return error_response(404, "NOT_FOUND", f"No route for {method} {path}")
+        if method == "OPTIONS":
+            return respond(
+                204, "", headers={**CORS_HEADERS, "Access-Control-Allow-Methods": "GET,POST,PATCH,OPTIONS"}
+            )
+        if path_parameters is None:
+            return error_response(405, "METHOD_NOT_ALLOWED", f"{method} is not allowed on {resource}")
+        event = {**event, "resource": resource, "pathParameters": path_parameters or None}
+
+    module_name = ROUTES[(method, resource)]
+    logger.info("Routing %s %s -> %s", method, resource, module_name)
+    return _handler_for(module_name)(event, context)
@@ -0,0 +1,55 @@
+import os
+from decimal import Decimal, InvalidOperation
+
+from api_responses import error_response, json_response
+from aws_clients import lazy_table
+from coldstart import measure_cold_start
+from contract_search import InvalidSearch, search
+from emf_metrics import emit_metrics, timed_step
+from tracing import traced
+
+table = lazy_table(os.environ["CONTRACTS_TABLE"])
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+
+FILTERS = ("fein", "npn", "carrierId", "contractType", "issuedFrom", "issuedTo")
+
+
+def _amount(value, name):
+    if value is None:
+        return None
+    try:
+        return Decimal(value)
+    except InvalidOperation:
+        raise InvalidSearch(f"{name} must be a number") from None
+
+
+@measure_cold_start
+@traced
+@emit_metrics
+def lambda_handler(event, context):
+    query = event.get("queryStringParameters") or {}
+
+    params = {name: query[name] for name in FILTERS if query.get(name)}
+    sort = query.get("sort")  # Optional: issueDate | contractValue, "-" prefix for descending
+    token = query.get("nextToken")  # Optional: from the previous page
+
+    try:
+        params["minValue"] = _amount(query.get("minValue"), "minValue")
+        params["maxValue"] = _amount(query.get("maxValue"), "maxValue")
+        limit = int(query.get("limit", DEFAULT_LIMIT))
+    except InvalidSearch as e:
+        return error_response(400, "INVALID_FILTER", str(e))
+    except ValueError:
+        return error_response(400, "INVALID_LIMIT", "limit must be an integer")
+    if not 1 <= limit <= MAX_LIMIT:
+        return error_response(400, "INVALID_LIMIT", f"limit must be between 1 and {MAX_LIMIT}")
+
+    try:
+        with timed_step("dynamo_query_contracts"):
+            contracts, next_token = search(table, params, limit, sort=sort, token=token)
+    except InvalidSearch as e:
+        return error_response(400, "INVALID_SEARCH", str(e))
+
+    return json_response(200, {"contracts": contracts, "nextToken": next_token}, event=event)
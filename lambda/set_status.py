@@ -3,23 +3,36 @@ import logging
 import os
 import urllib.request
 
-import boto3
-
+from api_responses import error_response, json_response, parse_body
+from aws_clients import lazy_table
+from change_feed import STATUS_STREAM, append_changes
+from coldstart import measure_cold_start
+from emf_metrics import emit_metrics, timed_step
+from fein_versions import bump_version
+from request_validation import validates_body
 from status import Status
+from status_history import put_status
+from tracing import client_span, traced
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
 UPDATE_CONTRACTS_FEIN_URL = os.environ.get("UPDATE_CONTRACTS_FEIN_URL")
 
-dynamodb = boto3.resource("dynamodb")
-table = dynamodb.Table(os.environ["STATUS_TABLE"])
+table = lazy_table(os.environ["STATUS_TABLE"])
+
+feed_table = lazy_table(os.environ.get("CHANGE_FEED_TABLE"))
+versions_table = lazy_table(os.environ.get("VERSIONS_TABLE"))
 
 VALID_STATUSES = {s.name for s in Status}
 
 
+@measure_cold_start
+@traced
+@emit_metrics
+@validates_body("SetStatusRequest")
 def lambda_handler(event, context):
-    body = json.loads(event.get("body") or "{}")
+    body = parse_body(event)
 
     receiving_fein = body.get("receivingFein")  # Required: partition key
     releasing_fein = body.get("releasingFein")  # Required
@@ -47,41 +60,17 @@ def lambda_handler(event, context):
 
     if missing:
         logger.error("Missing required fields: %s", missing)
-        return {
-            "statusCode": 400,
-            "headers": {
-                "Content-Type": "application/json",
-                "Access-Control-Allow-Origin": "*",
-                "Access-Control-Allow-Headers": "Content-Type,Idempotency-Key",
-            },
-            "body": json.dumps(
-                {
-                    "error": {
-                        "code": "MISSING_FIELDS",
-                        "message": f"Missing required fields: {', '.join(missing)}",
-                    }
-                }
-            ),
-        }
+        return error_response(
+            400, "MISSING_FIELDS", f"Missing required fields: {', '.join(missing)}"
+        )
 
     if status not in VALID_STATUSES:
         logger.error("Invalid status '%s'. Valid statuses: %s", status, sorted(VALID_STATUSES))
-        return {
-            "statusCode": 400,
-            "headers": {
-                "Content-Type": "application/json",
-                "Access-Control-Allow-Origin": "*",
-                "Access-Control-Allow-Headers": "Content-Type,Idempotency-Key",
-            },
-            "body": json.dumps(
-                {
-                    "error": {
-                        "code": "INVALID_STATUS",
-                        "message": f"Invalid status '{status}'. Must be one of: {', '.join(sorted(VALID_STATUSES))}",
-                    }
-                }
-            ),
-        }
+        return error_response(
+            400,
+            "INVALID_STATUS",
+            f"Invalid status '{status}'. Must be one of: {', '.join(sorted(VALID_STATUSES))}",
+        )
 
     status_key = f"{carrier_id}#{npn}#{releasing_fein}"
 
@@ -97,8 +86,15 @@ def lambda_handler(event, context):
         item["requirements"] = requirements
 
     logger.info("Writing status to DynamoDB statusKey=%s", status_key)
-    table.put_item(Item=item)
-    logger.info("Status written successfully")
+    with timed_step("dynamo_put_status", carrier=carrier_id):
+        # Current status, its history entry and the pipeline counters go in one transaction
+        item = put_status(table, item)
+        logger.info("Status written successfully")
+
+        if feed_table is not None:
+            append_changes(feed_table, STATUS_STREAM, receiving_fein, [("UPSERT", item)])
+        if versions_table is not None:
+            bump_version(versions_table, STATUS_STREAM, receiving_fein)
 
     if status == "COMPLETED" and UPDATE_CONTRACTS_FEIN_URL:
         logger.info("Status is COMPLETED, calling update_contracts_fein url=%s", UPDATE_CONTRACTS_FEIN_URL)
@@ -108,33 +104,31 @@ def lambda_handler(event, context):
             "releasingFein": releasing_fein,
             "receivingFein": receiving_fein,
         }).encode("utf-8")
-        req = urllib.request.Request(
-            UPDATE_CONTRACTS_FEIN_URL,
-            data=payload,
-            headers={"Content-Type": "application/json"},
-            method="POST",
-        )
         try:
-            urllib.request.urlopen(req)
+            with (
+                timed_step("update_contracts_fein", carrier=carrier_id),
+                client_span("POST update_contracts_fein", UPDATE_CONTRACTS_FEIN_URL) as span,
+            ):
+                req = urllib.request.Request(
+                    UPDATE_CONTRACTS_FEIN_URL,
+                    data=payload,
+                    headers={"Content-Type": "application/json", **span.headers()},
+                    method="POST",
+                )
+                urllib.request.urlopen(req)
             logger.info("update_contracts_fein called successfully")
         except Exception as e:
             logger.error("update_contracts_fein failed: %s", str(e))
 
-    return {
-        "statusCode": 200,
-        "headers": {
-            "Content-Type": "application/json",
-            "Access-Control-Allow-Origin": "*",
-            "Access-Control-Allow-Headers": "Content-Type,Idempotency-Key",
+    return json_response(
+        200,
+        {
+            "receivingFein": receiving_fein,
+            "releasingFein": releasing_fein,
+            "carrierId": carrier_id,
+            "status": status,
+            "npn": npn,
+            "requirements": requirements,
+            "updatedAt": item["updatedAt"],
         },
-        "body": json.dumps(
-            {
-                "receivingFein": receiving_fein,
-                "releasingFein": releasing_fein,
-                "carrierId": carrier_id,
-                "status": status,
-                "npn": npn,
-                "requirements": requirements,
-            }
-        ),
-    }
+    )
@@ -0,0 +1,146 @@
+import logging
+import os
+from collections import defaultdict
+
+from api_responses import error_response, json_response, parse_body
+from aws_clients import lazy_table
+from change_feed import STATUS_STREAM, append_changes
+from coldstart import measure_cold_start
+from emf_metrics import emit_metrics, timed_step
+from fein_versions import bump_version
+from request_validation import InvalidRequest, check
+from status_history import put_statuses
+from tracing import traced
+from update_contracts_fein import update_contracts_fein_bulk
+
+# POST /ats/v1/status:batch — carriers report many status changes at once.
+#
+# Each entry of `statuses` is a SetStatusRequest, validated on its own. The
+# entries are written by status_history.put_statuses: current items read with
+# BatchGetItem, then each status item, its history entry and its pipeline
+# counter change in one conditional TransactWriteItems call per up to 100
+# writes, instead of one transaction per status. The change feed and FEIN
+# versions are written once per FEIN. COMPLETED statuses are grouped into one
+# bulk contract reassignment (update_contracts_fein) rather than one
+# update-fein call each.
+#
+# Entries for the same carrier status are applied in request order, each its
+# own change, so the last one wins and every COMPLETED among them still moves
+# the contracts. Every entry gets a result in request order: 200 with
+# updatedAt, 400 with the reason it was rejected, or 503 when it could not be
+# written (lost races or throttling on every attempt).
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+table = lazy_table(os.environ["STATUS_TABLE"])
+
+feed_table = lazy_table(os.environ.get("CHANGE_FEED_TABLE"))
+versions_table = lazy_table(os.environ.get("VERSIONS_TABLE"))
+
+MAX_BATCH_STATUSES = int(os.environ.get("MAX_BATCH_STATUSES", 500))
+
+REQUIRED_FIELDS = ("receivingFein", "releasingFein", "carrierId", "status", "npn")
+
+
+def _rejected(index, status_code, code, message):
+    return {"index": index, "status": status_code, "error": {"code": code, "message": message}}
+
+
+@measure_cold_start
+@traced
+@emit_metrics
+def lambda_handler(event, context):
+    try:
+        body = parse_body(event)
+    except ValueError:
+        return error_response(400, "INVALID_JSON", "request body must be JSON")
+    entries = body.get("statuses") if isinstance(body, dict) else None  # Required: array of SetStatusRequest
+
+    if not isinstance(entries, list) or not entries:
+        return error_response(400, "INVALID_BATCH", "statuses must be a non-empty array")
+    if len(entries) > MAX_BATCH_STATUSES:
+        return error_response(400, "INVALID_BATCH", f"at most {MAX_BATCH_STATUSES} statuses per batch")
+
+    results = [None] * len(entries)
+    accepted = []  # (index, item) in request order
+    for index, entry in enumerate(entries):
+        try:
+            check("SetStatusRequest", entry)
+        except InvalidRequest as e:
+            results[index] = _rejected(index, 400, "INVALID_REQUEST", str(e).replace("body", f"statuses[{index}]", 1))
+            continue
+        missing = [field for field in REQUIRED_FIELDS if not entry[field]]
+        if missing:
+            results[index] = _rejected(index, 400, "MISSING_FIELDS", f"Missing required fields: {', '.join(missing)}")
+            continue
+
+        item = {
+            "receivingFein": entry["receivingFein"],
+            "statusKey": f"{entry['carrierId']}#{entry['npn']}#{entry['releasingFein']}",
+            "releasingFein": entry["releasingFein"],
+            "carrierId": entry["carrierId"],
+            "status": entry["status"],
+            "npn": entry["npn"],
+        }
+        if "requirements" in entry:
+            item["requirements"] = entry["requirements"]
+        accepted.append((index, item))
+
+    with timed_step("dynamo_batch_put_status"):
+        written = put_statuses(table, [item for _, item in accepted])
+
+    new_items = []  # (index, item written) in request order
+    for (index, _), new in zip(accepted, written):
+        if new is None:
+            results[index] = _rejected(index, 503, "WRITE_FAILED", "the status could not be written; retry it")
+        else:
+            new_items.append((index, new))
+
+    with timed_step("publish_status_changes"):
+        changes = defaultdict(list)
+        for _, new in new_items:
+            changes[new["receivingFein"]].append(("UPSERT", new))
+        for receiving_fein, fein_changes in changes.items():
+            if feed_table is not None:
+                append_changes(feed_table, STATUS_STREAM, receiving_fein, fein_changes)
+            if versions_table is not None:
+                bump_version(versions_table, STATUS_STREAM, receiving_fein)
+
+    # COMPLETED: the agent's contracts move to the receiving IMO, all at once
+    moves = sorted({
+        (new["carrierId"], new["npn"], new["receivingFein"], new["releasingFein"])
+        for _, new in new_items
+        if new["status"] == "COMPLETED"
+    })
+    moved_counts = {}
+    contracts_error = None
+    if moves:
+        try:
+            moved_counts = update_contracts_fein_bulk(moves)
+        except Exception as e:
+            logger.error("Bulk contract reassignment failed for %d transfers: %s", len(moves), str(e))
+            contracts_error = str(e)
+
+    for index, new in new_items:
+        result = {"index": index, "status": 200, "statusKey": new["statusKey"], "updatedAt": new["updatedAt"]}
+        if new["status"] == "COMPLETED":
+            move = (new["carrierId"], new["npn"], new["receivingFein"], new["releasingFein"])
+            if contracts_error is None:
+                result["contractsUpdated"] = moved_counts.get(move, 0)
+            else:
+                result["warnings"] = [f"contract reassignment failed — {contracts_error}"]
+        results[index] = result
+
+    logger.info(
+        "Status batch written=%d rejected=%d completed=%d",
+        len(new_items), len(entries) - len(new_items), len(moves),
+    )
+    return json_response(
+        200,
+        {
+            "written": len(new_items),
+            "rejected": len(entries) - len(new_items),
+            "results": results,
+        },
+    )
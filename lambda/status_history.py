@@ -0,0 +1,458 @@
+import os
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timezone
+
+from boto3.dynamodb.conditions import Key
+from botocore.exceptions import ClientError
+
+from aws_clients import dynamodb_client, dynamodb_resource, lazy_table
+from lifecycle import EXPIRES_AT, TERMINAL_STATUSES, expires_at, stamp_status
+from pipeline_stats import (
+    COUNTED_ATTRIBUTE,
+    is_counted,
+    mark_counted,
+    stats_table,
+    transition_update,
+    transition_updates,
+)
+from status_shards import from_storage, storage_key, to_storage
+
+# Append-only status history beside the current-status items in Status.
+#
+# Status keeps one item per (receivingFein, carrier, npn, releasingFein) that
+# each write replaces. Every change is also recorded as its own StatusHistory
+# item, partitioned by transfer and ordered by time, so a transfer's timeline
+# (and how long each carrier sat in PENDING) is one Query:
+#   transferId=99-7654321-13-3456789-17439285
+#   changeKey=2026-03-01T12:00:00.123Z#allianz#1a2b3c4d
+#   status=PENDING carrierId=allianz npn=17439285 changedAt=2026-03-01T12:00:00.123Z ...
+# transferId is the Transfers id ({receivingFein}-{releasingFein}-{npn}).
+#
+# Agent-centric reads go through the Status table's npn-index GSI instead.
+#
+# put_status also carries the pipeline_stats counter update in the same
+# transaction, and stamps the TTL that retires terminal statuses (lifecycle).
+# put_statuses does the same for many statuses at once (batch endpoints),
+# packing up to MAX_TRANSACT_ITEMS writes per transaction. With
+# STATUS_HISTORY_TABLE (and PIPELINE_STATS_TABLE) unset, put_status only
+# touches Status. Items go through status_shards, so a sharded FEIN's statuses
+# land on their shard partitions; everything here sees the plain FEIN.
+#
+# When a status turns terminal and every carrier status of its transfer is
+# then terminal, the Transfers item gets its expiresAt too (and loses it when
+# a status re-opens); that follows the transaction, and archive_sweep.py
+# stamps whatever a failed follow-up missed. Canceling a transfer closes its
+# open statuses as CANCELED (cancel_transfer_statuses, from patch_transfer).
+
+NPN_INDEX = "npn-index"
+
+MAX_WRITE_ATTEMPTS = 3
+MAX_TRANSACT_ITEMS = 100
+BATCH_GET_SIZE = 100
+BACKOFF_BASE_SECONDS = 0.05
+
+# Transaction failures worth another attempt: lost races, conflicts with other
+# transactions on the same items, throttling
+RETRYABLE_ERRORS = frozenset({
+    "TransactionCanceledException",
+    "TransactionInProgressException",
+    "ProvisionedThroughputExceededException",
+    "ThrottlingException",
+})
+
+history_table = lazy_table(os.environ.get("STATUS_HISTORY_TABLE"))
+transfers_table = lazy_table(os.environ.get("TRANSFERS_TABLE"))
+
+
+def now_iso():
+    return datetime.now(timezone.utc).isoformat(timespec="milliseconds").replace("+00:00", "Z")
+
+
+def transfer_id(receiving_fein, releasing_fein, npn):
+    return f"{receiving_fein}-{releasing_fein}-{npn}"
+
+
+def history_item(status_item):
+    """History entry for a status item that carries updatedAt."""
+    changed_at = status_item["updatedAt"]
+    item = {
+        "transferId": transfer_id(
+            status_item["receivingFein"], status_item["releasingFein"], status_item["npn"]
+        ),
+        "changeKey": f"{changed_at}#{status_item['carrierId']}#{uuid.uuid4().hex[:8]}",
+        "changedAt": changed_at,
+        "receivingFein": status_item["receivingFein"],
+        "releasingFein": status_item["releasingFein"],
+        "carrierId": status_item["carrierId"],
+        "npn": status_item["npn"],
+        "status": status_item["status"],
+    }
+    if "requirements" in status_item:
+        item["requirements"] = status_item["requirements"]
+    return item
+
+
+def _unchanged_condition(old):
+    if old is None:
+        return {"ConditionExpression": "attribute_not_exists(statusKey)"}
+    # Counted or not decides the counter change, so it is part of "unchanged"
+    counted = f"{'attribute_exists' if is_counted(old) else 'attribute_not_exists'}({COUNTED_ATTRIBUTE})"
+    if "updatedAt" not in old:
+        return {
+            "ConditionExpression": f"#status = :oldStatus AND attribute_not_exists(updatedAt) AND {counted}",
+            "ExpressionAttributeNames": {"#status": "status"},
+            "ExpressionAttributeValues": {":oldStatus": old["status"]},
+        }
+    return {
+        "ConditionExpression": f"#status = :oldStatus AND updatedAt = :oldUpdatedAt AND {counted}",
+        "ExpressionAttributeNames": {"#status": "status"},
+        "ExpressionAttributeValues": {":oldStatus": old["status"], ":oldUpdatedAt": old["updatedAt"]},
+    }
+
+
+def _lost_race(error):
+    reasons = error.response.get("CancellationReasons") or []
+    return error.response.get("Error", {}).get("Code") == "TransactionCanceledException" and any(
+        reason.get("Code") == "ConditionalCheckFailed" for reason in reasons
+    )
+
+
+def next_status(item, old, merge=False):
+    """
+    The status item that replaces old (None for a new status): stamps
+    updatedAt, carries initiatedAt forward, sets or clears expiresAt and marks
+    it counted in the pipeline stats. With merge=True old's other attributes
+    are kept.
+    """
+    new = {**old, **item} if merge and old else dict(item)
+    new["updatedAt"] = now_iso()
+    initiated_at = (old or {}).get("initiatedAt")
+    if not initiated_at and new["status"] == "INITIATED":
+        initiated_at = new["updatedAt"]
+    if initiated_at:
+        new["initiatedAt"] = initiated_at
+    return stamp_status(mark_counted(new), old)
+
+
+def _status_writes(status_table, new, old, moved_from):
+    """
+    TransactWriteItems writes replacing old with new (moving it off the plain
+    partition when moved_from is set) plus its history entry, each conditional
+    on the replaced item being unchanged.
+    """
+    # The resource's client serializes plain Python values, like Table does
+    if moved_from is None:
+        writes = [{"Put": {"TableName": status_table.name, "Item": to_storage(new), **_unchanged_condition(old)}}]
+    else:
+        plain_key = {"receivingFein": new["receivingFein"], "statusKey": new["statusKey"]}
+        writes = [
+            {"Put": {"TableName": status_table.name, "Item": to_storage(new), **_unchanged_condition(None)}},
+            {"Delete": {"TableName": status_table.name, "Key": plain_key, **_unchanged_condition(moved_from)}},
+        ]
+    if history_table is not None:
+        writes.append({"Put": {"TableName": history_table.name, "Item": history_item(new)}})
+    return writes
+
+
+def put_status(status_table, item, merge=False):
+    """
+    Write a carrier status: the Status item, its history entry and its
+    pipeline counter change, in one TransactWriteItems call.
+
+    The current item is read first and the write is conditional on it being
+    unchanged, so counters move from the status actually replaced (a write
+    that loses a race re-reads and retries). With merge=True the current
+    item's other attributes are kept, so callers can change only the status.
+    Stamps updatedAt (and initiatedAt, expiresAt) and returns the item
+    written.
+
+    For a FEIN that was sharded after this status was first written, the
+    item still in the plain partition is the current one; it is moved onto
+    its shard in the same transaction.
+    """
+    if history_table is None and stats_table is None:
+        item["updatedAt"] = now_iso()
+        stamp_status(item)
+        status_table.put_item(Item=to_storage(item))
+        retire_transfers(status_table, [(None, item)])
+        return item
+
+    key = storage_key(item["receivingFein"], item["statusKey"])
+    plain_key = {"receivingFein": item["receivingFein"], "statusKey": item["statusKey"]}
+    for attempt in range(1, MAX_WRITE_ATTEMPTS + 1):
+        old = from_storage(status_table.get_item(Key=key, ConsistentRead=True).get("Item"))
+        moved_from = None
+        if old is None and key != plain_key:
+            old = status_table.get_item(Key=plain_key, ConsistentRead=True).get("Item")
+            moved_from = old
+        new = next_status(item, old, merge)
+
+        transact_items = _status_writes(status_table, new, old, moved_from)
+        counters = transition_update(old, new)
+        if counters is not None:
+            transact_items.append(counters)
+
+        try:
+            dynamodb_client().transact_write_items(TransactItems=transact_items)
+        except ClientError as e:
+            if _lost_race(e) and attempt < MAX_WRITE_ATTEMPTS:
+                continue
+            raise
+        retire_transfers(status_table, [(old, new)])
+        return new
+
+
+def _key_tuple(item):
+    return item["receivingFein"], item["statusKey"]
+
+
+def _backoff(attempt):
+    time.sleep(BACKOFF_BASE_SECONDS * 2 ** (attempt - 1))
+
+
+def _batch_get(status_table, keys):
+    """Items for storage keys, as {(receivingFein, statusKey): item}, as stored."""
+    found = {}
+    for start in range(0, len(keys), BATCH_GET_SIZE):
+        request = {status_table.name: {"Keys": keys[start:start + BATCH_GET_SIZE], "ConsistentRead": True}}
+        for attempt in range(1, MAX_WRITE_ATTEMPTS + 1):
+            response = dynamodb_resource().batch_get_item(RequestItems=request)
+            for stored in response["Responses"].get(status_table.name, []):
+                found[_key_tuple(stored)] = stored
+            request = response.get("UnprocessedKeys")
+            if not request:
+                break
+            if attempt == MAX_WRITE_ATTEMPTS:
+                raise RuntimeError(f"{len(request[status_table.name]['Keys'])} status keys left unread")
+            _backoff(attempt)
+    return found
+
+
+def _read_current(status_table, items):
+    """
+    (old, moved_from) for each item's status, read as put_status reads one:
+    from its shard, or from the plain partition it still has to move off.
+    """
+    lookups = {}
+    for item in items:
+        stored = storage_key(*_key_tuple(item))
+        lookups[_key_tuple(stored)] = stored
+        lookups[_key_tuple(item)] = {"receivingFein": item["receivingFein"], "statusKey": item["statusKey"]}
+    found = _batch_get(status_table, list(lookups.values()))
+    current = []
+    for item in items:
+        plain = _key_tuple(item)
+        stored = _key_tuple(storage_key(*plain))
+        if stored in found:
+            current.append((from_storage(found[stored]), None))
+        elif stored != plain and plain in found:
+            current.append((found[plain], found[plain]))
+        else:
+            current.append((None, None))
+    return current
+
+
+def _transactions(status_table, items, current, merge):
+    """
+    Packs the writes for items (one per status) into transactions of at most
+    MAX_TRANSACT_ITEMS, counter updates merged per stats item. Yields
+    (positions, (old, new) pairs, TransactWriteItems).
+    """
+    chunk = []
+    size = 0
+    stats_keys = set()
+    for position, (item, (old, moved_from)) in enumerate(zip(items, current)):
+        new = next_status(item, old, merge)
+        writes = _status_writes(status_table, new, old, moved_from)
+        stats_key = (new["receivingFein"], new["carrierId"])
+        added = len(writes) + (stats_table is not None and stats_key not in stats_keys)
+        if chunk and size + added > MAX_TRANSACT_ITEMS:
+            yield _transaction(chunk)
+            chunk, size, stats_keys = [], 0, set()
+            added = len(writes) + (stats_table is not None)
+        chunk.append((position, old, new, writes))
+        size += added
+        stats_keys.add(stats_key)
+    if chunk:
+        yield _transaction(chunk)
+
+
+def _transaction(chunk):
+    writes = [write for _, _, _, entry_writes in chunk for write in entry_writes]
+    writes.extend(transition_updates([(old, new) for _, old, new, _ in chunk]))
+    return [position for position, _, _, _ in chunk], [(old, new) for _, old, new, _ in chunk], writes
+
+
+def _write_round(status_table, items, merge):
+    """
+    Writes items, one per status, retrying the transactions that fail.
+    Returns (old, new) for each, None where every attempt failed.
+    """
+    written = [None] * len(items)
+    pending = list(range(len(items)))
+    for attempt in range(1, MAX_WRITE_ATTEMPTS + 1):
+        pending_items = [items[position] for position in pending]
+        current = _read_current(status_table, pending_items)
+        failed = []
+        for positions, transitions, writes in _transactions(status_table, pending_items, current, merge):
+            try:
+                dynamodb_client().transact_write_items(TransactItems=writes)
+            except ClientError as e:
+                if e.response.get("Error", {}).get("Code") not in RETRYABLE_ERRORS:
+                    raise
+                failed.extend(pending[position] for position in positions)
+                continue
+            for position, transition in zip(positions, transitions):
+                written[pending[position]] = transition
+        if not failed:
+            break
+        pending = failed
+        if attempt < MAX_WRITE_ATTEMPTS:
+            _backoff(attempt)
+    return written
+
+
+def put_statuses(status_table, items, merge=False):
+    """
+    Write many carrier statuses the way put_status writes one: each status
+    item with its history entry and pipeline counter change, conditional on
+    the item it replaces, in TransactWriteItems calls of up to
+    MAX_TRANSACT_ITEMS writes (counter changes summed per FEIN and carrier).
+
+    Items for the same status are applied in order, each as its own change
+    (history entry, counters), so the last one is the one left. A transaction
+    that loses a race or is throttled is re-read and retried.
+
+    Returns the item written for each of items, in order, or None for those
+    that could not be written (and for the ones after them for the same
+    status, which would otherwise be written out of order).
+    """
+    written = [None] * len(items)
+    # Round r writes each status's r-th item: an item only appears once per
+    # transaction, and each round starts from the one before
+    rounds = []
+    seen = defaultdict(int)
+    for position, item in enumerate(items):
+        repeat = seen[_key_tuple(item)]
+        seen[_key_tuple(item)] += 1
+        if repeat == len(rounds):
+            rounds.append([])
+        rounds[repeat].append(position)
+
+    failed = set()
+    transitions = []
+    for positions in rounds:
+        positions = [position for position in positions if _key_tuple(items[position]) not in failed]
+        round_written = _write_round(status_table, [items[position] for position in positions], merge)
+        for position, transition in zip(positions, round_written):
+            if transition is None:
+                failed.add(_key_tuple(items[position]))
+                continue
+            written[position] = transition[1]
+            transitions.append(transition)
+    retire_transfers(status_table, transitions)
+    return written
+
+
+def cancel_transfer_statuses(status_table, transfer):
+    """
+    Closes the carrier statuses a canceled transfer leaves open: each of its
+    carriers' statuses that is not terminal yet becomes CANCELED (history,
+    counters, expiresAt as any status change). Returns the items written.
+    """
+    npn = transfer["agentNpn"]
+    releasing_fein = transfer["releasingImoFein"]
+    keys = [
+        {"receivingFein": transfer["receivingImoFein"], "statusKey": f"{carrier_id}#{npn}#{releasing_fein}"}
+        for carrier_id in transfer.get("carrierIds") or []
+    ]
+    open_statuses = [
+        {**key, "status": "CANCELED"}
+        for key, (old, _) in zip(keys, _read_current(status_table, keys))
+        if old is not None and old.get("status") not in TERMINAL_STATUSES
+    ]
+    if not open_statuses:
+        return []
+    return [new for new in put_statuses(status_table, open_statuses, merge=True) if new is not None]
+
+
+def _transfer_finished(status_table, transfer):
+    """Whether every carrier the transfer was routed to has a terminal status."""
+    npn = transfer["agentNpn"]
+    releasing_fein = transfer["releasingImoFein"]
+    keys = [
+        {"receivingFein": transfer["receivingImoFein"], "statusKey": f"{carrier_id}#{npn}#{releasing_fein}"}
+        for carrier_id in transfer.get("carrierIds") or []
+    ]
+    return bool(keys) and all(
+        old is not None and old.get("status") in TERMINAL_STATUSES for old, _ in _read_current(status_table, keys)
+    )
+
+
+def _update_transfer_expiry(transfer_key, update):
+    try:
+        transfers_table.update_item(Key={"id": transfer_key}, **update)
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") != "ConditionalCheckFailedException":
+            raise
+
+
+def retire_transfers(status_table, transitions):
+    """
+    Sets or clears the Transfers expiresAt after status changes, as (old, new)
+    pairs: a transfer whose carrier statuses are now all terminal expires
+    like they do; one whose terminal status re-opened no longer expires
+    (unless it was canceled).
+    """
+    if transfers_table is None or expires_at() is None:
+        return
+    finishing = set()
+    reopened = set()
+    for old, new in transitions:
+        transfer_key = transfer_id(new["receivingFein"], new["releasingFein"], new["npn"])
+        was_terminal = bool(old) and old.get("status") in TERMINAL_STATUSES
+        if new["status"] in TERMINAL_STATUSES:
+            finishing.add(transfer_key)
+        elif was_terminal:
+            reopened.add(transfer_key)
+
+    for transfer_key in reopened - finishing:
+        _update_transfer_expiry(transfer_key, {
+            "UpdateExpression": f"REMOVE {EXPIRES_AT}",
+            "ConditionExpression": f"attribute_exists({EXPIRES_AT}) AND #state <> :canceled",
+            "ExpressionAttributeNames": {"#state": "state"},
+            "ExpressionAttributeValues": {":canceled": "CANCELED"},
+        })
+    for transfer_key in finishing:
+        transfer = transfers_table.get_item(Key={"id": transfer_key}, ConsistentRead=True).get("Item")
+        if transfer is None or EXPIRES_AT in transfer or not _transfer_finished(status_table, transfer):
+            continue
+        _update_transfer_expiry(transfer_key, {
+            "UpdateExpression": f"SET {EXPIRES_AT} = :expiresAt",
+            "ConditionExpression": f"attribute_exists(id) AND attribute_not_exists({EXPIRES_AT})",
+            "ExpressionAttributeValues": {":expiresAt": expires_at()},
+        })
+
+
+def query_history(transfer_key):
+    kwargs = {"KeyConditionExpression": Key("transferId").eq(transfer_key)}
+    items = []
+    while True:
+        response = history_table.query(**kwargs)
+        items.extend(response["Items"])
+        if "LastEvaluatedKey" not in response:
+            return items
+        kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+
+def query_by_npn(status_table, npn):
+    kwargs = {"IndexName": NPN_INDEX, "KeyConditionExpression": Key("npn").eq(npn)}
+    items = []
+    while True:
+        response = status_table.query(**kwargs)
+        items.extend(from_storage(item) for item in response["Items"])
+        if "LastEvaluatedKey" not in response:
+            return items
+        kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
@@ -0,0 +1,110 @@
+import contextvars
+import json
+import os
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from boto3.dynamodb.conditions import Key
+
+# Optional write sharding for receiving FEINs whose Status partition gets hot.
+#
+# Status is partitioned by receivingFein, so one large IMO onboarding
+# thousands of agents puts every status write and read on a single key. A FEIN
+# listed in STATUS_SHARDS spreads its items over N partitions instead:
+#   STATUS_SHARDS={"99-7654321": 8}
+#   receivingFein=99-7654321#5 statusKey=allianz#17439285#13-3456789
+# where the shard is a stable hash of statusKey, so a given carrier/agent
+# status always lands on the same shard and conditional writes still see the
+# previous item. "*" sets a default for every FEIN.
+#
+# The suffix never leaves this module: writers pass items with the plain FEIN
+# through to_storage(), readers get them back through from_storage(), and
+# query_fein() reads the FEIN's shards in parallel and merges them. Items
+# written before a FEIN was sharded stay readable (the plain partition is read
+# too); when both copies exist the newer one wins. FEINs never contain "#".
+#
+# STATUS_SHARDS must be the same for every function (Globals in template.yaml).
+
+STATUS_SHARDS = {fein: int(count) for fein, count in json.loads(os.environ.get("STATUS_SHARDS") or "{}").items()}
+SHARD_READ_THREADS = int(os.environ.get("STATUS_SHARD_READ_THREADS", 8))
+
+_SEPARATOR = "#"
+
+_executor = None
+
+
+def shard_count(fein):
+    return max(1, STATUS_SHARDS.get(fein, STATUS_SHARDS.get("*", 1)))
+
+
+def partition_key(fein, status_key):
+    shards = shard_count(fein)
+    if shards == 1:
+        return fein
+    return f"{fein}{_SEPARATOR}{zlib.crc32(status_key.encode('utf-8')) % shards}"
+
+
+def partitions(fein):
+    shards = shard_count(fein)
+    if shards == 1:
+        return [fein]
+    return [fein] + [f"{fein}{_SEPARATOR}{shard}" for shard in range(shards)]
+
+
+def to_storage(item):
+    """The item as stored: receivingFein carries the shard suffix."""
+    partition = partition_key(item["receivingFein"], item["statusKey"])
+    if partition == item["receivingFein"]:
+        return item
+    return {**item, "receivingFein": partition}
+
+
+def from_storage(item):
+    """The item as callers see it: the plain receiving FEIN."""
+    if item is None or _SEPARATOR not in item.get("receivingFein", ""):
+        return item
+    return {**item, "receivingFein": item["receivingFein"].split(_SEPARATOR, 1)[0]}
+
+
+def storage_key(receiving_fein, status_key):
+    return {"receivingFein": partition_key(receiving_fein, status_key), "statusKey": status_key}
+
+
+def _query_partition(table, partition):
+    kwargs = {"KeyConditionExpression": Key("receivingFein").eq(partition)}
+    items = []
+    while True:
+        response = table.query(**kwargs)
+        items.extend(response["Items"])
+        if "LastEvaluatedKey" not in response:
+            return items
+        kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+
+def _pool():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=SHARD_READ_THREADS, thread_name_prefix="status-shard")
+    return _executor
+
+
+def query_fein(table, fein):
+    """Every status item for a receiving FEIN, in statusKey order, across its shards."""
+    keys = partitions(fein)
+    if len(keys) == 1:
+        return [from_storage(item) for item in _query_partition(table, fein)]
+
+    # Each shard query runs in a copy of this request's context so its
+    # DynamoDB calls are still counted against the request
+    futures = [
+        _pool().submit(contextvars.copy_context().run, _query_partition, table, partition)
+        for partition in keys
+    ]
+    merged = {}
+    for future in futures:
+        for item in future.result():
+            item = from_storage(item)
+            current = merged.get(item["statusKey"])
+            if current is None or item.get("updatedAt", "") > current.get("updatedAt", ""):
+                merged[item["statusKey"]] = item
+    return [merged[status_key] for status_key in sorted(merged)]
@@ -0,0 +1,256 @@
+import contextlib
+import contextvars
+import functools
+import json
+import logging
+import os
+import re
+import secrets
+import time
+import urllib.request
+
+from api_responses import request_header
+
+# Correlation ids and OpenTelemetry-compatible trace spans.
+#
+# A transfer crosses several Lambdas over HTTP (create_transfer -> set_status
+# -> update_contracts_fein, or the Bedrock action group -> any route). Each
+# handler wrapped in @traced joins the caller's trace from the W3C
+# `traceparent` header (or API Gateway's X-Ray header), or starts a new one at
+# the edge, and opens a SERVER span. Outbound calls made inside
+# `with client_span(...) as span:` send span.headers() so the next hop becomes
+# a child span. The correlation id (incoming X-Correlation-Id, else the trace
+# id) is echoed on the response and added to every log line.
+#
+# Spans are exported as OTLP/HTTP JSON to OTEL_EXPORTER_OTLP_ENDPOINT (e.g. a
+# local collector or the ADOT Lambda extension on http://localhost:4318) at
+# the end of each invocation; with no endpoint configured nothing is sent.
+
+TRACEPARENT_HEADER = "traceparent"
+CORRELATION_ID_HEADER = "X-Correlation-Id"
+
+OTEL_EXPORTER_OTLP_ENDPOINT = os.environ.get("OTEL_EXPORTER_OTLP_ENDPOINT", "").rstrip("/")
+OTEL_SERVICE_NAME = os.environ.get("OTEL_SERVICE_NAME", "ats-api")
+OTLP_EXPORT_TIMEOUT_SECONDS = float(os.environ.get("OTLP_EXPORT_TIMEOUT_SECONDS", 1))
+
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+SPAN_KIND_CLIENT = 3
+
+_STATUS_OK = 1
+_STATUS_ERROR = 2
+
+_TRACEPARENT_RE = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+_XRAY_ROOT_RE = re.compile(r"Root=1-([0-9a-f]{8})-([0-9a-f]{24})")
+
+logger = logging.getLogger(__name__)
+
+
+class Span:
+    __slots__ = (
+        "name", "kind", "trace_id", "span_id", "parent_span_id",
+        "start_ns", "end_ns", "attributes", "error",
+    )
+
+    def __init__(self, name, kind, trace_id, parent_span_id=None, attributes=None):
+        self.name = name
+        self.kind = kind
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_span_id = parent_span_id
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = dict(attributes or {})
+        self.error = False
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def headers(self):
+        """Propagation headers for an outbound request made within this span."""
+        headers = {TRACEPARENT_HEADER: f"00-{self.trace_id}-{self.span_id}-01"}
+        correlation_id = current_correlation_id()
+        if correlation_id:
+            headers[CORRELATION_ID_HEADER] = correlation_id
+        return headers
+
+    def to_otlp(self):
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns or time.time_ns()),
+            "attributes": [_otlp_attribute(k, v) for k, v in self.attributes.items() if v is not None],
+            "status": {"code": _STATUS_ERROR if self.error else _STATUS_OK},
+        }
+        if self.parent_span_id:
+            span["parentSpanId"] = self.parent_span_id
+        return span
+
+
+class _Trace:
+    __slots__ = ("correlation_id", "span", "finished")
+
+    def __init__(self, correlation_id, span):
+        self.correlation_id = correlation_id
+        self.span = span
+        self.finished = []
+
+
+_current = contextvars.ContextVar("ats_trace", default=None)
+
+
+def _otlp_attribute(key, value):
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+def current_correlation_id():
+    trace = _current.get()
+    return trace.correlation_id if trace else None
+
+
+def current_trace_id():
+    trace = _current.get()
+    return trace.span.trace_id if trace else None
+
+
+def _parent_context(event):
+    """(trace_id, parent_span_id) from traceparent, else the X-Ray trace header."""
+    traceparent = request_header(event, TRACEPARENT_HEADER)
+    match = _TRACEPARENT_RE.match((traceparent or "").strip().lower())
+    if match and match.group(1) != "0" * 32:
+        return match.group(1), match.group(2)
+
+    xray = request_header(event, "X-Amzn-Trace-Id")
+    match = _XRAY_ROOT_RE.search(xray or "")
+    if match:
+        return match.group(1) + match.group(2), None
+
+    return secrets.token_hex(16), None
+
+
+@contextlib.contextmanager
+def start_span(name, kind=SPAN_KIND_INTERNAL, attributes=None):
+    """Child span of the current span (or a new trace outside a handler)."""
+    trace = _current.get()
+    if trace is None:
+        span = Span(name, kind, secrets.token_hex(16), attributes=attributes)
+        trace = _Trace(span.trace_id, span)
+        token = _current.set(trace)
+    else:
+        span = Span(name, kind, trace.span.trace_id, trace.span.span_id, attributes)
+        child = _Trace(trace.correlation_id, span)
+        # Shares the finished list with the enclosing handler so it is exported once
+        child.finished = trace.finished
+        token = _current.set(child)
+
+    try:
+        yield span
+    except BaseException:
+        span.error = True
+        raise
+    finally:
+        span.end_ns = time.time_ns()
+        _current.reset(token)
+        trace.finished.append(span)
+
+
+def client_span(name, url, attributes=None):
+    """CLIENT span around one outbound HTTP call; send span.headers() with it."""
+    return start_span(name, SPAN_KIND_CLIENT, {"http.url": url, **(attributes or {})})
+
+
+def _export(spans):
+    payload = {
+        "resourceSpans": [
+            {
+                "resource": {"attributes": [_otlp_attribute("service.name", OTEL_SERVICE_NAME)]},
+                "scopeSpans": [{"scope": {"name": "ats.tracing"}, "spans": [s.to_otlp() for s in spans]}],
+            }
+        ]
+    }
+    req = urllib.request.Request(
+        f"{OTEL_EXPORTER_OTLP_ENDPOINT}/v1/traces",
+        data=json.dumps(payload).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+        method="POST",
+    )
+    try:
+        urllib.request.urlopen(req, timeout=OTLP_EXPORT_TIMEOUT_SECONDS).close()
+    except Exception as e:
+        logger.warning("Span export to %s failed: %s", OTEL_EXPORTER_OTLP_ENDPOINT, e)
+
+
+def traced(handler):
+    route = handler.__module__.rsplit(".", 1)[-1]
+
+    @functools.wraps(handler)
+    def wrapper(event, context):
+        trace_id, parent_span_id = _parent_context(event)
+        correlation_id = request_header(event, CORRELATION_ID_HEADER) or trace_id
+        span = Span(
+            route,
+            SPAN_KIND_SERVER,
+            trace_id,
+            parent_span_id,
+            {
+                "http.method": event.get("httpMethod"),
+                "http.route": event.get("resource"),
+                "faas.invocation_id": getattr(context, "aws_request_id", None),
+                "ats.correlation_id": correlation_id,
+            },
+        )
+        trace = _Trace(correlation_id, span)
+        token = _current.set(trace)
+        try:
+            response = handler(event, context)
+            if isinstance(response, dict):
+                status_code = response.get("statusCode")
+                span.set_attribute("http.status_code", status_code)
+                span.error = status_code is None or status_code >= 500
+                response["headers"] = {**(response.get("headers") or {}), CORRELATION_ID_HEADER: correlation_id}
+            return response
+        except BaseException:
+            span.error = True
+            raise
+        finally:
+            span.end_ns = time.time_ns()
+            _current.reset(token)
+            trace.finished.append(span)
+            if OTEL_EXPORTER_OTLP_ENDPOINT:
+                _export(trace.finished)
+
+    return wrapper
+
+
+# ---------------------------------------------------------------------------
+# Log correlation: records logged during a traced request are prefixed with
+# the correlation id, whatever formatter the runtime installed.
+# ---------------------------------------------------------------------------
+
+
+class CorrelationIdFilter(logging.Filter):
+    def filter(self, record):
+        trace = _current.get()
+        if trace is not None and not getattr(record, "correlation_id", None):
+            record.correlation_id = trace.correlation_id
+            record.msg = f"correlationId={trace.correlation_id} {record.msg}"
+        return True
+
+
+def install_log_correlation(target=None):
+    target = target or logging.getLogger()
+    for log_handler in target.handlers:
+        if not any(isinstance(f, CorrelationIdFilter) for f in log_handler.filters):
+            log_handler.addFilter(CorrelationIdFilter())
+
+
+install_log_correlation()
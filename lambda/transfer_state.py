@@ -0,0 +1,110 @@
+# Single-round-trip transfer updates shared by patch_transfer and
+# release_transfer_to_carriers.
+#
+# Every change is one conditional UpdateItem with ReturnValues=ALL_NEW, so
+# there is no read-modify-write: concurrent note-adders each append with
+# list_append, and a cancel racing a release is decided by DynamoDB's
+# condition on `state`. Each write bumps `version`; callers that pass
+# expected_version only succeed if the transfer has not changed since.
+#
+# A failed condition raises ClientError; conflict_item(e) returns the item
+# as it was at that moment (ReturnValuesOnConditionCheckFailure=ALL_OLD), or
+# None when the transfer does not exist.
+
+from datetime import datetime, timezone
+
+from boto3.dynamodb.types import TypeDeserializer
+
+from lifecycle import expires_at
+
+CANCELABLE_STATES = ["SUBMITTED", "RELEASED"]
+RELEASABLE_STATES = ["SUBMITTED", "RELEASED"]
+
+_deserializer = TypeDeserializer()
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat(timespec="seconds").replace("+00:00", "Z")
+
+
+def _update(table, transfer_id, update_expression, names, values, from_states=None, expected_version=None):
+    names = {**names, "#version": "version"}
+    values = {**values, ":zero": 0, ":one": 1}
+
+    conditions = ["attribute_exists(id)"]
+    if from_states:
+        names["#state"] = "state"
+        placeholders = []
+        for i, state in enumerate(from_states):
+            values[f":from{i}"] = state
+            placeholders.append(f":from{i}")
+        conditions.append(f"#state IN ({', '.join(placeholders)})")
+    if expected_version is not None:
+        conditions.append("#version = :expected")
+        values[":expected"] = expected_version
+
+    return table.update_item(
+        Key={"id": transfer_id},
+        UpdateExpression=f"{update_expression}, #version = if_not_exists(#version, :zero) + :one",
+        ConditionExpression=" AND ".join(conditions),
+        ExpressionAttributeNames=names,
+        ExpressionAttributeValues=values,
+        ReturnValues="ALL_NEW",
+        ReturnValuesOnConditionCheckFailure="ALL_OLD",
+    )["Attributes"]
+
+
+def add_note(table, transfer_id, note, expected_version=None):
+    now = _now()
+    return _update(
+        table,
+        transfer_id,
+        "SET #notes = list_append(if_not_exists(#notes, :empty), :note), updatedAt = :now",
+        {"#notes": "noteLog"},
+        {":empty": [], ":note": [{"note": note, "addedAt": now}], ":now": now},
+        expected_version=expected_version,
+    )
+
+
+def cancel(table, transfer_id, reason=None, expected_version=None):
+    update = "SET #state = :canceled, updatedAt = :now, canceledAt = :now"
+    values = {":canceled": "CANCELED", ":now": _now()}
+    if reason:
+        update += ", cancelReason = :reason"
+        values[":reason"] = reason
+    # CANCELED is terminal: the transfer leaves the table after the retention window
+    expiry = expires_at()
+    if expiry is not None:
+        update += ", expiresAt = :expiresAt"
+        values[":expiresAt"] = expiry
+    return _update(
+        table,
+        transfer_id,
+        update,
+        {},
+        values,
+        from_states=CANCELABLE_STATES,
+        expected_version=expected_version,
+    )
+
+
+def mark_released(table, transfer_id):
+    return _update(
+        table,
+        transfer_id,
+        "SET #state = :released, updatedAt = :now, releasedAt = :now",
+        {},
+        {":released": "RELEASED", ":now": _now()},
+        from_states=RELEASABLE_STATES,
+    )
+
+
+def is_condition_failure(error):
+    return error.response.get("Error", {}).get("Code") == "ConditionalCheckFailedException"
+
+
+def conflict_item(error):
+    raw_item = error.response.get("Item")
+    if not raw_item:
+        return None
+    return {k: _deserializer.deserialize(v) for k, v in raw_item.items()}
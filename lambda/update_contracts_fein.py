@@ -1,50 +1,164 @@
-import json
 import os
+from collections import defaultdict
 
-import boto3
-from boto3.dynamodb.conditions import Attr
+from boto3.dynamodb.conditions import Attr, Key
+from botocore.exceptions import ClientError
 
-dynamodb = boto3.resource("dynamodb")
-table = dynamodb.Table(os.environ["CONTRACTS_TABLE"])
+from api_responses import error_response, json_response, parse_body
+from aws_clients import dynamodb_client, lazy_table
+from change_feed import CONTRACTS_STREAM, append_changes
+from coldstart import measure_cold_start
+from contract_aggregates import delta_updates, move_deltas
+from contract_search import NPN_INDEX
+from emf_metrics import emit_metrics, timed_step
+from fein_versions import bump_version
+from request_validation import validates_body
+from tracing import traced
+from transfer_state import is_condition_failure
 
+table = lazy_table(os.environ["CONTRACTS_TABLE"])
 
-def update_contracts_fein(carrier_id, npn, receiving_fein, releasing_fein):
-    # Scan for contracts matching carrierId, npn, and releasingFein
-    response = table.scan(
-        FilterExpression=(
-            Attr("carrierId").eq(carrier_id)
-            & Attr("npn").eq(npn)
-            & Attr("fein").eq(releasing_fein)
+aggregates_table = lazy_table(os.environ.get("CONTRACT_AGGREGATES_TABLE"))
+feed_table = lazy_table(os.environ.get("CHANGE_FEED_TABLE"))
+versions_table = lazy_table(os.environ.get("VERSIONS_TABLE"))
+
+def _query_npn_carrier(carrier_id, npn, filter_expression=None):
+    # The agent's contracts with one carrier: searchKey starts with carrierId#
+    kwargs = {
+        "IndexName": NPN_INDEX,
+        "KeyConditionExpression": Key("npn").eq(npn) & Key("searchKey").begins_with(f"{carrier_id}#"),
+    }
+    if filter_expression is not None:
+        kwargs["FilterExpression"] = filter_expression
+    items = []
+    while True:
+        response = table.query(**kwargs)
+        items.extend(response["Items"])
+        if "LastEvaluatedKey" not in response:
+            return items
+        kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+
+def find_contracts(carrier_id, npn, releasing_fein):
+    # Contracts matching carrierId, npn, and releasingFein, from the npn search index
+    return _query_npn_carrier(carrier_id, npn, Attr("fein").eq(releasing_fein))
+
+
+def find_contracts_bulk(keys):
+    """
+    Contracts for many (carrierId, npn, releasingFein) keys at once: one
+    npn-search-index Query per agent and carrier, whatever the releasing FEINs.
+    """
+    releasing_feins = defaultdict(set)
+    for carrier_id, npn, releasing_fein in keys:
+        releasing_feins[(carrier_id, npn)].add(releasing_fein)
+    items = []
+    for (carrier_id, npn), feins in releasing_feins.items():
+        items.extend(item for item in _query_npn_carrier(carrier_id, npn) if item.get("fein") in feins)
+    return items
+
+
+def _contract_moved_away(error):
+    # update_item fails with the condition; the transaction is canceled with it as its first reason
+    if is_condition_failure(error):
+        return True
+    reasons = error.response.get("CancellationReasons") or [{}]
+    return reasons[0].get("Code") == "ConditionalCheckFailed"
+
+
+def _move_contract(item, receiving_fein, releasing_fein):
+    """
+    Reassign one contract, with its aggregate deltas in the same transaction
+    so the per-FEIN aggregates can never drift from the contracts. The write
+    is conditional on the contract still being on the releasing FEIN; returns
+    False when it no longer is (moved by someone else, nothing counted).
+    """
+    update = {
+        "Key": {"id": item["id"]},
+        "UpdateExpression": "SET fein = :new_fein",
+        "ConditionExpression": "fein = :old_fein",
+        "ExpressionAttributeValues": {":new_fein": receiving_fein, ":old_fein": releasing_fein},
+    }
+    try:
+        if aggregates_table is None:
+            table.update_item(**update)
+        else:
+            dynamodb_client().transact_write_items(
+                TransactItems=[
+                    {"Update": {"TableName": table.name, **update}},
+                    *delta_updates(aggregates_table, move_deltas([item], releasing_fein, receiving_fein)),
+                ]
+            )
+    except ClientError as e:
+        if _contract_moved_away(e):
+            return False
+        raise
+    return True
+
+
+def move_contracts(items, receiving_fein, releasing_fein, carrier=None):
+    """
+    Reassign contracts of the releasing FEIN to the receiving FEIN, with their
+    aggregates, feed and versions. Returns the contracts actually moved.
+    """
+    with timed_step("dynamo_update_contracts", carrier=carrier):
+        items = [item for item in items if _move_contract(item, receiving_fein, releasing_fein)]
+
+    # Both IMOs see the move on their contracts feed
+    if feed_table is not None and items:
+        append_changes(
+            feed_table, CONTRACTS_STREAM, releasing_fein,
+            [("REMOVE", {"id": item["id"]}) for item in items],
         )
-    )
-
-    items = response["Items"]
-
-    # Handle pagination in case there are more results
-    while "LastEvaluatedKey" in response:
-        response = table.scan(
-            FilterExpression=(
-                Attr("carrierId").eq(carrier_id)
-                & Attr("npn").eq(npn)
-                & Attr("fein").eq(releasing_fein)
-            ),
-            ExclusiveStartKey=response["LastEvaluatedKey"],
+        append_changes(
+            feed_table, CONTRACTS_STREAM, receiving_fein,
+            [("UPSERT", {**item, "fein": receiving_fein}) for item in items],
         )
-        items.extend(response["Items"])
+    if versions_table is not None and items:
+        bump_version(versions_table, CONTRACTS_STREAM, releasing_fein)
+        bump_version(versions_table, CONTRACTS_STREAM, receiving_fein)
+    return items
+
+
+def update_contracts_fein(carrier_id, npn, receiving_fein, releasing_fein):
+    with timed_step("dynamo_query_contracts", carrier=carrier_id):
+        items = find_contracts(carrier_id, npn, releasing_fein)
+    return len(move_contracts(items, receiving_fein, releasing_fein, carrier=carrier_id))
 
-    # Update each matching contract's fein to the receiving fein
+
+def update_contracts_fein_bulk(moves):
+    """
+    Reassign contracts for many COMPLETED transfers, given as
+    (carrierId, npn, receivingFein, releasingFein) tuples. Returns the number
+    of contracts moved per tuple.
+    """
+    receiving_by_key = {(carrier_id, npn, releasing): receiving for carrier_id, npn, receiving, releasing in moves}
+    with timed_step("dynamo_query_contracts"):
+        items = find_contracts_bulk(receiving_by_key.keys())
+
+    by_move = defaultdict(list)
     for item in items:
-        table.update_item(
-            Key={"id": item["id"]},
-            UpdateExpression="SET fein = :new_fein",
-            ExpressionAttributeValues={":new_fein": receiving_fein},
-        )
+        key = (item["carrierId"], item["npn"], item["fein"])
+        by_move[(*key[:2], receiving_by_key[key], key[2])].append(item)
 
-    return len(items)
+    # One write pass, feed append and version bump per pair of IMOs
+    by_feins = defaultdict(list)
+    for (_, _, receiving_fein, releasing_fein), move_items in by_move.items():
+        by_feins[(receiving_fein, releasing_fein)].extend(move_items)
+    moved = defaultdict(int)
+    for (receiving_fein, releasing_fein), fein_items in by_feins.items():
+        for item in move_contracts(fein_items, receiving_fein, releasing_fein):
+            moved[(item["carrierId"], item["npn"], receiving_fein, releasing_fein)] += 1
 
+    return {move: moved[move] for move in moves}
 
+
+@measure_cold_start
+@traced
+@emit_metrics
+@validates_body("UpdateContractsFeinRequest")
 def lambda_handler(event, context):
-    body = json.loads(event.get("body") or "{}")
+    body = parse_body(event)
 
     carrier_id = body.get("carrierId")
     npn = body.get("npn")
@@ -63,31 +177,10 @@ def lambda_handler(event, context):
     ]
 
     if missing:
-        return {
-            "statusCode": 400,
-            "headers": {
-                "Content-Type": "application/json",
-                "Access-Control-Allow-Origin": "*",
-                "Access-Control-Allow-Headers": "Content-Type,Idempotency-Key",
-            },
-            "body": json.dumps(
-                {
-                    "error": {
-                        "code": "MISSING_FIELDS",
-                        "message": f"Missing required fields: {', '.join(missing)}",
-                    }
-                }
-            ),
-        }
+        return error_response(
+            400, "MISSING_FIELDS", f"Missing required fields: {', '.join(missing)}"
+        )
 
     updated_count = update_contracts_fein(carrier_id, npn, receiving_fein, releasing_fein)
 
-    return {
-        "statusCode": 200,
-        "headers": {
-            "Content-Type": "application/json",
-            "Access-Control-Allow-Origin": "*",
-            "Access-Control-Allow-Headers": "Content-Type,Idempotency-Key",
-        },
-        "body": json.dumps({"updatedCount": updated_count}),
-    }
+    return json_response(200, {"updatedCount": updated_count})
@@ -13,11 +13,18 @@ Routes:
   GET    /ats/status/{fein}           → GET  {base}/ats/status/{fein}
   GET    /ats/contracts/{fein}        → GET  {base}/ats/contracts/{fein}
   POST   /ats/contracts/update-fein  → POST {base}/ats/contracts/update-fein
+
+The two list routes (statuses and contracts for a FEIN) return whole IMO
+books, which can be far larger than the agent can take in one tool result.
+Their responses are shaped into pages: a summary of the full list, one page
+of records with only the fields the agent needs, and a nextPageToken the
+agent passes back as pageToken for more.
 """
 
 import json
 import logging
 import os
+import secrets
 import urllib.error
 import urllib.parse
 import urllib.request
@@ -27,6 +34,29 @@ logger.setLevel(logging.INFO)
 
 API_BASE_URL = os.environ["API_BASE_URL"].rstrip("/")
 
+# Bedrock rejects action group results above 25 KB; stay under it with room
+# for the response envelope
+RESPONSE_MAX_BYTES = int(os.environ.get("BEDROCK_RESPONSE_MAX_BYTES", 20000))
+DEFAULT_PAGE_SIZE = int(os.environ.get("BEDROCK_PAGE_SIZE", 20))
+MAX_PAGE_SIZE = 100
+
+# Trace context for the current invocation. This function is the edge of the
+# transfer flow, so it starts the W3C trace and correlation id that every ATS
+# Lambda it calls joins and logs.
+_trace = {"trace_id": None, "correlation_id": None}
+
+
+class _CorrelationIdFilter(logging.Filter):
+    """Prefix every log line of this module with the invocation's correlation id."""
+
+    def filter(self, record):
+        if _trace["correlation_id"]:
+            record.msg = f"correlationId={_trace['correlation_id']} {record.msg}"
+        return True
+
+
+logger.addFilter(_CorrelationIdFilter())
+
 
 # ---------------------------------------------------------------------------
 # Bedrock event helpers
@@ -115,11 +145,145 @@ def _build_response(event: dict, status_code: int, body) -> dict:
 def _error(event: dict, status_code: int, code: str, message: str) -> dict:
     return _build_response(event, status_code, {"error": {"code": code, "message": message}})
 
+# ---------------------------------------------------------------------------
+# Response shaping (large lists)
+# ---------------------------------------------------------------------------
+
+# Fields returned per record unless the agent asks for others with
+# fields=a,b,c (or fields=all). Requirements lists and internal keys are left
+# out: they make up most of the bytes and the agent rarely needs them.
+STATUS_FIELDS = (
+    "carrierId", "npn", "agentFirstName", "agentLastName", "releasingFein", "status", "updatedAt",
+)
+CONTRACT_FIELDS = (
+    "id", "carrierId", "npn", "agentFirstName", "agentLastName", "contractType", "contractValue", "issueDate",
+)
+
+
+def _amount(value) -> float:
+    """contractValue is loaded from CSV, so it is usually a string like '1250.00'."""
+    try:
+        return float(str(value).replace(",", "").replace("$", ""))
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _page_params(params: dict, default_fields: tuple):
+    """(offset, page size, fields or None for all) from pageToken/pageSize/fields; ValueError if invalid."""
+    token = params.get("pageToken") or "0"
+    if not token.isdigit():
+        raise ValueError("pageToken must be a value returned as nextPageToken")
+    size = params.get("pageSize") or str(DEFAULT_PAGE_SIZE)
+    if not size.isdigit() or not 1 <= int(size) <= MAX_PAGE_SIZE:
+        raise ValueError(f"pageSize must be between 1 and {MAX_PAGE_SIZE}")
+    fields = params.get("fields")
+    if not fields:
+        fields = default_fields
+    elif fields.strip().lower() == "all":
+        fields = None
+    else:
+        fields = tuple(f.strip() for f in fields.split(",") if f.strip())
+    return int(token), int(size), fields
+
+
+def _status_summary(records: list) -> dict:
+    by_status, by_carrier = {}, {}
+    for record in records:
+        status = record.get("status") or "UNKNOWN"
+        carrier = by_carrier.setdefault(record.get("carrierId") or "UNKNOWN", {"count": 0})
+        by_status[status] = by_status.get(status, 0) + 1
+        carrier["count"] += 1
+        carrier[status] = carrier.get(status, 0) + 1
+    return {"byStatus": by_status, "byCarrier": by_carrier}
+
+
+def _contract_summary(records: list) -> dict:
+    by_carrier, total = {}, 0.0
+    for record in records:
+        value = _amount(record.get("contractValue"))
+        carrier = by_carrier.setdefault(record.get("carrierId") or "UNKNOWN", {"count": 0, "totalValue": 0.0})
+        carrier["count"] += 1
+        carrier["totalValue"] += value
+        total += value
+    for carrier in by_carrier.values():
+        carrier["totalValue"] = round(carrier["totalValue"], 2)
+    return {"totalValue": round(total, 2), "byCarrier": by_carrier}
+
+
+def _shape_list(event: dict, params: dict, status_code: int, records, *, order, summarize, default_fields) -> dict:
+    """
+    One page of a list response: {total, summary, items, nextPageToken?}.
+
+    Records are put in a fixed order so pages stay stable between calls (the
+    list is fetched again for each page); the page holds the top pageSize
+    records from pageToken on, projected to `fields`. Records are dropped
+    from the end of the page until the JSON fits RESPONSE_MAX_BYTES, and
+    nextPageToken then starts at the first one dropped. A record that does
+    not fit even on its own is a 400 asking for fewer fields (an empty page
+    would hand back the same pageToken forever). Errors and non-list bodies
+    pass through unchanged.
+    """
+    if status_code != 200 or not isinstance(records, list):
+        return _build_response(event, status_code, records)
+    try:
+        offset, size, fields = _page_params(params, default_fields)
+    except ValueError as exc:
+        return _error(event, 400, "INVALID_PARAMETER", str(exc))
+
+    records = order(records)
+    page = records[offset:offset + size]
+    if fields is not None:
+        page = [{f: r[f] for f in fields if f in r} for r in page]
+    shaped = {"total": len(records), "summary": summarize(records), "items": page}
+
+    while True:
+        end = offset + len(shaped["items"])
+        if end < len(records):
+            shaped["nextPageToken"] = str(end)
+        else:
+            shaped.pop("nextPageToken", None)
+        size_bytes = len(json.dumps(shaped).encode())
+        if size_bytes <= RESPONSE_MAX_BYTES or not shaped["items"]:
+            break
+        if len(shaped["items"]) == 1:
+            return _error(
+                event, 400, "INVALID_PARAMETER",
+                f"the record at pageToken {offset} does not fit in one response; "
+                "ask for fewer fields (fields=a,b,c)",
+            )
+        # Drop roughly the share of records that is over budget, at least one
+        over = (size_bytes - RESPONSE_MAX_BYTES) / size_bytes
+        drop = max(1, int(len(shaped["items"]) * over))
+        shaped["items"] = shaped["items"][:-drop]
+
+    logger.info(
+        "Shaped %d of %d records from offset %d into %d bytes",
+        len(shaped["items"]), len(records), offset, size_bytes,
+    )
+    return _build_response(event, status_code, shaped)
+
 
 # ---------------------------------------------------------------------------
 # HTTP forwarding
 # ---------------------------------------------------------------------------
 
+def _start_trace(event: dict) -> None:
+    trace_id = secrets.token_hex(16)
+    _trace["trace_id"] = trace_id
+    _trace["correlation_id"] = trace_id
+    logger.info("Trace started sessionId=%s", event.get("sessionId"))
+
+
+def _trace_headers() -> dict:
+    """traceparent (one new client span per call) + X-Correlation-Id."""
+    if not _trace["trace_id"]:
+        return {}
+    return {
+        "traceparent": f"00-{_trace['trace_id']}-{secrets.token_hex(8)}-01",
+        "X-Correlation-Id": _trace["correlation_id"],
+    }
+
+
 def _call_api(method: str, path: str, query: dict = None, body: dict = None):
     """
     Call the carrier API and return (http_status_code, parsed_response_body).
@@ -131,7 +295,7 @@ def _call_api(method: str, path: str, query: dict = None, body: dict = None):
             url += "?" + qs
 
     data = json.dumps(body).encode() if body is not None else None
-    headers = {"Content-Type": "application/json", "Accept": "application/json"}
+    headers = {"Content-Type": "application/json", "Accept": "application/json", **_trace_headers()}
 
     req = urllib.request.Request(url, data=data, headers=headers, method=method)
     logger.info("Calling %s %s body=%s", method, url, json.dumps(body) if body else None)
@@ -179,6 +343,8 @@ def _create_transfer(event: dict, params: dict, body: dict) -> dict:
     }
     if body.get("notes"):
         payload["notes"] = body["notes"]
+    if body.get("selectedCarrierIds"):
+        payload["selectedCarrierIds"] = _parse(body["selectedCarrierIds"])
 
     status, resp = _call_api("POST", "/ats/v1/transfers", body=payload)
 
@@ -245,17 +411,31 @@ def _set_status(event: dict, params: dict, body: dict) -> dict:
 
 
 def _get_statuses(event: dict, params: dict, body: dict) -> dict:
-    """GET /ats/status/{fein} — list all status records for a receiving IMO FEIN."""
+    """GET /ats/status/{fein} — page through status records for a receiving IMO FEIN, latest first."""
     path = _resolve_path("/ats/v1/status/{fein}", params)
     status, resp = _call_api("GET", path)
-    return _build_response(event, status, resp)
+    return _shape_list(
+        event, params, status, resp,
+        order=lambda records: sorted(
+            sorted(records, key=lambda r: str(r.get("statusKey", ""))),
+            key=lambda r: str(r.get("updatedAt", "")),
+            reverse=True,
+        ),
+        summarize=_status_summary,
+        default_fields=STATUS_FIELDS,
+    )
 
 
 def _get_contracts(event: dict, params: dict, body: dict) -> dict:
-    """GET /ats/contracts/{fein} — list contracts for a FEIN."""
+    """GET /ats/contracts/{fein} — page through contracts for a FEIN, largest contract value first."""
     path = _resolve_path("/ats/v1/contracts/{fein}", params)
     status, resp = _call_api("GET", path)
-    return _build_response(event, status, resp)
+    return _shape_list(
+        event, params, status, resp,
+        order=lambda records: sorted(records, key=lambda r: (-_amount(r.get("contractValue")), str(r.get("id", "")))),
+        summarize=_contract_summary,
+        default_fields=CONTRACT_FIELDS,
+    )
 
 
 def _update_contract_fein(event: dict, params: dict, body: dict) -> dict:
@@ -315,5 +495,6 @@ def _dispatch(event: dict) -> dict:
 # ---------------------------------------------------------------------------
 
 def lambda_handler(event: dict, context) -> dict:
+    _start_trace(event)
     logger.info("Event: %s", json.dumps(event))
     return _dispatch(event)
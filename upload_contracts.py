@@ -1,26 +1,47 @@
 import csv
+import sys
 import uuid
+from collections import defaultdict
 
 import boto3
 
+sys.path.insert(0, "lambda")
+from change_feed import CONTRACTS_STREAM  # noqa: E402
+from contract_aggregates import record_contracts_added  # noqa: E402
+from contract_search import search_attributes  # noqa: E402
+from fein_versions import bump_version  # noqa: E402
+
 dynamodb = boto3.resource("dynamodb", region_name="us-east-1")
 table = dynamodb.Table("Contracts")
+aggregates_table = dynamodb.Table("ContractAggregates")
+versions_table = dynamodb.Table("FeinVersions")
+
+contracts_by_fein = defaultdict(list)
 
 with open("contracts.csv", newline="") as f:
     reader = csv.DictReader(f, skipinitialspace=True)
     with table.batch_writer() as batch:
         for row in reader:
-            batch.put_item(
-                Item={
-                    "id": str(uuid.uuid4()),
-                    "contractNumber": row["contractNumber"].strip(),
-                    "carrierId": row["carrierId"].strip(),
-                    "fein": row["fein"].strip(),
-                    "npn": row["npn"].strip(),
-                    "contractType": row["contractType"].strip(),
-                    "contractValue": row["contractValue"].strip(),
-                    "issueDate": row["issueDate"].strip(),
-                }
-            )
+            item = {
+                "id": str(uuid.uuid4()),
+                "contractNumber": row["contractNumber"].strip(),
+                "carrierId": row["carrierId"].strip(),
+                "fein": row["fein"].strip(),
+                "npn": row["npn"].strip(),
+                "contractType": row["contractType"].strip(),
+                "contractValue": row["contractValue"].strip(),
+                "issueDate": row["issueDate"].strip(),
+            }
+            # Sort key and numeric value for GET /ats/v1/contracts
+            item.update(search_attributes(item))
+            batch.put_item(Item=item)
+            contracts_by_fein[item["fein"]].append(item)
+
+# Roll the whole load into the aggregates with one ADD per fein x carrier/type
+record_contracts_added(aggregates_table, contracts_by_fein)
+
+# Invalidate cached contract reads (ETags) for every FEIN that gained contracts
+for fein in contracts_by_fein:
+    bump_version(versions_table, CONTRACTS_STREAM, fein)
 
 print("Done — 100 contracts uploaded.")